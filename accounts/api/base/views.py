@@ -1,8 +1,10 @@
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Coalesce, Greatest
 from rest_framework import generics, permissions
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.db.models import Count, Q
 from rooms.models import RoomMember
-from messages_app.models import Message
 from .serializers import RegisterSerializer, MeSerializer
 
 class RegisterView(generics.CreateAPIView):
@@ -17,33 +19,39 @@ class MeView(generics.RetrieveUpdateAPIView):
         return self.request.user
 
 class UnreadCountsView(generics.GenericAPIView):
-    """Get unread message counts for all rooms the user is a member of."""
+    """
+    Get unread message counts for all rooms the user is a member of.
+
+    Unread is ``room.last_seq - last_read_seq`` (sending a message advances
+    the sender's cursor), so all rooms are counted in a single query without
+    touching the messages table. Counts above ``?cap=`` (default
+    ``UNREAD_COUNT_CAP``, 0 disables) are reported as ``"<cap>+"``.
+    """
     permission_classes = [permissions.IsAuthenticated]
-    
+
+    def get_cap(self, request):
+        try:
+            cap = int(request.query_params.get("cap", settings.UNREAD_COUNT_CAP))
+        except ValueError:
+            raise ValidationError({"cap": "Must be an integer."})
+        return cap if cap > 0 else None
+
     def get(self, request):
-        # Get all rooms where user is a member
-        room_memberships = RoomMember.objects.filter(user=request.user).select_related('room')
-        
-        unread_counts = []
-        for membership in room_memberships:
-            # Count messages newer than last_read_msg_id
-            if membership.last_read_msg_id:
-                unread_count = Message.objects.filter(
-                    room=membership.room,
-                    id__gt=membership.last_read_msg_id,
-                    sender_id__ne=request.user.id  # Don't count own messages
-                ).count()
-            else:
-                # If never read, count all messages except own
-                unread_count = Message.objects.filter(
-                    room=membership.room,
-                    sender_id__ne=request.user.id
-                ).count()
-            
-            unread_counts.append({
-                'room_id': membership.room.id,
-                'room_name': membership.room.name,
-                'unread_count': unread_count
-            })
-        
+        cap = self.get_cap(request)
+        rows = (
+            RoomMember.objects.filter(user=request.user)
+            .annotate(unread_count=Greatest(F("room__last_seq") - Coalesce(F("last_read_seq"), 0), 0))
+            .values("room_id", "room__name", "room__last_seq", "unread_count")
+            .order_by("room_id")
+        )
+
+        unread_counts = [
+            {
+                'room_id': row['room_id'],
+                'room_name': row['room__name'],
+                'head_seq': row['room__last_seq'],
+                'unread_count': f"{cap}+" if cap is not None and row['unread_count'] > cap else row['unread_count'],
+            }
+            for row in rows
+        ]
         return Response({'unread_counts': unread_counts})
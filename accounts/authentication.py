@@ -0,0 +1,124 @@
+"""
+JWT authentication that resolves the user without touching the database.
+
+The token's ``user_id`` claim is looked up in a per-process LRU, then in the
+shared cache (``authuser:{id}``), and only then in the users table. The cached
+row holds every concrete field except the password hash, so the ``User``
+rebuilt from it behaves like a normal instance; reading ``password`` loads it
+lazily. ``accounts.signals`` drops the entry whenever a user is saved or
+deleted, which covers deactivation and password changes. Dropping it also
+bumps the user's generation key. A fill that read the row before such a
+commit therefore does not cache it (``config.generations``).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config import generations, metrics
+from config.lru import TTLCache
+
+User = get_user_model()
+
+FIELDS = tuple(f.attname for f in User._meta.concrete_fields if f.attname != "password")
+
+_local = TTLCache(maxsize=settings.AUTH_USER_LOCAL_MAXSIZE, ttl=settings.AUTH_USER_LOCAL_TTL)
+
+
+def _key(user_id):
+    return f"authuser:{user_id}"
+
+
+def _generation_key(user_id):
+    return f"authuser:gen:{user_id}"
+
+
+def _build(row):
+    return User.from_db(DEFAULT_DB_ALIAS, FIELDS, [row[name] for name in FIELDS])
+
+
+def peek_user(user_id):
+    """A user from this process's cache, or None; never does I/O."""
+    row = _local.get(_key(user_id))
+    return _build(row) if row is not None else None
+
+
+def get_user(user_id):
+    """The user with ``user_id`` (possibly stale by the cache TTL), or None."""
+    key = _key(user_id)
+    row = _local.get(key)
+    if row is not None:
+        metrics.incr("auth.user_cache.hits")
+        return _build(row)
+
+    row = cache.get(key)
+    if row is not None:
+        metrics.incr("auth.user_cache.hits")
+        _local.set(key, row)
+        return _build(row)
+
+    metrics.incr("auth.user_cache.misses")
+    generation_key = _generation_key(user_id)
+    generation = generations.current(generation_key)
+    row = User.objects.filter(pk=user_id).values(*FIELDS).first()
+    if row is None:
+        return None
+    if generations.set_if_current(key, row, settings.AUTH_USER_CACHE_TTL, generation_key, generation):
+        _local.set(key, row)
+    else:
+        metrics.incr("auth.user_cache.stale_fills")
+    return _build(row)
+
+
+def invalidate_user(user_id):
+    _drop(user_id)
+    transaction.on_commit(lambda: _drop(user_id))
+
+
+def _drop(user_id):
+    generations.bump([_generation_key(user_id)], timeout=settings.AUTH_USER_CACHE_TTL)
+    key = _key(user_id)
+    _local.delete(key)
+    cache.delete(key)
+
+
+def clear_local():
+    _local.clear()
+
+
+def authenticate_token(raw_token):
+    """Validate a raw access token and return its active user, or None."""
+    try:
+        token = AccessToken(raw_token)
+        user = get_user(token[api_settings.USER_ID_CLAIM])
+    except (InvalidToken, TokenError, KeyError):
+        return None
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` backed by the user cache instead of a query per request."""
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Revocation compares against the password hash, which is never cached
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
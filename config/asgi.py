@@ -13,13 +13,14 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from django.urls import path
 # temporary blank consumer; we’ll implement later
-from rooms.consumers import RoomConsumer  # create file now
+from rooms.consumers import MultiplexConsumer, RoomConsumer
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
 django_asgi_app = get_asgi_application()
 
 websocket_urlpatterns = [
+    path("ws/rooms/", MultiplexConsumer.as_asgi()),
     path("ws/rooms/<int:room_id>/", RoomConsumer.as_asgi()),
 ]
 
@@ -0,0 +1,135 @@
+"""
+Cached authorization lookups shared by REST permissions and WebSockets.
+
+Two facts are cached per user: their org roles ``{org_id: role}`` and the ids
+of the rooms they belong to. Lookups go through three tiers:
+
+1. a request-scoped memo (pass ``request``), so one request never asks twice;
+2. an in-process LRU with a short TTL (``AUTHZ_LOCAL_TTL``);
+3. the shared Django cache (``AUTHZ_CACHE_TTL``), filled from one query.
+
+Signals on OrganizationMember/RoomMember drop the shared entry and this
+process's LRU immediately and again after commit. Other processes converge within the local TTL.
+Bulk writes that skip signals must call ``invalidate_users``. Each user has a
+generation key that invalidation bumps. A fill that read the database before
+a revoking commit therefore cannot put the old value back
+(``config.generations``).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from config import generations, metrics
+from config.lru import TTLCache
+
+ROLES = "roles"
+ROOMS = "rooms"
+
+_local = TTLCache(maxsize=settings.AUTHZ_LOCAL_MAXSIZE, ttl=settings.AUTHZ_LOCAL_TTL)
+
+
+def _key(kind, user_id):
+    return f"authz:{kind}:{user_id}"
+
+
+def _generation_key(user_id):
+    return f"authz:gen:{user_id}"
+
+
+def _memo(request):
+    if request is None:
+        return None
+    request = getattr(request, "_request", request)
+    memo = getattr(request, "_authz_memo", None)
+    if memo is None:
+        memo = request._authz_memo = {}
+    return memo
+
+
+def _load(kind, user_id):
+    if kind == ROLES:
+        from orgs.models import OrganizationMember
+
+        return dict(OrganizationMember.objects.filter(user_id=user_id).values_list("org_id", "role"))
+    from rooms.models import RoomMember
+
+    return frozenset(RoomMember.objects.filter(user_id=user_id).values_list("room_id", flat=True))
+
+
+def _lookup(kind, user_id, request=None):
+    key = _key(kind, user_id)
+    memo = _memo(request)
+    if memo is not None and key in memo:
+        metrics.incr("authz.hits")
+        metrics.incr("authz.memo_hits")
+        return memo[key]
+
+    value = _local.get(key)
+    fresh = True
+    if value is not None:
+        metrics.incr("authz.hits")
+        metrics.incr("authz.local_hits")
+    else:
+        value = cache.get(key)
+        if value is not None:
+            metrics.incr("authz.hits")
+            metrics.incr("authz.redis_hits")
+        else:
+            metrics.incr("authz.misses")
+            generation_key = _generation_key(user_id)
+            generation = generations.current(generation_key)
+            value = _load(kind, user_id)
+            fresh = generations.set_if_current(key, value, settings.AUTHZ_CACHE_TTL, generation_key, generation)
+            if not fresh:
+                metrics.incr("authz.stale_fills")
+        if fresh:
+            _local.set(key, value)
+
+    if memo is not None:
+        memo[key] = value
+    return value
+
+
+def get_org_roles(user_id, request=None):
+    return _lookup(ROLES, user_id, request)
+
+
+def get_org_role(user_id, org_id, request=None):
+    return get_org_roles(user_id, request).get(int(org_id))
+
+
+def get_room_ids(user_id, request=None):
+    return _lookup(ROOMS, user_id, request)
+
+
+def is_room_member(user_id, room_id, request=None):
+    return int(room_id) in get_room_ids(user_id, request)
+
+
+def peek_room_ids(user_id):
+    """This process's cached room ids, or None; never does I/O."""
+    return _local.get(_key(ROOMS, user_id))
+
+
+def invalidate_on_commit(user_ids, kinds=(ROLES, ROOMS)):
+    """
+    Invalidate now and again after commit, so a reader racing the
+    transaction cannot re-cache the old state for the full TTL.
+    """
+    user_ids = list(user_ids)
+    invalidate_users(user_ids, kinds)
+    transaction.on_commit(lambda: invalidate_users(user_ids, kinds))
+
+
+def clear_local():
+    _local.clear()
+
+
+def invalidate_users(user_ids, kinds=(ROLES, ROOMS)):
+    user_ids = set(user_ids)
+    generations.bump([_generation_key(user_id) for user_id in user_ids], timeout=settings.AUTHZ_CACHE_TTL)
+    keys = [_key(kind, user_id) for user_id in user_ids for kind in kinds]
+    for key in keys:
+        _local.delete(key)
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,76 @@
+import atexit
+import logging
+import threading
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class BatchBuffer:
+    """
+    Thread-safe, per-process buffer that hands collected items to ``flush_fn``
+    in batches: as soon as ``max_size`` items are pending, or ``window``
+    seconds after the first item of a batch arrived, whichever comes first.
+
+    A ``window`` of 0 flushes synchronously on every ``add`` (handy in tests
+    and management commands).
+
+    Window flushes run on a short-lived timer thread. Any database
+    connection ``flush_fn`` opens there is closed when the flush ends, so
+    that connections do not pile up one per timer.
+    """
+
+    def __init__(self, flush_fn, window, max_size=500, name="batch-buffer"):
+        self.flush_fn = flush_fn
+        self.window = window
+        self.max_size = max_size
+        self.name = name
+        self._items = []
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def add(self, item):
+        batch = None
+        with self._lock:
+            self._items.append(item)
+            if self.window <= 0 or len(self._items) >= self.max_size:
+                batch = self._take()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.name = self.name
+                self._timer.start()
+        if batch:
+            self._run(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._run(batch)
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        finally:
+            # Connections are per thread; this one's die with the timer
+            connections.close_all()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def _take(self):
+        items, self._items = self._items, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return items
+
+    def _run(self, batch):
+        try:
+            self.flush_fn(batch)
+        except Exception:
+            logger.exception("%s: failed to flush batch of %s item(s)", self.name, len(batch))
@@ -0,0 +1,91 @@
+"""
+WebSocket frame encodings.
+
+Sockets speak JSON text frames by default, or msgpack binary frames when the
+client asks for the ``msgpack`` subprotocol. Fan-out payloads are encoded to
+JSON once by the sender (``encode_frames``) and consumers forward the
+pre-encoded frames untouched, so the cost no longer scales with subscribers.
+
+msgpack is opt-in. Sockets count themselves in a shared per-room counter for
+their format (``add_subscribers``), and the sender also encodes msgpack only
+for rooms whose counter is above zero (``room_formats``). A socket that
+joined after the sender read the counters gets its frames transcoded from
+the JSON ones (``frames_in``); that only happens in that short window.
+"""
+import msgpack
+import orjson
+from django.core.cache import cache
+
+from config import metrics
+
+JSON = "json"
+MSGPACK = "msgpack"
+FORMATS = (JSON, MSGPACK)
+
+
+def dumps(obj):
+    return orjson.dumps(obj).decode()
+
+
+def loads(data):
+    return orjson.loads(data)
+
+
+def packb(obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpackb(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+def encode(obj, fmt):
+    return packb(obj) if fmt == MSGPACK else dumps(obj)
+
+
+def encode_frames(payloads, formats=(JSON,)):
+    """``{format: [frame, ...]}`` for each of ``formats``."""
+    return {fmt: [encode(payload, fmt) for payload in payloads] for fmt in formats}
+
+
+def _subscribers_key(fmt, room_id):
+    return f"wsformat:{fmt}:{room_id}"
+
+
+def add_subscribers(fmt, room_ids, delta=1):
+    """Count sockets of ``fmt`` in ``room_ids`` (JSON is always encoded, so not counted)."""
+    if fmt == JSON:
+        return
+    for room_id in room_ids:
+        key = _subscribers_key(fmt, room_id)
+        # No expiry: a count left behind by a dead process only costs extra encoding
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+def remove_subscribers(fmt, room_ids):
+    add_subscribers(fmt, room_ids, delta=-1)
+
+
+def room_formats(room_ids):
+    """``{room_id: formats}`` to encode fan-out in, from one cache read."""
+    room_ids = list(room_ids)
+    keys = {_subscribers_key(MSGPACK, room_id): room_id for room_id in room_ids}
+    counts = cache.get_many(keys)
+    msgpack_rooms = {keys[key] for key, count in counts.items() if count > 0}
+    return {room_id: FORMATS if room_id in msgpack_rooms else (JSON,) for room_id in room_ids}
+
+
+def frames_in(frames, fmt):
+    """
+    The ``fmt`` frames of an ``encode_frames`` result. Missing ones (a socket
+    that joined after the sender checked ``room_formats``) are transcoded
+    from the JSON frames and kept in ``frames``.
+    """
+    if fmt not in frames:
+        metrics.incr("ws.frames.transcoded")
+        frames[fmt] = [encode(loads(frame), fmt) for frame in frames[JSON]]
+    return frames[fmt]
@@ -0,0 +1,38 @@
+"""
+Generation counters that keep cache fills from re-caching stale reads.
+
+A fill reads from the database outside the writer's transaction, so it can
+read the old state, lose the race with the writer's commit and invalidation,
+and then cache what it read for the full TTL. To prevent that, a fill reads
+the entry's generation before querying (``current``), and writers bump it
+before dropping the entry (``bump``). ``set_if_current`` only caches the
+result if the generation is unchanged. It checks again after the write, so a
+bump that lands between the check and the write still removes the entry.
+"""
+from django.core.cache import cache
+
+
+def current(key):
+    return cache.get(key)
+
+
+def bump(keys, timeout):
+    """Advance each generation key; missing keys start over (never matching an old read)."""
+    for key in keys:
+        cache.add(key, 0, timeout=timeout)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Expired between add and incr; a missing key matches no snapshot either
+            pass
+
+
+def set_if_current(key, value, timeout, generation_key, generation):
+    """Cache ``value`` unless ``generation_key`` moved past ``generation``; True if it was kept."""
+    if cache.get(generation_key) != generation:
+        return False
+    cache.set(key, value, timeout=timeout)
+    if cache.get(generation_key) != generation:
+        cache.delete(key)
+        return False
+    return True
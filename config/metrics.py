@@ -0,0 +1,54 @@
+"""
+Process-local counters and gauges for hot paths (caches, pipelines, socket
+queues). Each worker reports its own numbers; scrape every process.
+"""
+import threading
+from collections import defaultdict
+
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def get(name):
+    with _lock:
+        return _counters.get(name, _gauges.get(name, 0))
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    ratios = {}
+    for name, hits in counters.items():
+        if name.endswith(".hits"):
+            prefix = name[: -len(".hits")]
+            total = hits + counters.get(f"{prefix}.misses", 0)
+            ratios[f"{prefix}.hit_ratio"] = round(hits / total, 4) if total else None
+    return {"counters": counters, "gauges": gauges, "ratios": ratios}
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def metrics_view(request):
+    return Response(snapshot())
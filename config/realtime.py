@@ -0,0 +1,46 @@
+import logging
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer, InvalidChannelLayerError
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process in events that are aggregated per node
+NODE_ID = uuid.uuid4().hex[:12]
+
+
+def get_layer():
+    try:
+        layer = get_channel_layer()
+    except InvalidChannelLayerError:
+        logger.warning("Channel layer invalid; skipping broadcast")
+        return None
+    except Exception:
+        logger.exception("Unexpected error retrieving channel layer; skipping broadcast")
+        return None
+    if not layer:
+        logger.warning("Channel layer unavailable; skipping broadcast")
+    return layer
+
+
+def broadcast(events):
+    """
+    Send ``(group, event)`` pairs to the channel layer from sync code,
+    in one event-loop hop. Failures are logged per group, never raised.
+    """
+    events = list(events)
+    if not events:
+        return
+    layer = get_layer()
+    if not layer:
+        return
+
+    async def send_all():
+        for group, event in events:
+            try:
+                await layer.group_send(group, event)
+            except Exception:
+                logger.exception("Failed to broadcast %s to %s", event.get("type"), group)
+
+    async_to_sync(send_all)()
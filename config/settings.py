@@ -79,7 +79,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # ---- DRF / JWT / Schema ----
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication"
+        "accounts.authentication.CachedJWTAuthentication"
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
@@ -93,6 +93,9 @@ REST_FRAMEWORK = {
     "VERSION_PARAM": "version",
 }
 
+# Unread counts above this are reported as "99+" (0 = exact counts)
+UNREAD_COUNT_CAP = int(os.getenv("UNREAD_COUNT_CAP", "99"))
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "ChatBoard API",
     "VERSION": "v1",
@@ -153,6 +156,11 @@ SIMPLE_JWT = {
 REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
 CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
 
+# Hot cache of the newest serialized messages per room (serves the first history page)
+MESSAGE_CACHE_ALIAS = os.getenv("MESSAGE_CACHE_ALIAS", "default")
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "100"))
+MESSAGE_CACHE_TTL = int(os.getenv("MESSAGE_CACHE_TTL", "3600"))
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -163,6 +171,112 @@ CHANNEL_LAYERS = {
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://127.0.0.1:6379/1")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://127.0.0.1:6379/2")
 
+# ---- Message side-effect pipeline ----
+# New messages are buffered per process for this long before their fan-out and
+# notifications are shipped to Celery as one batch (0 = ship immediately).
+MESSAGE_PIPELINE_BATCH_WINDOW_MS = int(os.getenv("MESSAGE_PIPELINE_BATCH_WINDOW_MS", "50"))
+MESSAGE_PIPELINE_MAX_BATCH = int(os.getenv("MESSAGE_PIPELINE_MAX_BATCH", "200"))
+MESSAGE_PIPELINE_NOTIFICATION_CHUNK = int(os.getenv("MESSAGE_PIPELINE_NOTIFICATION_CHUNK", "1000"))
+# WebSocket `message.send` frames from all connections are written together
+# after waiting this long (or once MAX_BATCH are pending).
+MESSAGE_WS_WRITE_WINDOW_MS = int(os.getenv("MESSAGE_WS_WRITE_WINDOW_MS", "5"))
+MESSAGE_WS_WRITE_MAX_BATCH = int(os.getenv("MESSAGE_WS_WRITE_MAX_BATCH", "500"))
+
+# ---- Webhook delivery ----
+# Celery beat drains the outbox every WEBHOOK_DISPATCH_INTERVAL seconds; claimed
+# rows are leased for WEBHOOK_LEASE_SECONDS so a crashed worker's rows come back
+WEBHOOK_DISPATCH_INTERVAL = float(os.getenv("WEBHOOK_DISPATCH_INTERVAL", "5"))
+WEBHOOK_DISPATCH_MAX_SECONDS = float(os.getenv("WEBHOOK_DISPATCH_MAX_SECONDS", "60"))
+WEBHOOK_DISPATCH_BATCH_SIZE = int(os.getenv("WEBHOOK_DISPATCH_BATCH_SIZE", "200"))
+# Only one dispatcher runs at a time (beat fires more often than a run lasts);
+# the lock must outlast MAX_SECONDS plus the rounds still in flight at the deadline
+WEBHOOK_DISPATCH_LOCK_TTL = int(os.getenv("WEBHOOK_DISPATCH_LOCK_TTL", "120"))
+# Each due endpoint gets its own delivery worker; newly due endpoints are
+# picked up at least this often (seconds) while others are still sending
+WEBHOOK_DISPATCH_POLL_INTERVAL = float(os.getenv("WEBHOOK_DISPATCH_POLL_INTERVAL", "0.5"))
+WEBHOOK_LEASE_SECONDS = int(os.getenv("WEBHOOK_LEASE_SECONDS", "120"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))
+WEBHOOK_PER_HOST_CONCURRENCY = int(os.getenv("WEBHOOK_PER_HOST_CONCURRENCY", "10"))
+# Per-endpoint health: the breaker opens after THRESHOLD consecutive failures
+# for COOLDOWN seconds (doubling per failed probe, capped); concurrency is AIMD up to MAX
+WEBHOOK_BREAKER_THRESHOLD = int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", "5"))
+WEBHOOK_BREAKER_COOLDOWN = int(os.getenv("WEBHOOK_BREAKER_COOLDOWN", "30"))
+WEBHOOK_BREAKER_MAX_COOLDOWN = int(os.getenv("WEBHOOK_BREAKER_MAX_COOLDOWN", "3600"))
+WEBHOOK_AIMD_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_AIMD_MAX_CONCURRENCY", "50"))
+# Per-org (event type -> subscribed webhooks) index used when emitting events
+WEBHOOK_INDEX_CACHE_TTL = int(os.getenv("WEBHOOK_INDEX_CACHE_TTL", "300"))
+WEBHOOK_INDEX_LOCAL_TTL = float(os.getenv("WEBHOOK_INDEX_LOCAL_TTL", "5"))
+WEBHOOK_INDEX_LOCAL_MAXSIZE = int(os.getenv("WEBHOOK_INDEX_LOCAL_MAXSIZE", "10000"))
+WEBHOOK_OUTBOX_CHUNK_SIZE = int(os.getenv("WEBHOOK_OUTBOX_CHUNK_SIZE", "1000"))
+# Terminal outbox rows are purged after these many days (hourly, in batches);
+# delivery statistics live on in hourly rollups for WEBHOOK_STATS_RETENTION_DAYS
+WEBHOOK_OUTBOX_SENT_RETENTION_DAYS = int(os.getenv("WEBHOOK_OUTBOX_SENT_RETENTION_DAYS", "7"))
+WEBHOOK_OUTBOX_FAILED_RETENTION_DAYS = int(os.getenv("WEBHOOK_OUTBOX_FAILED_RETENTION_DAYS", "30"))
+WEBHOOK_OUTBOX_PURGE_BATCH_SIZE = int(os.getenv("WEBHOOK_OUTBOX_PURGE_BATCH_SIZE", "5000"))
+WEBHOOK_OUTBOX_PURGE_INTERVAL = int(os.getenv("WEBHOOK_OUTBOX_PURGE_INTERVAL", "3600"))
+WEBHOOK_STATS_RETENTION_DAYS = int(os.getenv("WEBHOOK_STATS_RETENTION_DAYS", "90"))
+CELERY_BEAT_SCHEDULE = {
+    "deliver-webhooks": {
+        "task": "webhooks.tasks.deliver_webhooks",
+        "schedule": WEBHOOK_DISPATCH_INTERVAL,
+    },
+    "purge-webhook-outbox": {
+        "task": "webhooks.tasks.purge_webhook_outbox",
+        "schedule": WEBHOOK_OUTBOX_PURGE_INTERVAL,
+    },
+}
+
+# ---- Room membership engine ----
+ROOM_MEMBERSHIP_CHUNK_SIZE = int(os.getenv("ROOM_MEMBERSHIP_CHUNK_SIZE", "1000"))
+# Auto-joins for orgs larger than this run in a Celery task after the room commits
+ROOM_MEMBERSHIP_ASYNC_THRESHOLD = int(os.getenv("ROOM_MEMBERSHIP_ASYNC_THRESHOLD", "5000"))
+# Every org's MANAGER_ONLY rooms are re-derived from roles this often, fixing drift
+ROOM_MEMBERSHIP_RECONCILE_INTERVAL = int(os.getenv("ROOM_MEMBERSHIP_RECONCILE_INTERVAL", "3600"))
+CELERY_BEAT_SCHEDULE["reconcile-room-memberships"] = {
+    "task": "rooms.tasks.reconcile_room_memberships",
+    "schedule": ROOM_MEMBERSHIP_RECONCILE_INTERVAL,
+}
+
+# ---- Authorization cache (org roles / room membership) ----
+AUTHZ_CACHE_TTL = int(os.getenv("AUTHZ_CACHE_TTL", "300"))
+AUTHZ_LOCAL_TTL = float(os.getenv("AUTHZ_LOCAL_TTL", "5"))
+AUTHZ_LOCAL_MAXSIZE = int(os.getenv("AUTHZ_LOCAL_MAXSIZE", "10000"))
+
+# ---- Authenticated-user cache (JWT auth without a users-table query) ----
+AUTH_USER_CACHE_TTL = int(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+AUTH_USER_LOCAL_TTL = float(os.getenv("AUTH_USER_LOCAL_TTL", "5"))
+AUTH_USER_LOCAL_MAXSIZE = int(os.getenv("AUTH_USER_LOCAL_MAXSIZE", "10000"))
+
+# ---- WebSockets ----
+# Rooms one multiplexed socket may subscribe to
+WS_MULTIPLEX_MAX_ROOMS = int(os.getenv("WS_MULTIPLEX_MAX_ROOMS", "500"))
+# Typing indicators: at most one snapshot per room per interval; typers expire
+# after TTL without a refresh
+TYPING_SNAPSHOT_INTERVAL_MS = int(os.getenv("TYPING_SNAPSHOT_INTERVAL_MS", "500"))
+TYPING_TTL_MS = int(os.getenv("TYPING_TTL_MS", "5000"))
+# Presence: "redis" (shared by all nodes) or "local" (single process). Users
+# drop offline PRESENCE_TTL seconds after their last heartbeat (ping)
+PRESENCE_BACKEND = os.getenv("PRESENCE_BACKEND", "redis")
+PRESENCE_REDIS_URL = os.getenv("PRESENCE_REDIS_URL", REDIS_URL)
+PRESENCE_TTL = float(os.getenv("PRESENCE_TTL", "60"))
+PRESENCE_SWEEP_INTERVAL = float(os.getenv("PRESENCE_SWEEP_INTERVAL", "15"))
+# Per-socket outbound queue: frames of DROP kinds are shed first when it is
+# full, COLLAPSE kinds replace their queued predecessor; once nothing can be
+# shed the socket is closed with 4008
+WS_OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_OUTBOUND_QUEUE_SIZE", "256"))
+WS_OUTBOUND_DROP_KINDS = [k for k in os.getenv("WS_OUTBOUND_DROP_KINDS", "typing").split(",") if k]
+WS_OUTBOUND_COLLAPSE_KINDS = [k for k in os.getenv("WS_OUTBOUND_COLLAPSE_KINDS", "typing").split(",") if k]
+# Rooms with at least this many members are fanned out over Redis pub/sub
+# (one PUBLISH, one subscription per ASGI node) instead of group_send;
+# 0 disables
+ROOM_PUBSUB_THRESHOLD = int(os.getenv("ROOM_PUBSUB_THRESHOLD", "1000"))
+ROOM_PUBSUB_REDIS_URL = os.getenv("ROOM_PUBSUB_REDIS_URL", REDIS_URL)
+# Read cursors reported over HTTP or WebSocket are applied in one UPDATE per
+# interval (and broadcast as read receipts at the same rate)
+READ_CURSOR_FLUSH_INTERVAL_MS = int(os.getenv("READ_CURSOR_FLUSH_INTERVAL_MS", "1000"))
+READ_CURSOR_MAX_BATCH = int(os.getenv("READ_CURSOR_MAX_BATCH", "5000"))
+
 AUTH_USER_MODEL = "accounts.User"
 
 # ---- File Storage Configuration ----
@@ -188,4 +302,20 @@ else:
     MEDIA_URL = "/media/"
     MEDIA_ROOT = BASE_DIR / "media"
     # Ensure media directory exists
-    os.makedirs(MEDIA_ROOT, exist_ok=True)
\ No newline at end of file
+    os.makedirs(MEDIA_ROOT, exist_ok=True)
+
+# ---- Resumable uploads ----
+# Chunks are streamed to default_storage in STREAM_BLOCK_SIZE reads, so worker
+# memory does not grow with the chunk or file size; unfinished sessions (and
+# their parts) expire after SESSION_TTL seconds. A completion claim that is
+# older than COMPLETE_LEASE seconds is treated as abandoned and can be retaken
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(5 * 1024 * 1024)))
+UPLOAD_CHUNK_MAX_SIZE = int(os.getenv("UPLOAD_CHUNK_MAX_SIZE", str(16 * 1024 * 1024)))
+UPLOAD_STREAM_BLOCK_SIZE = int(os.getenv("UPLOAD_STREAM_BLOCK_SIZE", str(64 * 1024)))
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", "86400"))
+UPLOAD_COMPLETE_LEASE = int(os.getenv("UPLOAD_COMPLETE_LEASE", "900"))
+UPLOAD_SESSION_PURGE_INTERVAL = int(os.getenv("UPLOAD_SESSION_PURGE_INTERVAL", "3600"))
+CELERY_BEAT_SCHEDULE["purge-upload-sessions"] = {
+    "task": "uploads.tasks.purge_upload_sessions",
+    "schedule": UPLOAD_SESSION_PURGE_INTERVAL,
+}
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from . import cache as message_cache
 from .models import Message
 
 @admin.register(Message)
@@ -26,10 +27,16 @@ class MessageAdmin(admin.ModelAdmin):
 
     @admin.action(description="Soft-delete selected messages")
     def soft_delete(self, request, queryset):
+        room_ids = set(queryset.values_list("room_id", flat=True))
         updated = queryset.update(is_deleted=True)
+        for room_id in room_ids:
+            message_cache.invalidate(room_id)
         self.message_user(request, f"Marked {updated} message(s) as deleted.")
 
     @admin.action(description="Restore selected messages")
     def restore(self, request, queryset):
+        room_ids = set(queryset.values_list("room_id", flat=True))
         updated = queryset.update(is_deleted=False)
+        for room_id in room_ids:
+            message_cache.invalidate(room_id)
         self.message_user(request, f"Restored {updated} message(s).")
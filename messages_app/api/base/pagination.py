@@ -0,0 +1,144 @@
+import base64
+import binascii
+from collections import OrderedDict
+
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class MessageCursorPagination(pagination.BasePagination):
+    """
+    Keyset pagination over the ``msg_room_id_desc`` index.
+
+    Pages are addressed by an opaque ``?cursor=`` (taken from the ``next`` /
+    ``previous`` links) or, as entry points, by ``?before=<id>``,
+    ``?after=<id>`` and ``?around=<id>``. There is no total count, so every
+    page is a single bounded index range scan regardless of depth.
+    Results are always returned newest first.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    directions = ("before", "after", "around")
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        direction, anchor = self.decode_cursor(request)
+
+        has_older = has_newer = False
+        if direction == "after":
+            rows = list(queryset.filter(id__gt=anchor).order_by("id")[:self.limit + 1])
+            has_newer = len(rows) > self.limit
+            rows = rows[:self.limit][::-1]
+            has_older = True
+        elif direction == "around":
+            newer_size = self.limit // 2
+            older_size = self.limit - newer_size
+            older = list(queryset.filter(id__lte=anchor).order_by("-id")[:older_size + 1])
+            newer = list(queryset.filter(id__gt=anchor).order_by("id")[:newer_size + 1])
+            has_older = len(older) > older_size
+            has_newer = len(newer) > newer_size
+            rows = newer[:newer_size][::-1] + older[:older_size]
+        else:
+            qs = queryset.order_by("-id")
+            if anchor is not None:
+                qs = qs.filter(id__lt=anchor)
+                has_newer = True
+            rows = list(qs[:self.limit + 1])
+            has_older = len(rows) > self.limit
+            rows = rows[:self.limit]
+
+        self.next_anchor = rows[-1].id if rows and has_older else None
+        self.previous_anchor = rows[0].id if rows and has_newer else None
+        return rows
+
+    def is_newest_page(self, request):
+        params = request.query_params
+        return not any(params.get(name) for name in (self.cursor_query_param, *self.directions))
+
+    def paginate_entries(self, entries, request):
+        """
+        Paginate already serialized payloads, newest first, for the newest
+        page. ``entries`` must hold at least ``limit + 1`` items unless it is
+        the room's whole history.
+        """
+        self.request = request
+        self.limit = self.get_limit(request)
+        rows = entries[:self.limit]
+        self.next_anchor = rows[-1]["id"] if len(entries) > self.limit else None
+        self.previous_anchor = None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if limit <= 0:
+            return self.page_size
+        return min(limit, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            try:
+                padded = encoded + "=" * (-len(encoded) % 4)
+                direction, _, anchor = base64.urlsafe_b64decode(padded).decode("ascii").partition(":")
+                if direction not in self.directions:
+                    raise ValueError(direction)
+                return direction, int(anchor)
+            except (binascii.Error, UnicodeDecodeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        for direction in self.directions:
+            value = request.query_params.get(direction)
+            if value:
+                try:
+                    return direction, int(value)
+                except ValueError:
+                    raise NotFound(self.invalid_cursor_message)
+        return None, None
+
+    def encode_cursor(self, direction, anchor):
+        return base64.urlsafe_b64encode(f"{direction}:{anchor}".encode("ascii")).decode("ascii").rstrip("=")
+
+    def _link(self, direction, anchor):
+        url = self.request.build_absolute_uri()
+        for param in self.directions:
+            url = remove_query_param(url, param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(direction, anchor))
+
+    def get_next_link(self):
+        """Older messages."""
+        if self.next_anchor is None:
+            return None
+        return self._link("before", self.next_anchor)
+
+    def get_previous_link(self):
+        """Newer messages."""
+        if self.previous_anchor is None:
+            return None
+        return self._link("after", self.previous_anchor)
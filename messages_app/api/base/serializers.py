@@ -5,8 +5,8 @@ class MessageSerializer(serializers.ModelSerializer):
     room = serializers.PrimaryKeyRelatedField(read_only=True)
     class Meta:
         model = Message
-        fields = ["id", "org", "room", "sender", "body", "file_url", "is_deleted", "created_at"]
-        read_only_fields = ["org", "room", "sender", "is_deleted", "created_at"]
+        fields = ["id", "org", "room", "seq", "sender", "body", "file_url", "is_deleted", "created_at"]
+        read_only_fields = ["org", "room", "seq", "sender", "is_deleted", "created_at"]
         extra_kwargs = {"room": {"read_only": True}}
 
     def validate(self, attrs):
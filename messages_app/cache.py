@@ -0,0 +1,166 @@
+"""
+Per-room hot cache of the newest serialized messages.
+
+Each room keeps one entry in the ``MESSAGE_CACHE_ALIAS`` cache: a ring buffer
+of at most ``MESSAGE_CACHE_SIZE`` ``MessageSerializer`` payloads, newest
+first, plus a ``complete`` flag when the buffer holds the room's entire
+history. Entries are filled on a miss, written through when a message is
+committed and dropped when a message is changed or deleted.
+
+Every mutation happens under a short per-room lock. A writer that cannot get
+the lock marks the room dirty and drops the entry; the lock holder re-checks
+the dirty mark after writing, so a concurrent change can never leave a stale
+buffer behind.
+
+A fill reads the database before it takes the lock, so a message committed
+in between would be missing from the rows it writes. Every push therefore
+bumps the room's generation, warm entry or not, and a fill only writes its
+rows if the generation is still the one it saw before reading.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from config import metrics
+from messages_app.api.base.serializers import MessageSerializer
+from messages_app.models import Message
+
+LOCK_TIMEOUT = 5
+DIRTY_TIMEOUT = 2
+
+
+def _cache():
+    return caches[settings.MESSAGE_CACHE_ALIAS]
+
+
+def _key(room_id):
+    return f"msgcache:{room_id}"
+
+
+def _lock_key(room_id):
+    return f"msgcache:{room_id}:lock"
+
+
+def _dirty_key(room_id):
+    return f"msgcache:{room_id}:dirty"
+
+
+def _generation_key(room_id):
+    return f"msgcache:{room_id}:gen"
+
+
+def _generation(room_id):
+    return _cache().get(_generation_key(room_id))
+
+
+def _bump_generation(room_id):
+    cache = _cache()
+    key = _generation_key(room_id)
+    cache.add(key, 0, timeout=settings.MESSAGE_CACHE_TTL)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Expired between add and incr; a missing key never matches a fill's snapshot
+        pass
+
+
+def first_page(room_id, limit):
+    """
+    Return up to ``limit + 1`` newest payloads, or None on a miss. Fewer than
+    ``limit + 1`` entries are only returned when they are the whole history.
+    """
+    if limit + 1 > settings.MESSAGE_CACHE_SIZE:
+        return None
+    entry = _cache().get(_key(room_id))
+    if entry is None or (len(entry["items"]) <= limit and not entry["complete"]):
+        metrics.incr("messages.cache.misses")
+        return None
+    metrics.incr("messages.cache.hits")
+    return entry["items"][:limit + 1]
+
+
+def fill(room_id):
+    """Load the newest messages of a room from the database and cache them."""
+    size = settings.MESSAGE_CACHE_SIZE
+    generation = _generation(room_id)
+    rows = Message.objects.filter(room_id=room_id).select_related("sender").order_by("-id")[:size]
+    items = MessageSerializer(rows, many=True).data
+    entry = {"items": list(items), "complete": len(items) < size}
+
+    def replace(current):
+        if _generation(room_id) != generation:
+            # A message was pushed since the rows were read; leave it to the next miss
+            metrics.incr("messages.cache.stale_fills")
+            return None
+        return entry
+
+    _write(room_id, replace)
+    return entry["items"]
+
+
+def push(room_id, messages):
+    """Write freshly committed messages through to a warm cache entry."""
+    payloads = [dict(item) for item in MessageSerializer(messages, many=True).data]
+    _bump_generation(room_id)
+
+    def prepend(current):
+        if current is None:
+            # Cold room: the next read fills it from the database.
+            return None
+        items = {item["id"]: item for item in current["items"]}
+        tail_id = min(items) if items else 0
+        for payload in payloads:
+            # Below the tail of a partial buffer there may be uncached rows in between
+            if current["complete"] or payload["id"] > tail_id:
+                items[payload["id"]] = payload
+        items = [items[msg_id] for msg_id in sorted(items, reverse=True)]
+        evicted = max(0, len(items) - settings.MESSAGE_CACHE_SIZE)
+        if evicted:
+            metrics.incr("messages.cache.evictions", evicted)
+        return {"items": items[:settings.MESSAGE_CACHE_SIZE], "complete": current["complete"] and not evicted}
+
+    _write(room_id, prepend)
+
+
+def since(room_id, after_id=None, after_seq=None):
+    """
+    Payloads newer than ``after_id`` (or ``after_seq``), oldest first, for a
+    reconnecting socket. Returns None when the buffer does not reach back to
+    the cursor, i.e. the client missed more than the buffer holds.
+    """
+    entry = _cache().get(_key(room_id))
+    if entry is None:
+        metrics.incr("messages.cache.misses")
+        items = fill(room_id)
+        complete = len(items) < settings.MESSAGE_CACHE_SIZE
+    else:
+        metrics.incr("messages.cache.hits")
+        items, complete = entry["items"], entry["complete"]
+
+    field, cursor = ("seq", after_seq) if after_seq is not None else ("id", after_id)
+    newer = [item for item in items if (item[field] or 0) > cursor]
+    if len(newer) == len(items) and not complete:
+        return None
+    return newer[::-1]
+
+
+def invalidate(room_id):
+    cache = _cache()
+    cache.set(_dirty_key(room_id), 1, timeout=DIRTY_TIMEOUT)
+    cache.delete(_key(room_id))
+    metrics.incr("messages.cache.invalidations")
+
+
+def _write(room_id, update):
+    cache = _cache()
+    if not cache.add(_lock_key(room_id), 1, timeout=LOCK_TIMEOUT):
+        invalidate(room_id)
+        return
+    try:
+        entry = update(cache.get(_key(room_id)))
+        if entry is None:
+            return
+        cache.set(_key(room_id), entry, timeout=settings.MESSAGE_CACHE_TTL)
+        if cache.get(_dirty_key(room_id)) is not None:
+            cache.delete(_key(room_id))
+    finally:
+        cache.delete(_lock_key(room_id))
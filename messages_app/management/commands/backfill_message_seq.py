@@ -0,0 +1,89 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from messages_app import cache as message_cache
+from messages_app.models import Message
+from rooms.models import Room, RoomMember
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign per-room sequence numbers to messages created before Message.seq existed. "
+        "Runs online: rooms are processed one at a time in small chunks and the command "
+        "can be interrupted and re-run safely."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--room", type=int, action="append", dest="rooms", help="Only backfill this room (repeatable).")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--sleep", type=float, default=0.0, help="Pause between chunks, in seconds.")
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.order_by("id").values_list("id", flat=True)
+        if options["rooms"]:
+            rooms = rooms.filter(id__in=options["rooms"])
+
+        total = 0
+        for room_id in rooms.iterator():
+            numbered = self.backfill_room(room_id, options["chunk_size"], options["sleep"])
+            if numbered:
+                self.stdout.write(f"room {room_id}: numbered {numbered} message(s)")
+            total += numbered
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} message(s)."))
+
+    def backfill_room(self, room_id, chunk_size, pause):
+        """
+        Number the room's unnumbered (legacy) messages newest first, counting
+        down from just below the lowest live seq. Live seqs never move, so
+        clients' gap detection and ``since_seq`` cursors stay valid; legacy
+        messages may get zero or negative seqs. The next seq is derived from
+        what is already numbered, which makes an interrupted run resumable.
+        """
+        legacy = Message.objects.filter(room_id=room_id, seq__isnull=True)
+        if not legacy.exists():
+            return 0
+
+        numbered = 0
+        while True:
+            with transaction.atomic():
+                # Serializes with allocate_seqs while the floor is read
+                list(Room.objects.select_for_update().filter(pk=room_id).values_list("id", flat=True))
+                chunk = list(legacy.order_by("-id").only("id")[:chunk_size])
+                if not chunk:
+                    break
+                floor = (
+                    Message.objects.filter(room_id=room_id, id__gt=chunk[0].id, seq__isnull=False)
+                    .aggregate(low=Min("seq"))["low"]
+                )
+                if floor is None:
+                    floor = Room.objects.filter(pk=room_id).values_list("last_seq", flat=True).get() + 1
+                for offset, msg in enumerate(chunk, start=1):
+                    msg.seq = floor - offset
+                Message.objects.bulk_update(chunk, ["seq"])
+            numbered += len(chunk)
+            if pause:
+                time.sleep(pause)
+
+        self.backfill_read_cursors(room_id)
+        # The hot cache may still hold these messages without their seq
+        message_cache.invalidate(room_id)
+        return numbered
+
+    def backfill_read_cursors(self, room_id):
+        """Derive last_read_seq from last_read_msg_id for members who read legacy messages."""
+        read_seq = (
+            Message.objects.filter(room_id=room_id, id__lte=OuterRef("last_read_msg_id"), seq__isnull=False)
+            .order_by("-id")
+            .values("seq")[:1]
+        )
+        # Either side may be NULL; take the other one then
+        RoomMember.objects.filter(room_id=room_id, last_read_msg_id__isnull=False).update(
+            last_read_seq=Greatest(
+                Coalesce(F("last_read_seq"), Subquery(read_seq)),
+                Coalesce(Subquery(read_seq), F("last_read_seq")),
+            )
+        )
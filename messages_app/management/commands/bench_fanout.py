@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from config import codec
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark the CPU cost of fanning a message out to a room's sockets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=3000, help="Sockets in the room.")
+        parser.add_argument("--messages", type=int, default=50, help="Messages to fan out.")
+        parser.add_argument("--body-size", type=int, default=200, help="Characters per message body.")
+
+    def handle(self, *args, **options):
+        subscribers, count = options["subscribers"], options["messages"]
+        payloads = [
+            {
+                "id": 1000 + i,
+                "room": 1,
+                "seq": 1000 + i,
+                "sender": 42,
+                "body": "x" * options["body_size"],
+                "file_url": None,
+                "created_at": timezone.now().isoformat(),
+                "type": "message",
+            }
+            for i in range(count)
+        ]
+
+        # Both arms use the same encoder, so only the number of encodes differs
+        def per_subscriber():
+            # Every consumer serialized the shared dict itself (send_json)
+            for payload in payloads:
+                for _ in range(subscribers):
+                    codec.dumps(payload)
+
+        def encode_once():
+            # The sender encodes once; consumers forward the frame
+            frames = codec.encode_frames(payloads)[codec.JSON]
+            for frame in frames:
+                for _ in range(subscribers):
+                    frame.encode()  # stand-in for handing the bytes to the socket
+
+        results = {}
+        for name, fn in (("per-subscriber encode", per_subscriber), ("encode once", encode_once)):
+            started = time.process_time()
+            fn()
+            elapsed = time.process_time() - started
+            results[name] = elapsed
+            self.stdout.write(
+                f"{name:>26}: {elapsed * 1e6 / count:10.1f} µs CPU per message "
+                f"({elapsed * 1e9 / (count * subscribers):8.1f} ns per delivery)"
+            )
+        before, after = results.values()
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {before / after:.1f}x at {subscribers} subscribers"))
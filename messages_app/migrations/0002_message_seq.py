@@ -0,0 +1,26 @@
+# Generated by Django 5.0.7 on 2026-10-17 17:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messages_app', '0001_initial'),
+        ('orgs', '0001_initial'),
+        ('rooms', '0003_room_last_seq'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'seq'], name='msg_room_seq'),
+        ),
+    ]
@@ -18,6 +18,8 @@ class Message(models.Model):
     )
     body = models.TextField(blank=True, default="")
     file_url = models.URLField(null=True, blank=True)
+    # Per-room monotonic sequence number, assigned on insert (see services.allocate_seqs)
+    seq = models.BigIntegerField(null=True, blank=True)
     is_deleted = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -25,6 +27,7 @@ class Message(models.Model):
         # Optimized for: WHERE room_id = ? AND id < ?
         indexes = [
             models.Index(fields=["room", "-id"], name="msg_room_id_desc"),
+            models.Index(fields=["room", "seq"], name="msg_room_seq"),
             # keep this only if you need time-based queries:
             # models.Index(fields=["created_at"], name="msg_created_at_idx"),
         ]
@@ -0,0 +1,187 @@
+"""
+Post-commit side-effect pipeline for new messages.
+
+The request path only persists the row. Once the transaction commits, the
+message id is handed to a per-process buffer which ships the collected ids to
+a Celery task every ``MESSAGE_PIPELINE_BATCH_WINDOW_MS``. The task fans the
+whole batch out to the room groups and writes the notifications for every
+message in one ``bulk_create``.
+"""
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from config import codec
+from config.batching import BatchBuffer
+from config.realtime import broadcast
+from messages_app import cache as message_cache
+from messages_app.models import Message
+from notifications.models import Notification
+from rooms import pubsub
+from rooms.models import RoomMember
+
+logger = logging.getLogger(__name__)
+
+_buffer = None
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = BatchBuffer(
+            _dispatch,
+            window=settings.MESSAGE_PIPELINE_BATCH_WINDOW_MS / 1000,
+            max_size=settings.MESSAGE_PIPELINE_MAX_BATCH,
+            name="message-pipeline",
+        )
+    return _buffer
+
+
+def enqueue(message_id):
+    get_buffer().add(message_id)
+
+
+def enqueue_on_commit(messages):
+    """
+    Once the surrounding transaction (if any) commits, write the messages
+    through to their rooms' hot caches and queue their side effects.
+    """
+    def run():
+        by_room = defaultdict(list)
+        for msg in messages:
+            by_room[msg.room_id].append(msg)
+        for room_id, room_messages in by_room.items():
+            try:
+                message_cache.push(room_id, room_messages)
+            except Exception:
+                logger.exception("Failed to write messages through to the cache of room %s", room_id)
+        for msg in messages:
+            enqueue(msg.id)
+
+    transaction.on_commit(run)
+
+
+def _dispatch(message_ids):
+    from messages_app.tasks import process_message_batch
+
+    try:
+        process_message_batch.delay(message_ids)
+    except Exception:
+        # Broker unavailable: still deliver, just from this process.
+        logger.exception("Could not queue message batch %s; processing in-process", message_ids)
+        process_batch(message_ids)
+
+
+def process_batch(message_ids):
+    messages = list(
+        Message.objects.filter(id__in=message_ids, is_deleted=False)
+        .select_related("sender", "room")
+        .order_by("id")
+    )
+    if not messages:
+        return
+    fanout_messages(messages)
+    notify_room_members(messages)
+
+
+def message_payload(msg):
+    return {
+        "id": msg.id,
+        "room": msg.room_id,
+        "seq": msg.seq,
+        "sender": msg.sender_id,
+        "body": msg.body,
+        "file_url": msg.file_url,
+        "created_at": msg.created_at.isoformat(),
+        "type": "message",
+    }
+
+
+def cached_payload(item):
+    """``message_payload`` for a serialized message from the room cache."""
+    return {
+        "id": item["id"],
+        "room": item["room"],
+        "seq": item["seq"],
+        "sender": item["sender"],
+        "body": item["body"],
+        "file_url": item["file_url"],
+        "created_at": item["created_at"],
+        "type": "message",
+    }
+
+
+def fanout_messages(messages):
+    """
+    Send one event per room carrying every message of the batch, already
+    encoded as JSON (and msgpack, for rooms with msgpack sockets) so
+    consumers only forward bytes. Rooms at or
+    above ``ROOM_PUBSUB_THRESHOLD`` members are published once over pub/sub
+    instead of through the channel-layer group (see ``rooms.pubsub``).
+    """
+    by_room = defaultdict(list)
+    member_counts = {}
+    for msg in messages:
+        by_room[msg.room_id].append(message_payload(msg))
+        member_counts[msg.room_id] = msg.room.member_count
+
+    formats = codec.room_formats(by_room)
+    events = [
+        (room_id, {
+            "type": "fanout",
+            "room": room_id,
+            "ids": [payload["id"] for payload in payloads],
+            "frames": codec.encode_frames(payloads, formats[room_id]),
+        })
+        for room_id, payloads in by_room.items()
+    ]
+    large = [(room_id, event) for room_id, event in events if pubsub.use_pubsub(member_counts[room_id])]
+    group = [(room_id, event) for room_id, event in events if not pubsub.use_pubsub(member_counts[room_id])]
+    if large:
+        try:
+            pubsub.publish(large)
+        except Exception:
+            logger.exception("Pub/sub fan-out failed; falling back to groups for rooms %s", [r for r, _ in large])
+            group += large
+
+    broadcast((f"room_{room_id}", event) for room_id, event in group)
+
+
+def _preview(msg):
+    if msg.body:
+        preview = msg.body[:80]
+        if len(msg.body) > 80:
+            preview += "..."
+    elif msg.file_url:
+        preview = "shared a file"
+    else:
+        preview = "sent a message"
+    return preview
+
+
+def notify_room_members(messages):
+    """Create notifications for everyone in each room except the sender."""
+    room_ids = {msg.room_id for msg in messages}
+    members_by_room = defaultdict(list)
+    for room_id, user_id in RoomMember.objects.filter(room_id__in=room_ids).values_list("room_id", "user_id"):
+        members_by_room[room_id].append(user_id)
+
+    notifications = []
+    for msg in messages:
+        sender_identifier = getattr(msg.sender, "email", None) or getattr(msg.sender, "username", None) or "Someone"
+        title = f"New message in {msg.room.name}"
+        text = f"{sender_identifier} {_preview(msg)}"
+        notifications.extend(
+            Notification(user_id=user_id, title=title, message=text, notification_type="message")
+            for user_id in members_by_room[msg.room_id]
+            if user_id != msg.sender_id
+        )
+
+    if notifications:
+        Notification.objects.bulk_create(
+            notifications,
+            batch_size=settings.MESSAGE_PIPELINE_NOTIFICATION_CHUNK,
+            ignore_conflicts=True,
+        )
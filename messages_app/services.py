@@ -0,0 +1,77 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce, Greatest
+
+from messages_app import pipeline
+from messages_app.models import Message
+from rooms.models import Room, RoomMember
+from webhooks import events as webhook_events
+
+
+def allocate_seqs(room_id, count=1):
+    """
+    Reserve ``count`` consecutive sequence numbers in a room and return the
+    first one. Must run inside a transaction: the UPDATE keeps the room row
+    locked until commit, which serializes concurrent inserts per room.
+    """
+    Room.objects.filter(pk=room_id).update(last_seq=F("last_seq") + count)
+    head = Room.objects.filter(pk=room_id).values_list("last_seq", flat=True).get()
+    return head - count + 1
+
+
+def advance_read_cursor(room_id, user_id, msg_id, seq):
+    """Move a member's read cursor forward (never backwards)."""
+    return RoomMember.objects.filter(room_id=room_id, user_id=user_id).update(
+        last_read_msg_id=Greatest(Coalesce(F("last_read_msg_id"), 0), msg_id),
+        last_read_seq=Greatest(Coalesce(F("last_read_seq"), 0), seq),
+    )
+
+
+def create_message(room, sender, **fields):
+    """
+    Persist a message with the room's next sequence number. Side effects
+    (cache write-through, fan-out, notifications) run after commit.
+    """
+    return create_messages([Message(room=room, sender=sender, **fields)])[0]
+
+
+def create_messages(messages):
+    """
+    Persist unsaved ``Message`` instances (``room``/``sender`` and content
+    set) in one transaction and one ``bulk_create``. Each room reserves its
+    sequence range once, locking rooms in id order so concurrent batches
+    cannot deadlock. Returns the messages with ``id``/``seq`` filled in,
+    in input order.
+    """
+    if not messages:
+        return []
+    by_room = defaultdict(list)
+    for msg in messages:
+        by_room[msg.room_id].append(msg)
+
+    with transaction.atomic():
+        org_ids = dict(Room.objects.filter(pk__in=by_room).values_list("id", "org_id"))
+        missing = set(by_room) - set(org_ids)
+        if missing:
+            raise Room.DoesNotExist(f"Rooms {sorted(missing)} do not exist")
+        for room_id in sorted(by_room):
+            first = allocate_seqs(room_id, len(by_room[room_id]))
+            for offset, msg in enumerate(by_room[room_id]):
+                msg.seq = first + offset
+                msg.org_id = org_ids[room_id]
+        Message.objects.bulk_create(messages)
+        webhook_events.messages_created(messages)
+
+        read_upto = {}
+        for room_id, room_messages in by_room.items():
+            last = room_messages[-1]
+            Room.objects.filter(pk=room_id).update(last_message_id=last.id, last_activity_at=last.created_at)
+            for msg in room_messages:
+                # Senders have read everything up to their own message
+                read_upto[(room_id, msg.sender_id)] = msg
+        for (room_id, sender_id), msg in read_upto.items():
+            advance_read_cursor(room_id, sender_id, msg.id, msg.seq)
+        pipeline.enqueue_on_commit(messages)
+    return messages
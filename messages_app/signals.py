@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from messages_app import cache as message_cache
+from messages_app.models import Message
+
+
+@receiver(post_save, sender=Message)
+def invalidate_room_cache_on_change(sender, instance, created, **kwargs):
+    """New messages are written through by the pipeline; edits drop the entry."""
+    if not created:
+        room_id = instance.room_id
+        transaction.on_commit(lambda: message_cache.invalidate(room_id))
+
+
+@receiver(post_delete, sender=Message)
+def invalidate_room_cache_on_delete(sender, instance, **kwargs):
+    room_id = instance.room_id
+    transaction.on_commit(lambda: message_cache.invalidate(room_id))
@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from messages_app.pipeline import process_batch
+
+
+@shared_task
+def process_message_batch(message_ids):
+    """Fan out and notify for a batch of freshly committed messages."""
+    process_batch(message_ids)
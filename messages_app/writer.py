@@ -0,0 +1,126 @@
+"""
+Micro-batched message writes for WebSocket senders.
+
+Every connection in a process submits into the same ``MessageWriter`` (one
+per event loop). The writer collects messages for
+``MESSAGE_WS_WRITE_WINDOW_MS`` or until ``MESSAGE_WS_WRITE_MAX_BATCH`` are
+pending, persists them with ``services.create_messages`` (one transaction,
+one ``bulk_create``) and resolves each sender's future with the saved
+message. Fan-out and notifications then follow the same post-commit pipeline
+as REST.
+
+One bad message must not fail its neighbours. Messages for deleted rooms or
+from senders who are no longer members are rejected before the insert. If
+the batch insert still fails, each message is retried in its own
+transaction and only the ones that fail again are rejected.
+"""
+import asyncio
+import logging
+import weakref
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+
+from config import authz, metrics
+from messages_app.models import Message
+from messages_app.services import create_messages
+from rooms.models import Room
+
+logger = logging.getLogger(__name__)
+
+_writers = weakref.WeakKeyDictionary()
+
+
+class MessageWriter:
+    def __init__(self, window, max_size):
+        self.window = window
+        self.max_size = max_size
+        self._pending = []
+        self._timer = None
+
+    def submit(self, room_id, sender_id, **fields):
+        """Queue a message; the returned future resolves to the saved ``Message``."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((Message(room_id=room_id, sender_id=sender_id, **fields), future))
+        if len(self._pending) >= self.max_size:
+            self._flush_soon(0)
+        elif self._timer is None:
+            self._flush_soon(self.window)
+        return future
+
+    def _flush_soon(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self.flush(batch))
+
+    async def flush(self, batch):
+        try:
+            results = await database_sync_to_async(persist)([msg for msg, _ in batch])
+        except Exception as exc:
+            logger.exception("Failed to write a batch of %s message(s)", len(batch))
+            results = [exc] * len(batch)
+        metrics.incr("messages.ws_writer.batches")
+        metrics.incr("messages.ws_writer.messages", sum(1 for result in results if isinstance(result, Message)))
+        for result, (_, future) in zip(results, batch):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def persist(messages):
+    """
+    Save ``messages`` in one batch where possible. Returns, in input order,
+    the saved ``Message`` or the exception that rejected it.
+    """
+    results = [None] * len(messages)
+    rooms = set(Room.objects.filter(pk__in={msg.room_id for msg in messages}).values_list("id", flat=True))
+    accepted = []
+    for index, msg in enumerate(messages):
+        if msg.room_id not in rooms:
+            results[index] = Room.DoesNotExist(f"Room {msg.room_id} does not exist")
+        elif not authz.is_room_member(msg.sender_id, msg.room_id):
+            results[index] = PermissionDenied(f"User {msg.sender_id} is not a member of room {msg.room_id}")
+        else:
+            accepted.append(index)
+    if not accepted:
+        return results
+
+    try:
+        saved = create_messages([messages[index] for index in accepted])
+    except Exception:
+        logger.exception("Batch of %s message(s) failed; retrying one by one", len(accepted))
+        metrics.incr("messages.ws_writer.fallbacks")
+        for index in accepted:
+            msg = messages[index]
+            # The failed batch may have assigned these already
+            msg.pk = msg.seq = msg.org_id = None
+            try:
+                results[index] = create_messages([msg])[0]
+            except Exception as exc:
+                results[index] = exc
+        return results
+    for index, msg in zip(accepted, saved):
+        results[index] = msg
+    return results
+
+
+def get_writer():
+    """The writer for the running event loop."""
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        writer = _writers[loop] = MessageWriter(
+            window=settings.MESSAGE_WS_WRITE_WINDOW_MS / 1000,
+            max_size=settings.MESSAGE_WS_WRITE_MAX_BATCH,
+        )
+    return writer
@@ -11,6 +11,7 @@ from .serializers import (
     InviteCreateSerializer, InviteAcceptSerializer
 )
 from config.permissions import IsOrgAdmin, IsOrgManagerOrAdmin, IsOrgMember
+from rooms.membership import reconcile_member
 
 
 class OrganizationViewSet(viewsets.ModelViewSet):
@@ -109,6 +110,9 @@ class OrganizationViewSet(viewsets.ModelViewSet):
         if new_role not in {"ADMIN", "MANAGER", "MEMBER"}:
             return Response({"detail": "Invalid role"}, status=status.HTTP_400_BAD_REQUEST)
         mem = get_object_or_404(OrganizationMember, org_id=pk, user_id=user_id)
-        mem.role = new_role
-        mem.save(update_fields=["role"])
+        if mem.role != new_role:
+            mem.role = new_role
+            mem.save(update_fields=["role"])
+            # Join/leave MANAGER_ONLY rooms to match the new role
+            reconcile_member(mem.org_id, mem.user_id)
         return Response({"detail": "Role updated", "user_id": user_id, "role": new_role}, status=status.HTTP_200_OK)
@@ -1,5 +1,6 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from config import authz
 from .models import OrganizationMember
 
 
@@ -7,23 +8,13 @@ from .models import OrganizationMember
 def auto_join_public_rooms(sender, instance, created, **kwargs):
     """Automatically join new members to PUBLIC and MANAGER_ONLY rooms based on their role."""
     if created:  # Only when membership is first created
-        org = instance.org
-        user_role = instance.role
-        
-        # Import Room here to avoid circular imports
-        from rooms.models import Room, RoomMember
-        
-        # Get all rooms in this organization
-        rooms = Room.objects.filter(org=org)
-        
-        for room in rooms:
-            # Determine if user should auto-join
-            should_join = False
-            if room.access_level == Room.PUBLIC:
-                should_join = True  # All org members
-            elif room.access_level == Room.MANAGER_ONLY:
-                should_join = user_role in {"MANAGER", "ADMIN"}  # Only managers/admins
-            
-            if should_join:
-                RoomMember.objects.get_or_create(room=room, user=instance.user)
+        # Import here to avoid circular imports
+        from rooms.membership import join_org_rooms
 
+        join_org_rooms(instance.org_id, instance.user_id, instance.role)
+
+
+@receiver(post_save, sender=OrganizationMember)
+@receiver(post_delete, sender=OrganizationMember)
+def invalidate_cached_roles(sender, instance, **kwargs):
+    authz.invalidate_on_commit([instance.user_id], kinds=(authz.ROLES,))
@@ -0,0 +1,86 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class InboxCursorPagination(pagination.BasePagination):
+    """
+    Keyset pagination for the inbox, ordered by ``(room.last_activity_at,
+    room_id)`` descending. The opaque ``?cursor=`` carries the position of
+    the last row of the previous page, so there is no COUNT(*) or OFFSET.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_limit(request)
+        position = self.decode_cursor(request)
+        if position is not None:
+            activity, room_id = position
+            queryset = queryset.filter(
+                Q(room__last_activity_at__lt=activity)
+                | Q(room__last_activity_at=activity, room_id__lt=room_id)
+            )
+        rows = list(queryset.order_by("-room__last_activity_at", "-room_id")[:limit + 1])
+        self.next_position = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            self.next_position = (last.room.last_activity_at.isoformat(), last.room_id)
+        return rows[:limit]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if limit <= 0:
+            return self.page_size
+        return min(limit, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            activity, room_id = json.loads(base64.urlsafe_b64decode(padded))
+            activity = parse_datetime(activity)
+            if activity is None:
+                raise ValueError(encoded)
+            return activity, int(room_id)
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        encoded = base64.urlsafe_b64encode(json.dumps(self.next_position).encode()).decode().rstrip("=")
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
@@ -3,12 +3,12 @@ from rooms.models import Room, RoomMember
 
 
 class RoomSerializer(serializers.ModelSerializer):
-    members_count = serializers.IntegerField(source="memberships.count", read_only=True)
+    members_count = serializers.IntegerField(source="member_count", read_only=True)
 
     class Meta:
         model = Room
-        fields = ["id", "name", "is_dm", "org", "access_level", "created_by", "created_at", "members_count"]
-        read_only_fields = ["created_by", "created_at", "members_count"]
+        fields = ["id", "name", "is_dm", "org", "access_level", "created_by", "created_at", "last_seq", "last_activity_at", "members_count"]
+        read_only_fields = ["created_by", "created_at", "last_seq", "last_activity_at", "members_count"]
 
     def create(self, validated_data):
         request = self.context["request"]
@@ -26,7 +26,7 @@ class RoomMemberSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = RoomMember
-        fields = ["id", "room", "user", "user_email", "user_first_name", "user_last_name", "org_role", "last_read_msg_id", "joined_at"]
+        fields = ["id", "room", "user", "user_email", "user_first_name", "user_last_name", "org_role", "last_read_msg_id", "last_read_seq", "joined_at"]
         read_only_fields = ["joined_at"]
     
     def get_org_role(self, obj):
@@ -39,3 +39,30 @@ class RoomMemberSerializer(serializers.ModelSerializer):
             return org_member.role
         except OrganizationMember.DoesNotExist:
             return None
+
+
+class InboxEntrySerializer(serializers.Serializer):
+    """One inbox row: a RoomMember annotated by RoomViewSet.inbox."""
+    room_id = serializers.IntegerField()
+    name = serializers.CharField(source="room.name")
+    is_dm = serializers.BooleanField(source="room.is_dm")
+    org = serializers.IntegerField(source="room.org_id", allow_null=True)
+    access_level = serializers.CharField(source="room.access_level")
+    members_count = serializers.IntegerField(source="room.member_count")
+    last_seq = serializers.IntegerField(source="room.last_seq")
+    last_read_seq = serializers.IntegerField(allow_null=True)
+    last_activity_at = serializers.DateTimeField(source="room.last_activity_at")
+    unread_count = serializers.IntegerField()
+    last_message = serializers.SerializerMethodField()
+
+    def get_last_message(self, obj):
+        if obj.room.last_message_id is None or obj.last_message_sender is None:
+            return None
+        body = obj.last_message_body or ""
+        return {
+            "id": obj.room.last_message_id,
+            "sender": obj.last_message_sender,
+            "body": body[:120],
+            "file_url": obj.last_message_file_url,
+            "created_at": serializers.DateTimeField().to_representation(obj.last_message_created_at),
+        }
@@ -1,20 +1,26 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
 
+from messages_app.models import Message
+from rooms import membership, presence, read_cursors
 from rooms.models import Room, RoomMember
-from .serializers import RoomSerializer, RoomMemberSerializer
+from .pagination import InboxCursorPagination
+from .serializers import InboxEntrySerializer, RoomSerializer, RoomMemberSerializer
 from orgs.models import OrganizationMember
+from config import authz
+from config.permissions import get_user_role
 
 class RoomViewSet(viewsets.ModelViewSet):
     serializer_class = RoomSerializer
 
     def _user_role_in_org(self, org_id):
-        try:
-            return OrganizationMember.objects.only("role").get(org_id=org_id, user=self.request.user).role
-        except OrganizationMember.DoesNotExist:
-            return None
+        return get_user_role(self.request.user, org_id, self.request)
 
     def get_permissions(self):
         # Create/destroy require MANAGER/ADMIN; others require membership
@@ -24,7 +30,7 @@ class RoomViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # Only rooms where the user is a member
-        my_room_ids = RoomMember.objects.filter(user=self.request.user).values_list("room_id", flat=True)
+        my_room_ids = authz.get_room_ids(self.request.user.id, self.request)
         qs = Room.objects.filter(id__in=my_room_ids).select_related("org", "created_by")
         return qs
 
@@ -37,26 +43,36 @@ class RoomViewSet(viewsets.ModelViewSet):
             # Only managers/admins can create rooms in an org
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("Only org MANAGER/ADMIN can create rooms.")
-        room = serializer.save(created_by=self.request.user)
-        
-        # Smart auto-join based on access level
-        access_level = room.access_level
-        org_members = OrganizationMember.objects.filter(org=room.org)
-        
-        for member in org_members:
-            user_role = member.role
-            
-            # Determine if user should auto-join
-            should_join = False
-            if access_level == Room.PUBLIC:
-                should_join = True  # All org members
-            elif access_level == Room.MANAGER_ONLY:
-                should_join = user_role in {"MANAGER", "ADMIN"}  # Only managers/admins
-            elif access_level == Room.PRIVATE:
-                should_join = False  # No auto-join for private rooms
-            
-            if should_join:
-                RoomMember.objects.get_or_create(room=room, user=member.user)
+        # One transaction, so the room.created/member.joined outbox rows commit with the room
+        with transaction.atomic():
+            room = serializer.save(created_by=self.request.user)
+
+            # Smart auto-join based on access level, computed and inserted in bulk
+            membership.populate_room(room)
+        room.refresh_from_db(fields=["member_count"])
+
+    @action(detail=False, methods=["get"], url_path="inbox")
+    def inbox(self, request):
+        """
+        The user's rooms ordered by last activity, each with a last-message
+        preview and unread count. One query per page, cursor paginated.
+        """
+        # A soft-deleted last message shows no preview rather than its content
+        last_message = Message.objects.filter(pk=OuterRef("room__last_message_id"), is_deleted=False)
+        qs = (
+            RoomMember.objects.filter(user=request.user)
+            .select_related("room")
+            .annotate(
+                unread_count=Greatest(F("room__last_seq") - Coalesce(F("last_read_seq"), 0), 0),
+                last_message_sender=Subquery(last_message.values("sender_id")[:1]),
+                last_message_body=Subquery(last_message.values("body")[:1]),
+                last_message_file_url=Subquery(last_message.values("file_url")[:1]),
+                last_message_created_at=Subquery(last_message.values("created_at")[:1]),
+            )
+        )
+        paginator = InboxCursorPagination()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(InboxEntrySerializer(page, many=True).data)
 
     @action(detail=True, methods=["post"], url_path="join")
     def join(self, request, pk=None):
@@ -162,28 +178,48 @@ class RoomViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"], url_path="members")
     def members(self, request, pk=None):
         # Only members can see members
-        if not RoomMember.objects.filter(room_id=pk, user=request.user).exists():
+        if not authz.is_room_member(request.user.id, pk, request):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("Not a member of this room.")
         qs = RoomMember.objects.filter(room_id=pk).select_related("user")
         return Response(RoomMemberSerializer(qs, many=True).data)
 
+    @action(detail=True, methods=["get"], url_path="presence")
+    def presence(self, request, pk=None):
+        """
+        Who is online right now. Sockets receive changes as ``presence``
+        events afterwards, so clients fetch this once instead of polling.
+        """
+        if not authz.is_room_member(request.user.id, pk, request):
+            from rest_framework.exceptions import PermissionDenied
+            raise PermissionDenied("Not a member of this room.")
+        return Response({"room": int(pk), "online": presence.online(int(pk))})
+
     @action(detail=True, methods=["post"], url_path="read/(?P<msg_id>[^/.]+)")
     def mark_read(self, request, pk=None, msg_id=None):
-        """Mark messages as read up to a specific message ID."""
-        # Verify user is a member of the room
-        membership = get_object_or_404(
-            RoomMember, 
-            room_id=pk, 
-            user=request.user
-        )
-        
-        # Update last_read_msg_id
-        membership.last_read_msg_id = int(msg_id)
-        membership.save(update_fields=['last_read_msg_id'])
-        
+        """
+        Mark messages as read up to a specific message ID. The cursor only
+        moves forward and is written in the next batched flush (see
+        ``rooms.read_cursors``), so repeated calls while scrolling are cheap.
+        """
+        if not authz.is_room_member(request.user.id, pk, request):
+            raise Http404
+        message = get_object_or_404(Message.objects.only("id", "seq"), pk=msg_id, room_id=pk)
+        read_cursors.mark_read(pk, request.user.id, message.id)
+
+        # Report the cursor as it will be: an older message does not move it back
+        read_msg_id, read_seq = (
+            RoomMember.objects.filter(room_id=pk, user=request.user)
+            .values_list("last_read_msg_id", "last_read_seq")
+            .first()
+        ) or (None, None)
+        last_read_msg_id = max(read_msg_id or 0, message.id)
+        last_read_seq = message.seq
+        if read_seq is not None and (message.seq is None or read_seq > message.seq):
+            last_read_seq = read_seq
         return Response({
             'detail': 'Messages marked as read',
             'room_id': pk,
-            'last_read_msg_id': msg_id
+            'last_read_msg_id': last_read_msg_id,
+            'last_read_seq': last_read_seq
         }, status=status.HTTP_200_OK)
\ No newline at end of file
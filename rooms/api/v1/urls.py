@@ -4,8 +4,11 @@ from rooms.api.base.views import RoomViewSet
 app_name = "rooms_v1"
 urlpatterns = [
     path("", RoomViewSet.as_view({"get": "list", "post": "create"}), name="room-list"),
+    path("inbox/", RoomViewSet.as_view({"get": "inbox"}), name="room-inbox"),
     path("<int:pk>/", RoomViewSet.as_view({"get": "retrieve", "put": "update", "patch": "partial_update", "delete": "destroy"}), name="room-detail"),
     path("<int:pk>/join/", RoomViewSet.as_view({"post": "join"}), name="room-join"),
     path("<int:pk>/leave/", RoomViewSet.as_view({"post": "leave"}), name="room-leave"),
     path("<int:pk>/members/", RoomViewSet.as_view({"get": "members"}), name="room-members"),
+    path("<int:pk>/presence/", RoomViewSet.as_view({"get": "presence"}), name="room-presence"),
+    path("<int:pk>/read/<int:msg_id>/", RoomViewSet.as_view({"post": "mark_read"}), name="room-mark-read"),
 ]
@@ -1,48 +1,323 @@
+import asyncio
 import json
+import logging
+import time
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
+from django.conf import settings
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from rooms.models import RoomMember
+from accounts.authentication import authenticate_token, peek_user
+from config import authz, codec, metrics
+from messages_app import cache as message_cache
+from messages_app.api.base.serializers import MessageSerializer
+from messages_app.pipeline import cached_payload
+from messages_app.writer import get_writer
+from rooms.outbound import SLOW_CONSUMER_CLOSE_CODE, OutboundQueue
+from rooms.presence import get_tracker
+from rooms import read_cursors
+from rooms.pubsub import get_relay, large_rooms
+from rooms.typing import get_coalescer
 
-User = get_user_model()
+logger = logging.getLogger(__name__)
 
+# Close code for a socket whose user was removed from its room
+REMOVED_CLOSE_CODE = 4003
 
-class RoomConsumer(AsyncJsonWebsocketConsumer):
+
+def room_group(room_id):
+    return f"room_{room_id}"
+
+
+class BaseRoomConsumer(AsyncJsonWebsocketConsumer):
+    """Authentication, authorization and room event handlers shared by the room sockets."""
+
+    # Wire format of this socket: JSON text frames, or msgpack binary frames
+    # when the client offers the "msgpack" subprotocol
+    frame_format = codec.JSON
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # room_id -> {node: (users, expires_at)}, and the last list sent per room
+        self.typing = {}
+        self.typing_sent = {}
+        # room_id -> newest message id sent by a replay, until live events pass it
+        self.replayed_upto = {}
+
+    outbound = None
+
+    async def accept_socket(self):
+        if codec.MSGPACK in self.scope.get('subprotocols', []):
+            self.frame_format = codec.MSGPACK
+            await self.accept(subprotocol=codec.MSGPACK)
+        else:
+            await self.accept()
+        self.outbound = OutboundQueue(
+            self.send,
+            maxsize=settings.WS_OUTBOUND_QUEUE_SIZE,
+            drop_kinds=settings.WS_OUTBOUND_DROP_KINDS,
+            collapse_kinds=settings.WS_OUTBOUND_COLLAPSE_KINDS,
+            close=self.close,
+        )
+
+    async def send_json(self, content, close=False, kind='event', key=None):
+        await self.send_frame(codec.encode(content, self.frame_format), close=close, kind=kind, key=key)
+
+    async def send_frame(self, frame, close=False, kind='event', key=None):
+        """Queue an already encoded frame in this socket's format (see rooms.outbound)."""
+        data = {'bytes_data': frame} if self.frame_format == codec.MSGPACK else {'text_data': frame}
+        if close or self.outbound is None:
+            await self.send(**data, close=close)
+        elif not self.outbound.put(data, kind=kind, key=key):
+            # The client cannot keep up; don't let it hold events for everyone
+            metrics.incr("ws.outbound.slow_disconnects")
+            self.outbound.stop()
+            await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+
+    async def websocket_disconnect(self, message):
+        if self.outbound is not None:
+            self.outbound.stop()
+        await super().websocket_disconnect(message)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        if bytes_data is not None and self.frame_format == codec.MSGPACK:
+            try:
+                content = codec.unpackb(bytes_data)
+            except Exception:
+                return
+            if isinstance(content, dict):
+                await self.receive_json(content, **kwargs)
+            return
+        await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
+    @classmethod
+    async def decode_json(cls, text_data):
+        return codec.loads(text_data)
+
+    def get_query_param(self, name):
+        query_params = self.scope.get('query_string', b'').decode()
+        for param in query_params.split('&'):
+            if param.startswith(f'{name}='):
+                return param.split('=')[1]
+        return None
+
+    def get_token(self):
+        return self.get_query_param('token')
+
+    @staticmethod
+    def parse_cursor(value):
+        try:
+            return int(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    async def fanout(self, event):
+        """Forward a batch of pre-encoded messages from a room group."""
+        frames = codec.frames_in(event["frames"], self.frame_format)
+        replayed_upto = self.replayed_upto.pop(event['room'], None)
+        for msg_id, frame in zip(event["ids"], frames):
+            # Skip what the replay on (re)connect already delivered
+            if replayed_upto is not None and msg_id <= replayed_upto:
+                continue
+            await self.send_frame(frame, kind='message')
+
+    async def relay_add(self, room_ids, check_size=True):
+        """
+        Also receive fan-out of those rooms that are large enough to be sent
+        over pub/sub. A relay failure is logged and the socket stays on group
+        fan-out only; it never fails the connect or subscribe.
+        """
+        relay = get_relay()
+        if relay is None or not room_ids:
+            return
+        try:
+            room_ids = [int(room_id) for room_id in room_ids]
+            if check_size:
+                room_ids = await database_sync_to_async(large_rooms)(room_ids)
+            for room_id in room_ids:
+                await relay.add(room_id, self)
+        except Exception:
+            metrics.incr("fanout.pubsub.relay_errors")
+            logger.exception("Could not relay rooms %s to %s", room_ids, self.channel_name)
+
+    async def count_format(self, room_ids, delta):
+        """Let senders know whether these rooms need frames in this socket's format."""
+        if self.frame_format != codec.JSON and room_ids:
+            await database_sync_to_async(codec.add_subscribers)(self.frame_format, [int(r) for r in room_ids], delta)
+
+    async def relay_remove(self, room_ids):
+        relay = get_relay()
+        if relay is None:
+            return
+        try:
+            for room_id in room_ids:
+                await relay.remove(int(room_id), self)
+        except Exception:
+            metrics.incr("fanout.pubsub.relay_errors")
+            logger.exception("Could not stop relaying rooms %s to %s", room_ids, self.channel_name)
+
+    async def relay_subscribe(self, event):
+        """The room grew past ROOM_PUBSUB_THRESHOLD; start receiving it over pub/sub."""
+        await self.relay_add([event['room']], check_size=False)
+
+    async def replay(self, room_id, after_id=None, after_seq=None):
+        """
+        Send what a reconnecting client missed in a room since its last seen
+        message id (or seq), straight from the room's hot cache, or
+        ``resync_required`` when the cache does not reach back that far.
+        """
+        if after_id is None and after_seq is None:
+            return
+        items = await database_sync_to_async(message_cache.since)(room_id, after_id=after_id, after_seq=after_seq)
+        if items is None:
+            metrics.incr("ws.replay.resyncs")
+            await self.send_json({'type': 'resync_required', 'room': room_id})
+            return
+        metrics.incr("ws.replay.messages", len(items))
+        if items:
+            self.replayed_upto[room_id] = items[-1]['id']
+        await self.send_json({'type': 'replay', 'room': room_id, 'messages': [cached_payload(item) for item in items]})
+
+    async def membership_delta(self, event):
+        """Forward membership changes; leave the room if we were removed."""
+        await self.send_json({
+            'type': 'membership',
+            'room': event['room'],
+            'added': event['added'],
+            'removed': event['removed']
+        })
+        if self.user.id in event['removed']:
+            await self.removed_from_room(event['room'])
+
+    async def removed_from_room(self, room_id):
+        """Stop receiving the room's events and close the socket."""
+        await self.channel_layer.group_discard(room_group(room_id), self.channel_name)
+        # Close behind the queued membership frame so the client learns why
+        if self.outbound is None or not self.outbound.close_after(REMOVED_CLOSE_CODE):
+            await self.close(code=REMOVED_CLOSE_CODE)
+
+    async def typing_snapshot(self, event):
+        """Merge one node's typers into the room's list; forward it if it changed."""
+        now = time.monotonic()
+        nodes = self.typing.setdefault(event['room'], {})
+        nodes[event['node']] = (event['users'], now + event['ttl'])
+        users = {}
+        for node, (node_users, expires_at) in list(nodes.items()):
+            if expires_at <= now:
+                del nodes[node]
+                continue
+            for user in node_users:
+                users[user['user_id']] = user
+        users = sorted(users.values(), key=lambda user: user['user_id'])
+        if users == self.typing_sent.get(event['room'], []):
+            return
+        self.typing_sent[event['room']] = users
+        await self.send_json({'type': 'typing', 'room': event['room'], 'users': users}, kind='typing', key=event['room'])
+
+    async def presence_delta(self, event):
+        """Forward who came online or went offline in a room."""
+        await self.send_json({
+            'type': 'presence',
+            'room': event['room'],
+            'joined': event['joined'],
+            'left': event['left']
+        }, kind='presence')
+
+    async def read_receipts(self, event):
+        """Forward the read cursors that moved in a room since the last flush."""
+        await self.send_json({
+            'type': 'read_receipts',
+            'room': event['room'],
+            'cursors': event['cursors']
+        }, kind='receipt')
+
+    async def mark_read(self, room_id, msg_id):
+        """Queue a ``read`` frame's cursor; it is applied (or ignored) on the next flush."""
+        msg_id = self.parse_cursor(msg_id)
+        if msg_id is not None:
+            await database_sync_to_async(read_cursors.mark_read)(room_id, self.user.id, msg_id)
+
+    async def send_typing(self, room_id, is_typing):
+        get_coalescer().update(int(room_id), self.user.id, self.user.email, bool(is_typing))
+
+    async def stop_typing(self, room_ids):
+        for room_id in room_ids:
+            get_coalescer().forget(int(room_id), self.user.id)
+
+    async def send_message(self, room_id, content):
+        """Persist a ``message.send`` frame through the write buffer and ack it."""
+        client_id = content.get('client_id')
+        serializer = MessageSerializer(data={'body': content.get('body', ''), 'file_url': content.get('file_url')})
+        if not serializer.is_valid():
+            await self.send_json({'type': 'message.error', 'room': room_id, 'client_id': client_id, 'errors': serializer.errors})
+            return
+        try:
+            msg = await get_writer().submit(room_id, self.user.id, **serializer.validated_data)
+        except Exception:
+            await self.send_json({'type': 'message.error', 'room': room_id, 'client_id': client_id, 'errors': {'detail': 'Message could not be saved.'}})
+            return
+        await self.send_json({
+            'type': 'message.ack',
+            'room': room_id,
+            'client_id': client_id,
+            'id': msg.id,
+            'seq': msg.seq,
+            'created_at': msg.created_at.isoformat()
+        })
+
+    async def authenticate_user(self, token):
+        """Authenticate user from JWT token (cached; no thread hop on a local hit)."""
+        try:
+            user = peek_user(AccessToken(token)['user_id'])
+        except (InvalidToken, TokenError, KeyError):
+            return None
+        if user is not None:
+            return user if user.is_active else None
+        return await database_sync_to_async(authenticate_token)(token)
+
+    async def get_room_ids(self, user):
+        """All room ids the user belongs to (cached; no thread hop on a local hit)."""
+        room_ids = authz.peek_room_ids(user.id)
+        if room_ids is not None:
+            return room_ids
+        return await database_sync_to_async(authz.get_room_ids)(user.id)
+
+    async def check_room_membership(self, user, room_id):
+        """Check if user is a member of the room."""
+        return int(room_id) in await self.get_room_ids(user)
+
+
+class RoomConsumer(BaseRoomConsumer):
     async def connect(self):
         """Connect to WebSocket with JWT authentication."""
         self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group_name = f"room_{self.room_id}"
-        
+        self.room_group_name = room_group(self.room_id)
+
         # Get token from query parameters
-        query_params = self.scope.get('query_string', b'').decode()
-        token = None
-        for param in query_params.split('&'):
-            if param.startswith('token='):
-                token = param.split('=')[1]
-                break
-        
+        token = self.get_token()
         if not token:
             await self.close(code=4001)  # Unauthorized
             return
-        
+
         # Authenticate user
         user = await self.authenticate_user(token)
         if not user:
             await self.close(code=4001)  # Unauthorized
             return
-        
+
         # Check if user is member of the room
         is_member = await self.check_room_membership(user, self.room_id)
         if not is_member:
             await self.close(code=4003)  # Forbidden
             return
-        
+
         self.user = user
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
-        
+        await self.accept_socket()
+        await self.count_format([self.room_id], 1)
+        await self.relay_add([self.room_id])
+        await get_tracker().join([self.room_id], user.id)
+
         # Send welcome message
         await self.send_json({
             'type': 'connection',
@@ -51,28 +326,37 @@ class RoomConsumer(AsyncJsonWebsocketConsumer):
             'user_email': user.email
         })
 
+        # Resume: ?since=<message id> or ?since_seq=<seq>
+        await self.replay(
+            self.room_id,
+            after_id=self.parse_cursor(self.get_query_param('since')),
+            after_seq=self.parse_cursor(self.get_query_param('since_seq')),
+        )
+
     async def disconnect(self, close_code):
         """Disconnect from WebSocket."""
         if hasattr(self, 'room_group_name'):
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if hasattr(self, 'user'):
+            await self.count_format([self.room_id], -1)
+            await self.relay_remove([self.room_id])
+            await self.stop_typing([self.room_id])
+            await get_tracker().leave([self.room_id], self.user.id)
 
     async def receive_json(self, content):
         """Handle incoming WebSocket messages."""
         message_type = content.get('type', 'message')
-        
+
         if message_type == 'typing':
             # Broadcast typing indicator
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'typing_indicator',
-                    'user_id': self.user.id,
-                    'user_email': self.user.email,
-                    'is_typing': content.get('is_typing', False)
-                }
-            )
+            await self.send_typing(self.room_id, content.get('is_typing', False))
+        elif message_type == 'message.send':
+            await self.send_message(int(self.room_id), content)
+        elif message_type == 'read':
+            await self.mark_read(int(self.room_id), content.get('id'))
         elif message_type == 'ping':
-            # Respond to ping with pong
+            # Respond to ping with pong; doubles as the presence heartbeat
+            await get_tracker().heartbeat([self.room_id], self.user.id)
             await self.send_json({'type': 'pong'})
         else:
             # Echo back the message (for testing)
@@ -82,30 +366,146 @@ class RoomConsumer(AsyncJsonWebsocketConsumer):
                 'original': content
             })
 
-    async def fanout(self, event):
-        """Handle messages from the room group."""
-        await self.send_json(event["payload"])
 
-    async def typing_indicator(self, event):
-        """Handle typing indicators from other users."""
+class MultiplexConsumer(BaseRoomConsumer):
+    """
+    One socket for many rooms.
+
+    After connecting, the client sends ``{"type": "subscribe", "rooms": [...]}``
+    and ``{"type": "unsubscribe", "rooms": [...]}`` control frames. Every
+    requested room is authorized against one cached lookup of the user's
+    rooms, and every event sent down carries its ``room``. Removal from a room
+    unsubscribes it but keeps the socket open. ``message.send`` and ``typing``
+    frames name their ``room``, which must be subscribed. A subscribe frame
+    may carry ``since``/``since_seq`` maps to resume rooms (see ``replay``).
+    """
+
+    async def connect(self):
+        """Connect to WebSocket with JWT authentication."""
+        self.rooms = set()
+        token = self.get_token()
+        if not token:
+            await self.close(code=4001)  # Unauthorized
+            return
+
+        user = await self.authenticate_user(token)
+        if not user:
+            await self.close(code=4001)  # Unauthorized
+            return
+
+        self.user = user
+        await self.accept_socket()
+        metrics.incr("ws.multiplex.connections")
         await self.send_json({
-            'type': 'typing',
-            'user_id': event['user_id'],
-            'user_email': event['user_email'],
-            'is_typing': event['is_typing']
+            'type': 'connection',
+            'message': 'Connected',
+            'user_id': user.id,
+            'user_email': user.email
         })
 
-    @database_sync_to_async
-    def authenticate_user(self, token):
-        """Authenticate user from JWT token."""
+    async def disconnect(self, close_code):
+        """Disconnect from WebSocket."""
+        if getattr(self, 'user', None) is not None:
+            metrics.incr("ws.multiplex.connections", -1)
+            await self.stop_typing(self.rooms)
+        await self.leave(list(getattr(self, 'rooms', ())))
+
+    async def receive_json(self, content):
+        """Handle control frames and room-tagged client events."""
+        message_type = content.get('type')
+
+        if message_type == 'subscribe':
+            await self.subscribe(self.parse_rooms(content), content.get('since'), content.get('since_seq'))
+        elif message_type == 'unsubscribe':
+            room_ids = [room_id for room_id in self.parse_rooms(content) if room_id in self.rooms]
+            await self.leave(room_ids)
+            await self.send_json({'type': 'unsubscribed', 'rooms': room_ids})
+        elif message_type == 'typing':
+            room_id = self.parse_room(content.get('room'))
+            if room_id in self.rooms:
+                await self.send_typing(room_id, content.get('is_typing', False))
+        elif message_type == 'message.send':
+            room_id = self.parse_room(content.get('room'))
+            if room_id in self.rooms:
+                await self.send_message(room_id, content)
+            else:
+                await self.send_json({'type': 'message.error', 'room': room_id, 'client_id': content.get('client_id'), 'errors': {'room': 'Not subscribed to this room.'}})
+        elif message_type == 'read':
+            room_id = self.parse_room(content.get('room'))
+            if room_id in self.rooms:
+                await self.mark_read(room_id, content.get('id'))
+        elif message_type == 'ping':
+            await get_tracker().heartbeat(self.rooms, self.user.id)
+            await self.send_json({'type': 'pong'})
+        else:
+            await self.send_json({'type': 'error', 'message': f'Unknown frame type: {message_type}'})
+
+    @staticmethod
+    def parse_room(value):
         try:
-            access_token = AccessToken(token)
-            user_id = access_token['user_id']
-            return User.objects.get(id=user_id)
-        except (InvalidToken, TokenError, User.DoesNotExist):
+            return int(value)
+        except (TypeError, ValueError):
             return None
 
-    @database_sync_to_async
-    def check_room_membership(self, user, room_id):
-        """Check if user is a member of the room."""
-        return RoomMember.objects.filter(room_id=room_id, user=user).exists()
+    def parse_rooms(self, content):
+        rooms = content.get('rooms')
+        if not isinstance(rooms, list):
+            return []
+        return list(dict.fromkeys(r for r in map(self.parse_room, rooms) if r is not None))
+
+    async def subscribe(self, requested, since=None, since_seq=None):
+        # Membership can change after an earlier check, so always authorize
+        # the whole request against one fresh lookup
+        member_of = await self.get_room_ids(self.user)
+        allowed = [room_id for room_id in requested if room_id in member_of]
+        denied = [room_id for room_id in requested if room_id not in member_of]
+
+        new = [room_id for room_id in allowed if room_id not in self.rooms]
+        room_limit = max(settings.WS_MULTIPLEX_MAX_ROOMS - len(self.rooms), 0)
+        overflow = new[room_limit:]
+        if overflow:
+            new = new[:room_limit]
+            allowed = [room_id for room_id in allowed if room_id not in overflow]
+            denied += overflow
+
+        await self.join(new)
+        await self.send_json({'type': 'subscribed', 'rooms': allowed, 'denied': denied})
+
+        # Resume: {"since": {room_id: message id}} or {"since_seq": {room_id: seq}}
+        since = since if isinstance(since, dict) else {}
+        since_seq = since_seq if isinstance(since_seq, dict) else {}
+        for room_id in new:
+            await self.replay(
+                room_id,
+                after_id=self.parse_cursor(since.get(str(room_id), since.get(room_id))),
+                after_seq=self.parse_cursor(since_seq.get(str(room_id), since_seq.get(room_id))),
+            )
+
+    async def join(self, room_ids):
+        if not room_ids:
+            return
+        await asyncio.gather(*(
+            self.channel_layer.group_add(room_group(room_id), self.channel_name) for room_id in room_ids
+        ))
+        self.rooms.update(room_ids)
+        metrics.incr("ws.multiplex.subscriptions", len(room_ids))
+        await self.count_format(room_ids, 1)
+        await self.relay_add(room_ids)
+        await get_tracker().join(room_ids, self.user.id)
+
+    async def leave(self, room_ids):
+        if not room_ids:
+            return
+        await asyncio.gather(*(
+            self.channel_layer.group_discard(room_group(room_id), self.channel_name) for room_id in room_ids
+        ))
+        self.rooms.difference_update(room_ids)
+        metrics.incr("ws.multiplex.subscriptions", -len(room_ids))
+        await self.count_format(room_ids, -1)
+        await self.relay_remove(room_ids)
+        await get_tracker().leave(room_ids, self.user.id)
+
+    async def removed_from_room(self, room_id):
+        if room_id in self.rooms:
+            await self.leave([room_id])
+            await self.send_json({'type': 'unsubscribed', 'rooms': [room_id]})
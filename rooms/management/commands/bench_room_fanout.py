@@ -0,0 +1,82 @@
+import time
+
+import redis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from config import codec
+from rooms import pubsub
+
+
+def command_calls(client):
+    """Total commands Redis has executed (including those run by Lua scripts)."""
+    return sum(stats["calls"] for stats in client.info("commandstats").values())
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare Redis operations per message for group_send and pub/sub fan-out "
+        "to one large room. Needs the Redis channel layer; run against a scratch Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sockets", type=int, default=3000, help="Sockets subscribed to the room.")
+        parser.add_argument("--nodes", type=int, default=4, help="ASGI nodes the sockets are spread over.")
+        parser.add_argument("--messages", type=int, default=20, help="Messages to fan out.")
+
+    def handle(self, *args, **options):
+        layer = get_channel_layer()
+        if "redis" not in type(layer).__module__:
+            raise CommandError("bench_room_fanout needs the Redis channel layer.")
+        sockets, nodes, count = options["sockets"], options["nodes"], options["messages"]
+        client = redis.Redis.from_url(settings.REDIS_URL)
+        group = "room_bench"
+        channels = [f"bench-{i}" for i in range(sockets)]
+        event = {
+            "type": "fanout",
+            "room": 0,
+            "ids": [1],
+            "frames": codec.encode_frames([{"type": "message", "id": 1, "room": 0, "body": "x" * 200}]),
+        }
+
+        async def setup():
+            for channel in channels:
+                await layer.group_add(group, channel)
+
+        async def teardown():
+            for channel in channels:
+                await layer.group_discard(group, channel)
+
+        async def group_send():
+            for _ in range(count):
+                await layer.group_send(group, event)
+
+        def publish():
+            for _ in range(count):
+                pubsub.publish([(0, event)])
+
+        async_to_sync(setup)()
+        try:
+            results = {}
+            for name, run in (("group_send", async_to_sync(group_send)), ("pub/sub", publish)):
+                before = command_calls(client)
+                started = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - started
+                ops = command_calls(client) - before
+                results[name] = ops
+                self.stdout.write(
+                    f"{name:>10}: {ops / count:10.1f} Redis ops per message, {elapsed * 1000 / count:8.2f} ms per message"
+                )
+        finally:
+            async_to_sync(teardown)()
+
+        self.stdout.write(
+            f"pub/sub also costs one SUBSCRIBE per room per node ({nodes} here), paid once, "
+            f"and Redis pushes each message to {nodes} subscriber(s) instead of {sockets} lists."
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Redis ops per message: {results['group_send'] / count:.0f} -> {results['pub/sub'] / count:.0f}"
+        ))
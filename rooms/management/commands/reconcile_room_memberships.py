@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from orgs.models import Organization
+from rooms import membership
+
+
+class Command(BaseCommand):
+    help = "Reconcile role-derived (MANAGER_ONLY) room memberships with current org roles."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", type=int, action="append", dest="orgs", help="Only reconcile this org (repeatable).")
+
+    def handle(self, *args, **options):
+        orgs = Organization.objects.order_by("id").values_list("id", flat=True)
+        if options["orgs"]:
+            orgs = orgs.filter(id__in=options["orgs"])
+
+        for org_id in orgs.iterator():
+            added, removed = membership.reconcile_org(org_id)
+            if added or removed:
+                self.stdout.write(f"org {org_id}: +{len(added)} -{len(removed)} membership(s)")
+        self.stdout.write(self.style.SUCCESS("Reconciliation complete."))
@@ -0,0 +1,189 @@
+"""
+Set-based room membership engine.
+
+Works out who belongs in which auto-join room (PUBLIC: every org member,
+MANAGER_ONLY: managers and admins, PRIVATE: invite only) in SQL and inserts
+the memberships in chunks with ``bulk_create(ignore_conflicts=True)``.
+Bulk inserts skip the RoomMember signals, so member counts are recomputed
+and cached room ids invalidated for the touched rooms and users afterwards.
+
+Role changes are reconciled here too: membership of MANAGER_ONLY rooms is
+derived from the org role, so the expected set is diffed against the actual
+RoomMember rows and only the delta is written. PUBLIC rooms are never
+re-joined by reconciliation (members may leave them) and PRIVATE rooms are
+invite only.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from config import authz
+from config.realtime import broadcast
+from orgs.models import OrganizationMember
+from rooms import pubsub
+from rooms.models import Room, RoomMember
+from webhooks import events as webhook_events
+
+MANAGER_ROLES = {OrganizationMember.MANAGER, OrganizationMember.ADMIN}
+
+
+def auto_join_rooms(org_id, role):
+    """Rooms of an org a member with ``role`` joins automatically."""
+    access = Q(access_level=Room.PUBLIC)
+    if role in MANAGER_ROLES:
+        access |= Q(access_level=Room.MANAGER_ONLY)
+    return Room.objects.filter(access, org_id=org_id)
+
+
+def auto_join_members(room):
+    """Org memberships that belong in ``room`` automatically."""
+    if room.org_id is None or room.access_level == Room.PRIVATE:
+        return OrganizationMember.objects.none()
+    members = OrganizationMember.objects.filter(org_id=room.org_id)
+    if room.access_level == Room.MANAGER_ONLY:
+        members = members.filter(role__in=MANAGER_ROLES)
+    return members
+
+
+def add_members(pairs):
+    """Insert ``(room_id, user_id)`` memberships, skipping existing ones."""
+    pairs = list(pairs)
+    if not pairs:
+        return
+    with transaction.atomic():
+        webhook_events.members_joined(pairs, skip_existing=True)
+        RoomMember.objects.bulk_create(
+            [RoomMember(room_id=room_id, user_id=user_id) for room_id, user_id in pairs],
+            batch_size=settings.ROOM_MEMBERSHIP_CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+        refresh_member_counts({room_id for room_id, _ in pairs})
+    authz.invalidate_on_commit({user_id for _, user_id in pairs}, kinds=(authz.ROOMS,))
+
+
+def refresh_member_counts(room_ids):
+    room_ids = set(room_ids)
+    # Rooms that grow past the pub/sub threshold here get their sockets subscribed
+    small = room_ids.difference(pubsub.large_rooms(room_ids)) if pubsub.enabled() else ()
+    counts = (
+        RoomMember.objects.filter(room_id=OuterRef("pk"))
+        .order_by()
+        .values("room_id")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    Room.objects.filter(pk__in=room_ids).update(member_count=Coalesce(Subquery(counts), 0))
+    if small:
+        pubsub.announce_large(pubsub.large_rooms(small))
+
+
+def join_org_rooms(org_id, user_id, role):
+    """Add a (new) org member to every room their role auto-joins."""
+    room_ids = auto_join_rooms(org_id, role).values_list("id", flat=True)
+    add_members((room_id, user_id) for room_id in room_ids)
+
+
+def populate_room(room):
+    """
+    Add every eligible org member to a new room. Very large orgs are handed
+    to a Celery task once the room is committed.
+    """
+    members = auto_join_members(room)
+    if members.count() > settings.ROOM_MEMBERSHIP_ASYNC_THRESHOLD:
+        from rooms.tasks import populate_room_members
+
+        transaction.on_commit(lambda: populate_room_members.delay(room.id))
+        return
+    populate_room_now(room)
+
+
+def populate_room_now(room):
+    """Stream eligible user ids in keyset chunks and insert each chunk."""
+    members = auto_join_members(room)
+    chunk_size = settings.ROOM_MEMBERSHIP_CHUNK_SIZE
+    last_user_id = 0
+    while True:
+        user_ids = list(
+            members.filter(user_id__gt=last_user_id)
+            .order_by("user_id")
+            .values_list("user_id", flat=True)[:chunk_size]
+        )
+        if not user_ids:
+            break
+        with transaction.atomic():
+            webhook_events.members_joined(
+                [(room.id, user_id) for user_id in user_ids], org_ids={room.id: room.org_id}, skip_existing=True
+            )
+            RoomMember.objects.bulk_create(
+                [RoomMember(room_id=room.id, user_id=user_id) for user_id in user_ids],
+                ignore_conflicts=True,
+            )
+        authz.invalidate_on_commit(user_ids, kinds=(authz.ROOMS,))
+        last_user_id = user_ids[-1]
+    refresh_member_counts([room.id])
+
+
+def reconcile_member(org_id, user_id):
+    """Incremental reconciliation after one member's role changed."""
+    role = (
+        OrganizationMember.objects.filter(org_id=org_id, user_id=user_id)
+        .values_list("role", flat=True)
+        .first()
+    )
+    managed = Room.objects.filter(org_id=org_id, access_level=Room.MANAGER_ONLY)
+    expected = set(managed.values_list("id", flat=True)) if role in MANAGER_ROLES else set()
+    actual = set(
+        RoomMember.objects.filter(room__in=managed, user_id=user_id).values_list("room_id", flat=True)
+    )
+    return apply_deltas(
+        added=[(room_id, user_id) for room_id in expected - actual],
+        removed=[(room_id, user_id) for room_id in actual - expected],
+    )
+
+
+def reconcile_org(org_id):
+    """Org-wide batch reconciliation of every MANAGER_ONLY room."""
+    expected_users = OrganizationMember.objects.filter(org_id=org_id, role__in=MANAGER_ROLES).values("user_id")
+    added, removed = [], []
+    for room_id in Room.objects.filter(org_id=org_id, access_level=Room.MANAGER_ONLY).values_list("id", flat=True):
+        current = RoomMember.objects.filter(room_id=room_id)
+        added.extend(
+            (room_id, user_id)
+            for user_id in expected_users.exclude(user_id__in=current.values("user_id")).values_list("user_id", flat=True)
+        )
+        removed.extend(
+            (room_id, user_id)
+            for user_id in current.exclude(user_id__in=expected_users).values_list("user_id", flat=True)
+        )
+    return apply_deltas(added, removed)
+
+
+def apply_deltas(added, removed):
+    """Write membership deltas and announce them to the rooms' sockets."""
+    with transaction.atomic():
+        add_members(added)
+        if removed:
+            by_room = defaultdict(list)
+            for room_id, user_id in removed:
+                by_room[room_id].append(user_id)
+            condition = Q()
+            for room_id, user_ids in by_room.items():
+                condition |= Q(room_id=room_id, user_id__in=user_ids)
+            RoomMember.objects.filter(condition).delete()
+        transaction.on_commit(lambda: emit_deltas(added, removed))
+    return added, removed
+
+
+def emit_deltas(added, removed):
+    deltas = defaultdict(lambda: {"added": [], "removed": []})
+    for room_id, user_id in added:
+        deltas[room_id]["added"].append(user_id)
+    for room_id, user_id in removed:
+        deltas[room_id]["removed"].append(user_id)
+    broadcast(
+        (f"room_{room_id}", {"type": "membership_delta", "room": room_id, **delta})
+        for room_id, delta in deltas.items()
+    )
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-17 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0002_add_access_level_to_room'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='last_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='roommember',
+            name='last_read_seq',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
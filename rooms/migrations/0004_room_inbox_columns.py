@@ -0,0 +1,53 @@
+# Generated by Django 5.0.7 on 2026-10-17 17:37
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_inbox_columns(apps, schema_editor):
+    Room = apps.get_model("rooms", "Room")
+    RoomMember = apps.get_model("rooms", "RoomMember")
+    Message = apps.get_model("messages_app", "Message")
+
+    newest = Message.objects.filter(room_id=OuterRef("pk")).order_by("-id")
+    members = (
+        RoomMember.objects.filter(room_id=OuterRef("pk"))
+        .order_by()
+        .values("room_id")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    Room.objects.update(
+        last_message_id=Subquery(newest.values("id")[:1]),
+        last_activity_at=Coalesce(Subquery(newest.values("created_at")[:1]), F("created_at")),
+        member_count=Coalesce(Subquery(members), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rooms', '0003_room_last_seq'),
+        ('messages_app', '0002_message_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_inbox_columns, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 
 # Create your models here.
 from django.conf import settings
+from django.utils import timezone
 
 from orgs.models import Organization
 
@@ -21,6 +22,12 @@ class Room(models.Model):
     access_level = models.CharField(max_length=12, choices=ACCESS_CHOICES, default=PUBLIC)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="created_rooms")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Head of the per-room message sequence (seq of the newest message)
+    last_seq = models.BigIntegerField(default=0)
+    # Denormalized for the inbox; maintained on message create and membership changes
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    member_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         indexes = [
@@ -36,6 +43,7 @@ class RoomMember(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="memberships")
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="room_memberships")
     last_read_msg_id = models.BigIntegerField(null=True, blank=True)
+    last_read_seq = models.BigIntegerField(null=True, blank=True)
     joined_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -0,0 +1,123 @@
+"""
+Bounded per-connection outbound queue.
+
+Consumers hand frames to an ``OutboundQueue`` instead of awaiting the socket,
+and a writer task drains it. A slow client therefore only backs up its own
+queue, never the consumer's channel-layer inbox. When the queue is full:
+
+1. frames of a kind in ``WS_OUTBOUND_COLLAPSE_KINDS`` replace the queued
+   frame with the same key (e.g. the room's typing list), whether full or not;
+2. frames of a kind in ``WS_OUTBOUND_DROP_KINDS`` are dropped, and queued ones
+   are evicted to make room for anything else;
+3. if nothing can be evicted, ``put`` returns False and the consumer closes
+   the socket with 4008.
+
+``close_after`` queues a close behind the frames already queued, so the
+client still receives them (e.g. the membership change that evicted it).
+"""
+import asyncio
+import logging
+from collections import deque
+
+from config import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+CLOSE = "close"
+
+_total_depth = 0
+
+
+def _track_depth(delta):
+    global _total_depth
+    _total_depth += delta
+    metrics.gauge("ws.outbound.depth", _total_depth)
+
+
+class OutboundQueue:
+    def __init__(self, send, maxsize, drop_kinds=(), collapse_kinds=(), close=None):
+        self.send = send
+        self.close = close
+        self.maxsize = maxsize
+        self.drop_kinds = frozenset(drop_kinds)
+        self.collapse_kinds = frozenset(collapse_kinds)
+        self._items = deque()  # [kind, key, frame]
+        self._keyed = {}
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._drain())
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, frame, kind="event", key=None):
+        """Queue ``frame`` (``send`` kwargs); False means the client is too slow."""
+        if kind in self.collapse_kinds and key is not None:
+            queued = self._keyed.get((kind, key))
+            if queued is not None:
+                queued[2] = frame
+                metrics.incr("ws.outbound.collapsed")
+                return True
+
+        if len(self._items) >= self.maxsize:
+            if kind in self.drop_kinds:
+                metrics.incr("ws.outbound.dropped")
+                return True
+            if not self._evict():
+                metrics.incr("ws.outbound.overflows")
+                return False
+
+        entry = [kind, key, frame]
+        self._items.append(entry)
+        if kind in self.collapse_kinds and key is not None:
+            self._keyed[(kind, key)] = entry
+        _track_depth(1)
+        self._wakeup.set()
+        return True
+
+    def close_after(self, code):
+        """Queue a close with ``code`` behind pending frames; False if it cannot be queued."""
+        if self.close is None:
+            return False
+        return self.put({"code": code}, kind=CLOSE)
+
+    def _evict(self):
+        for entry in self._items:
+            if entry[0] in self.drop_kinds:
+                self._remove(entry)
+                self._items.remove(entry)
+                metrics.incr("ws.outbound.dropped")
+                return True
+        return False
+
+    def _remove(self, entry):
+        kind, key, _ = entry
+        if self._keyed.get((kind, key)) is entry:
+            del self._keyed[(kind, key)]
+        _track_depth(-1)
+
+    async def _drain(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._items:
+                entry = self._items.popleft()
+                self._remove(entry)
+                try:
+                    if entry[0] == CLOSE:
+                        await self.close(**entry[2])
+                    else:
+                        await self.send(**entry[2])
+                except Exception:
+                    logger.debug("Outbound send failed; stopping writer", exc_info=True)
+                    self.stop()
+                    return
+
+    def stop(self):
+        """Discard pending frames and stop the writer."""
+        _track_depth(-len(self._items))
+        self._items.clear()
+        self._keyed.clear()
+        if not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
@@ -0,0 +1,280 @@
+"""
+Who is online in each room, with heartbeat expiry.
+
+A store keeps one sorted set per room (``presence:room:{id}``) scored by the
+time each user's presence expires, and a hash (``presence:conns:{id}``) with
+each user's open connections across all nodes. Sockets refresh their rooms
+on every ``ping``; a user who stops heartbeating for ``PRESENCE_TTL`` seconds
+is swept out, which also clears connection counts left by a crashed node.
+Only changes are published: joins when a user becomes newly online, leaves
+when their last connection on any node closes or on expiry. They go to
+the room group as ``presence_delta`` events, so the cost is O(changes), never
+O(members).
+
+``PRESENCE_BACKEND`` picks Redis (shared by all nodes) or a process-local store
+for single-process deployments and tests.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from collections import Counter, defaultdict
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+from config import metrics
+from config.realtime import get_layer
+
+logger = logging.getLogger(__name__)
+
+# Mark a member online; return 1 if it was not (or had already expired)
+TOUCH_SCRIPT = """
+local old = redis.call('ZSCORE', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+if (not old) or tonumber(old) <= tonumber(ARGV[3]) then
+    return 1
+end
+return 0
+"""
+
+# Drop one connection; remove the member (returning 1) only once it has none left
+REMOVE_SCRIPT = """
+local left = redis.call('HINCRBY', KEYS[2], ARGV[1], -1)
+if left > 0 then
+    return 0
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+return redis.call('ZREM', KEYS[1], ARGV[1])
+"""
+
+# Remove and return expired members atomically, so only one node reports them
+EXPIRE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if #ids > 0 then
+    redis.call('ZREM', KEYS[1], unpack(ids))
+    redis.call('HDEL', KEYS[2], unpack(ids))
+end
+return ids
+"""
+
+
+def _key(room_id):
+    return f"presence:room:{room_id}"
+
+
+def _connections_key(room_id):
+    return f"presence:conns:{room_id}"
+
+
+class RedisPresenceStore:
+    def __init__(self, url, ttl):
+        self.url = url
+        self.ttl = ttl
+        self._sync = None
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = aioredis.from_url(self.url)
+        return client
+
+    async def connect(self, room_ids, user_id):
+        """Count one more open connection of ``user_id`` in each of ``room_ids``."""
+        async with self._client().pipeline(transaction=False) as pipe:
+            for room_id in room_ids:
+                pipe.hincrby(_connections_key(room_id), user_id, 1)
+                pipe.expire(_connections_key(room_id), max(int(self.ttl * 2), 1))
+            await pipe.execute()
+
+    async def touch(self, room_ids, user_id):
+        """Refresh ``user_id`` in ``room_ids``; return the rooms they newly joined."""
+        room_ids = list(room_ids)
+        if not room_ids:
+            return []
+        now = time.time()
+        client = self._client()
+        touch = client.register_script(TOUCH_SCRIPT)
+        async with client.pipeline(transaction=False) as pipe:
+            for room_id in room_ids:
+                await touch(keys=[_key(room_id), _connections_key(room_id)], args=[user_id, now + self.ttl, now, max(int(self.ttl * 2), 1)], client=pipe)
+            results = await pipe.execute()
+        return [room_id for room_id, new in zip(room_ids, results) if new]
+
+    async def remove(self, room_id, user_id):
+        """Close one connection; True if it was the user's last one and they went offline."""
+        client = self._client()
+        keys = [_key(room_id), _connections_key(room_id)]
+        return bool(await client.register_script(REMOVE_SCRIPT)(keys=keys, args=[user_id]))
+
+    async def expire(self, room_id):
+        client = self._client()
+        keys = [_key(room_id), _connections_key(room_id)]
+        ids = await client.register_script(EXPIRE_SCRIPT)(keys=keys, args=[time.time()])
+        return [int(user_id) for user_id in ids]
+
+    def online(self, room_id):
+        if self._sync is None:
+            self._sync = redis.Redis.from_url(self.url)
+        ids = self._sync.zrangebyscore(_key(room_id), time.time(), "+inf")
+        return sorted(int(user_id) for user_id in ids)
+
+
+class LocalPresenceStore:
+    """Same contract as ``RedisPresenceStore``, within one process."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._rooms = defaultdict(dict)  # room_id -> {user_id: expires_at}
+        self._connections = Counter()  # (room_id, user_id) -> open connections
+
+    async def connect(self, room_ids, user_id):
+        for room_id in room_ids:
+            self._connections[(room_id, user_id)] += 1
+
+    async def touch(self, room_ids, user_id):
+        now = time.monotonic()
+        joined = []
+        for room_id in room_ids:
+            if self._rooms[room_id].get(user_id, 0) <= now:
+                joined.append(room_id)
+            self._rooms[room_id][user_id] = now + self.ttl
+        return joined
+
+    async def remove(self, room_id, user_id):
+        self._connections[(room_id, user_id)] -= 1
+        if self._connections[(room_id, user_id)] > 0:
+            return False
+        del self._connections[(room_id, user_id)]
+        return self._rooms.get(room_id, {}).pop(user_id, None) is not None
+
+    async def expire(self, room_id):
+        now = time.monotonic()
+        users = self._rooms.get(room_id, {})
+        expired = [user_id for user_id, expires_at in users.items() if expires_at <= now]
+        for user_id in expired:
+            del users[user_id]
+            self._connections.pop((room_id, user_id), None)
+        return expired
+
+    def online(self, room_id):
+        now = time.monotonic()
+        return sorted(user_id for user_id, expires_at in self._rooms.get(room_id, {}).items() if expires_at > now)
+
+
+_stores = {}
+
+
+def get_store():
+    backend = settings.PRESENCE_BACKEND
+    store = _stores.get(backend)
+    if store is None:
+        if backend == "redis":
+            store = RedisPresenceStore(settings.PRESENCE_REDIS_URL, settings.PRESENCE_TTL)
+        elif backend == "local":
+            store = LocalPresenceStore(settings.PRESENCE_TTL)
+        else:
+            raise ValueError(f"Unknown PRESENCE_BACKEND {backend!r}")
+        _stores[backend] = store
+    return store
+
+
+def online(room_id):
+    """User ids currently online in a room."""
+    return get_store().online(room_id)
+
+
+class PresenceTracker:
+    """
+    This node's side of presence: registers connections with the store,
+    which counts them across nodes so a second tab (here or elsewhere) does
+    not announce a leave. It also tracks its own connections per
+    (room, user) to know which rooms to sweep for expired users.
+    """
+
+    def __init__(self, store, sweep_interval):
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self._connections = Counter()
+        self._sweeper = None
+
+    def _local_rooms(self):
+        return {room_id for room_id, _ in self._connections}
+
+    async def join(self, room_ids, user_id):
+        for room_id in room_ids:
+            self._connections[(room_id, user_id)] += 1
+        await self.store.connect(room_ids, user_id)
+        await self.heartbeat(room_ids, user_id)
+        if self._sweeper is None:
+            self._sweeper = asyncio.ensure_future(self._sweep_forever())
+
+    async def heartbeat(self, room_ids, user_id):
+        joined = await self.store.touch(room_ids, user_id)
+        if joined:
+            metrics.incr("presence.joins", len(joined))
+            await self._publish((room_id, [user_id], []) for room_id in joined)
+
+    async def leave(self, room_ids, user_id):
+        left = []
+        for room_id in room_ids:
+            self._connections[(room_id, user_id)] -= 1
+            if self._connections[(room_id, user_id)] <= 0:
+                del self._connections[(room_id, user_id)]
+            if await self.store.remove(room_id, user_id):
+                left.append(room_id)
+        if left:
+            metrics.incr("presence.leaves", len(left))
+            await self._publish((room_id, [], [user_id]) for room_id in left)
+
+    async def sweep(self):
+        deltas = []
+        for room_id in self._local_rooms():
+            expired = await self.store.expire(room_id)
+            if expired:
+                metrics.incr("presence.expired", len(expired))
+                deltas.append((room_id, [], expired))
+        await self._publish(deltas)
+
+    async def _sweep_forever(self):
+        try:
+            while self._connections:
+                await asyncio.sleep(self.sweep_interval)
+                try:
+                    await self.sweep()
+                except Exception:
+                    logger.exception("Presence sweep failed")
+        finally:
+            self._sweeper = None
+
+    async def _publish(self, deltas):
+        layer = get_layer()
+        if not layer:
+            return
+        for room_id, joined, left in deltas:
+            try:
+                await layer.group_send(f"room_{room_id}", {
+                    "type": "presence_delta",
+                    "room": room_id,
+                    "joined": joined,
+                    "left": left,
+                })
+            except Exception:
+                logger.exception("Failed to publish presence for room %s", room_id)
+
+
+_trackers = weakref.WeakKeyDictionary()
+
+
+def get_tracker():
+    """The tracker for the running event loop."""
+    loop = asyncio.get_running_loop()
+    tracker = _trackers.get(loop)
+    if tracker is None:
+        tracker = _trackers[loop] = PresenceTracker(get_store(), settings.PRESENCE_SWEEP_INTERVAL)
+    return tracker
@@ -0,0 +1,146 @@
+"""
+Pub/sub fan-out for very large rooms.
+
+``group_send`` on the Redis channel layer pushes one list entry per socket in
+the group, so its cost grows with the room. Rooms with at least
+``ROOM_PUBSUB_THRESHOLD`` members are fanned out differently: the sender
+PUBLISHes the event once to ``fanout:room:{id}``, every ASGI process holds a
+single subscription per room it has sockets in (``PubSubRelay``), and
+delivers the event to those sockets in-process.
+
+Sockets join the room group always, and the relay only for rooms at or
+above the threshold (``large_rooms``), so small rooms cost no subscriptions.
+When a room's member count crosses the threshold, ``announce_large`` tells
+its group and the sockets already connected subscribe then. A room that
+shrinks back keeps its subscriptions until the sockets leave; the sender
+picks exactly one path per event either way. A threshold of 0 disables
+pub/sub.
+"""
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.db import transaction
+
+from config import codec, metrics
+from config.realtime import broadcast
+from rooms.models import Room
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "fanout:room:"
+
+
+def topic(room_id):
+    return f"{CHANNEL_PREFIX}{room_id}"
+
+
+def enabled():
+    return settings.ROOM_PUBSUB_THRESHOLD > 0
+
+
+def use_pubsub(member_count):
+    return enabled() and member_count >= settings.ROOM_PUBSUB_THRESHOLD
+
+
+def large_rooms(room_ids):
+    """The rooms among ``room_ids`` that are fanned out over pub/sub."""
+    if not enabled() or not room_ids:
+        return []
+    return list(
+        Room.objects.filter(pk__in=room_ids, member_count__gte=settings.ROOM_PUBSUB_THRESHOLD)
+        .values_list("pk", flat=True)
+    )
+
+
+def announce_large(room_ids):
+    """Once committed, tell the sockets of rooms that just crossed the threshold to subscribe."""
+    room_ids = list(room_ids)
+    if room_ids:
+        transaction.on_commit(lambda: broadcast(
+            (f"room_{room_id}", {"type": "relay_subscribe", "room": room_id}) for room_id in room_ids
+        ))
+
+
+_client = None
+
+
+def publish(events):
+    """PUBLISH ``(room_id, event)`` pairs in one round trip."""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.ROOM_PUBSUB_REDIS_URL)
+    with _client.pipeline(transaction=False) as pipe:
+        for room_id, event in events:
+            pipe.publish(topic(room_id), codec.packb(event))
+        pipe.execute()
+    metrics.incr("fanout.pubsub.published", len(events))
+
+
+class PubSubRelay:
+    """One Redis subscription per room for every socket of this process."""
+
+    def __init__(self, url):
+        self.url = url
+        self._rooms = defaultdict(set)
+        self._pubsub = None
+        self._listener = None
+
+    async def add(self, room_id, consumer):
+        first = not self._rooms[room_id]
+        self._rooms[room_id].add(consumer)
+        if first:
+            if self._pubsub is None:
+                self._pubsub = aioredis.from_url(self.url).pubsub(ignore_subscribe_messages=True)
+            await self._pubsub.subscribe(topic(room_id))
+            if self._listener is None:
+                self._listener = asyncio.ensure_future(self._listen())
+
+    async def remove(self, room_id, consumer):
+        consumers = self._rooms.get(room_id)
+        if not consumers:
+            return
+        consumers.discard(consumer)
+        if not consumers:
+            del self._rooms[room_id]
+            await self._pubsub.unsubscribe(topic(room_id))
+
+    async def deliver(self, room_id, event):
+        for consumer in list(self._rooms.get(room_id, ())):
+            try:
+                await consumer.fanout(event)
+            except Exception:
+                logger.exception("Failed to deliver room %s fan-out to %s", room_id, consumer.channel_name)
+        metrics.incr("fanout.pubsub.delivered", len(self._rooms.get(room_id, ())))
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                room_id = int(message["channel"].decode()[len(CHANNEL_PREFIX):])
+                await self.deliver(room_id, codec.unpackb(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Pub/sub fan-out listener error")
+                await asyncio.sleep(1)
+
+
+_relays = weakref.WeakKeyDictionary()
+
+
+def get_relay():
+    """The relay for the running event loop, or None when pub/sub is off."""
+    if not enabled():
+        return None
+    loop = asyncio.get_running_loop()
+    relay = _relays.get(loop)
+    if relay is None:
+        relay = _relays[loop] = PubSubRelay(settings.ROOM_PUBSUB_REDIS_URL)
+    return relay
@@ -0,0 +1,126 @@
+"""
+Coalesced read cursors.
+
+Clients report reads on every scroll. ``mark_read`` only records the
+``(room, user, message)`` triple in a per-process buffer. Every
+``READ_CURSOR_FLUSH_INTERVAL_MS`` the buffer keeps the highest message per
+member and moves all of those cursors forward in one statement: an
+``UPDATE ... FROM (VALUES ...)`` on PostgreSQL, which also resolves each
+message's ``seq`` and ignores messages from other rooms. Cursors never move
+backwards.
+
+Members whose cursor actually moved are broadcast to their rooms as one
+``read_receipts`` event per room per flush, so receipts go out at most once
+per interval however often clients scroll.
+"""
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce, Greatest
+
+from config import metrics
+from config.batching import BatchBuffer
+from config.realtime import broadcast
+from messages_app.models import Message
+from rooms.models import RoomMember
+
+logger = logging.getLogger(__name__)
+
+_buffer = None
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = BatchBuffer(
+            _flush,
+            window=settings.READ_CURSOR_FLUSH_INTERVAL_MS / 1000,
+            max_size=settings.READ_CURSOR_MAX_BATCH,
+            name="read-cursors",
+        )
+    return _buffer
+
+
+def mark_read(room_id, user_id, msg_id):
+    """Queue moving a member's read cursor up to ``msg_id``; applied on the next flush."""
+    get_buffer().add((int(room_id), int(user_id), int(msg_id)))
+
+
+def flush():
+    """Apply every pending cursor now (tests, shutdown)."""
+    get_buffer().flush()
+
+
+def _flush(items):
+    latest = {}
+    for room_id, user_id, msg_id in items:
+        if msg_id > latest.get((room_id, user_id), 0):
+            latest[(room_id, user_id)] = msg_id
+    rows = [(room_id, user_id, msg_id) for (room_id, user_id), msg_id in latest.items()]
+
+    if connection.vendor == "postgresql":
+        advanced = _advance_values(rows)
+    else:
+        advanced = _advance_rows(rows)
+    metrics.incr("read_cursors.reported", len(items))
+    metrics.incr("read_cursors.advanced", len(advanced))
+    _send_receipts(advanced)
+
+
+def _advance_values(rows):
+    """One UPDATE for the whole batch; returns the cursors that moved."""
+    values = ", ".join(["(%s::bigint, %s::bigint, %s::bigint)"] * len(rows))
+    sql = f"""
+        UPDATE {RoomMember._meta.db_table} AS m
+        SET last_read_msg_id = v.msg_id,
+            last_read_seq = GREATEST(m.last_read_seq, msg.seq)
+        FROM (VALUES {values}) AS v (room_id, user_id, msg_id)
+        JOIN {Message._meta.db_table} AS msg ON msg.id = v.msg_id AND msg.room_id = v.room_id
+        WHERE m.room_id = v.room_id
+          AND m.user_id = v.user_id
+          AND (m.last_read_msg_id IS NULL OR m.last_read_msg_id < v.msg_id)
+        RETURNING m.room_id, m.user_id, m.last_read_msg_id, m.last_read_seq
+    """
+    params = [value for row in rows for value in row]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _advance_rows(rows):
+    """Portable fallback (SQLite in development): one UPDATE per cursor, one transaction."""
+    found = {
+        msg_id: (room_id, seq)
+        for msg_id, room_id, seq in Message.objects.filter(id__in=[row[2] for row in rows])
+        .values_list("id", "room_id", "seq")
+    }
+    advanced = []
+    with transaction.atomic():
+        for room_id, user_id, msg_id in rows:
+            msg_room_id, seq = found.get(msg_id, (None, None))
+            if msg_room_id != room_id:
+                continue
+            fields = {"last_read_msg_id": msg_id}
+            if seq is not None:
+                fields["last_read_seq"] = Greatest(Coalesce(F("last_read_seq"), 0), seq)
+            updated = RoomMember.objects.filter(
+                Q(last_read_msg_id__isnull=True) | Q(last_read_msg_id__lt=msg_id),
+                room_id=room_id,
+                user_id=user_id,
+            ).update(**fields)
+            if updated:
+                advanced.append((room_id, user_id, msg_id, seq))
+    return advanced
+
+
+def _send_receipts(advanced):
+    by_room = defaultdict(list)
+    for room_id, user_id, msg_id, seq in advanced:
+        by_room[room_id].append({"user": user_id, "last_read_msg_id": msg_id, "last_read_seq": seq})
+    broadcast(
+        (f"room_{room_id}", {"type": "read_receipts", "room": room_id, "cursors": cursors})
+        for room_id, cursors in by_room.items()
+    )
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from config import authz
+from rooms import pubsub
+from webhooks import events as webhook_events
+from .models import Room, RoomMember
+
+
+@receiver(post_save, sender=Room)
+def emit_room_created(sender, instance, created, **kwargs):
+    if created:
+        webhook_events.room_created(instance)
+
+
+@receiver(post_save, sender=RoomMember)
+def increment_member_count(sender, instance, created, **kwargs):
+    """Keep Room.member_count in step with single-row joins."""
+    if created:
+        Room.objects.filter(pk=instance.room_id).update(member_count=F("member_count") + 1)
+        if pubsub.enabled():
+            crossed = Room.objects.filter(pk=instance.room_id, member_count=settings.ROOM_PUBSUB_THRESHOLD)
+            pubsub.announce_large(crossed.values_list("pk", flat=True))
+        webhook_events.members_joined([(instance.room_id, instance.user_id)])
+
+
+@receiver(post_delete, sender=RoomMember)
+def decrement_member_count(sender, instance, **kwargs):
+    Room.objects.filter(pk=instance.room_id, member_count__gt=0).update(member_count=F("member_count") - 1)
+
+
+@receiver(post_save, sender=RoomMember)
+@receiver(post_delete, sender=RoomMember)
+def invalidate_cached_room_ids(sender, instance, **kwargs):
+    authz.invalidate_on_commit([instance.user_id], kinds=(authz.ROOMS,))
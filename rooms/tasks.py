@@ -0,0 +1,28 @@
+from celery import shared_task
+
+from orgs.models import Organization
+from rooms import membership
+from rooms.models import Room
+
+
+@shared_task
+def populate_room_members(room_id):
+    """Auto-join eligible org members to a room created in a very large org."""
+    room = Room.objects.filter(pk=room_id).first()
+    if room is not None:
+        membership.populate_room_now(room)
+
+
+@shared_task
+def reconcile_org_memberships(org_id):
+    """Org-wide reconciliation of role-derived room memberships."""
+    membership.reconcile_org(org_id)
+
+
+@shared_task
+def reconcile_room_memberships():
+    """Queue an org-wide reconciliation for every org (scheduled by celery beat)."""
+    org_ids = list(Organization.objects.order_by("id").values_list("id", flat=True))
+    for org_id in org_ids:
+        reconcile_org_memberships.delay(org_id)
+    return {"orgs": len(org_ids)}
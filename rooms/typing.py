@@ -0,0 +1,116 @@
+"""
+Per-node aggregation of typing indicators.
+
+Client ``typing`` frames only update this process's view of who is typing in
+each room. Every ``TYPING_SNAPSHOT_INTERVAL_MS`` the coalescer sends one
+``typing_snapshot`` per changed room, carrying the full list of this node's
+typers. Frames that do not change the state are suppressed, and entries expire
+after ``TYPING_TTL_MS`` without a refresh. Rooms with active typers are
+re-sent every half TTL, so consumers can drop a node's list once it goes
+quiet (for example if that node died).
+
+Consumers merge the snapshots of all nodes per room.
+"""
+import asyncio
+import logging
+import weakref
+
+from django.conf import settings
+
+from config import metrics
+from config.realtime import NODE_ID, get_layer
+
+logger = logging.getLogger(__name__)
+
+_coalescers = weakref.WeakKeyDictionary()
+
+
+class TypingCoalescer:
+    def __init__(self, interval, ttl):
+        self.interval = interval
+        self.ttl = ttl
+        self._rooms = {}  # room_id -> {user_id: (user_email, expires_at)}
+        self._dirty = set()
+        self._last_sent = {}
+        self._handle = None
+
+    def update(self, room_id, user_id, user_email, is_typing):
+        loop = asyncio.get_running_loop()
+        metrics.incr("typing.received")
+        if is_typing:
+            typers = self._rooms.setdefault(room_id, {})
+            changed = user_id not in typers
+            typers[user_id] = (user_email, loop.time() + self.ttl)
+        else:
+            changed = self._rooms.get(room_id, {}).pop(user_id, None) is not None
+        if changed:
+            self._mark_dirty(room_id)
+        else:
+            metrics.incr("typing.suppressed")
+
+    def forget(self, room_id, user_id):
+        """Drop a user who left (e.g. disconnected) without counting a frame."""
+        if self._rooms.get(room_id, {}).pop(user_id, None) is not None:
+            self._mark_dirty(room_id)
+
+    def _mark_dirty(self, room_id):
+        self._dirty.add(room_id)
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.interval, self._tick)
+
+    def _tick(self):
+        self._handle = None
+        now = asyncio.get_running_loop().time()
+        for room_id, typers in self._rooms.items():
+            expired = [user_id for user_id, (_, expires_at) in typers.items() if expires_at <= now]
+            for user_id in expired:
+                del typers[user_id]
+            if expired:
+                self._dirty.add(room_id)
+            elif typers and now - self._last_sent.get(room_id, 0) >= self.ttl / 2:
+                self._dirty.add(room_id)
+
+        events = []
+        for room_id in self._dirty:
+            typers = self._rooms.get(room_id, {})
+            events.append((f"room_{room_id}", {
+                "type": "typing_snapshot",
+                "room": room_id,
+                "node": NODE_ID,
+                "ttl": self.ttl,
+                "users": [{"user_id": user_id, "user_email": email} for user_id, (email, _) in typers.items()],
+            }))
+            self._last_sent[room_id] = now
+        self._dirty.clear()
+
+        for room_id in [room_id for room_id, typers in self._rooms.items() if not typers]:
+            del self._rooms[room_id]
+            self._last_sent.pop(room_id, None)
+        if self._rooms:
+            self._handle = asyncio.get_running_loop().call_later(self.interval, self._tick)
+        if events:
+            asyncio.ensure_future(self._send(events))
+
+    async def _send(self, events):
+        layer = get_layer()
+        if not layer:
+            return
+        for group, event in events:
+            try:
+                await layer.group_send(group, event)
+            except Exception:
+                logger.exception("Failed to send typing snapshot to %s", group)
+            else:
+                metrics.incr("typing.emitted")
+
+
+def get_coalescer():
+    """The coalescer for the running event loop."""
+    loop = asyncio.get_running_loop()
+    coalescer = _coalescers.get(loop)
+    if coalescer is None:
+        coalescer = _coalescers[loop] = TypingCoalescer(
+            interval=settings.TYPING_SNAPSHOT_INTERVAL_MS / 1000,
+            ttl=settings.TYPING_TTL_MS / 1000,
+        )
+    return coalescer
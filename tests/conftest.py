@@ -0,0 +1,16 @@
+import pytest
+from django.core.cache import cache
+
+from accounts import authentication
+from config import authz
+from webhooks import events as webhook_events
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Test databases reuse primary keys, so cached lookups must not outlive a test."""
+    cache.clear()
+    authz.clear_local()
+    authentication.clear_local()
+    webhook_events.clear_local()
+    yield
@@ -0,0 +1,106 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from messages_app.models import Message
+from messages_app.services import create_message
+from orgs.models import Organization
+from rooms.models import Room, RoomMember
+
+User = get_user_model()
+
+
+class UnreadCountsQueryTestCase(APITestCase):
+    """Test the set-based unread counts endpoint."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123")
+        self.other = User.objects.create_user(email="other@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.url = reverse("accounts_v1:auth-unread-counts")
+
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def make_room(self, messages=2):
+        room = Room.objects.create(name="Room", org=self.org, created_by=self.user)
+        RoomMember.objects.create(room=room, user=self.user)
+        RoomMember.objects.create(room=room, user=self.other)
+        for _ in range(messages):
+            create_message(room, self.other, body="hi")
+        return room
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_unread_is_head_minus_read_seq(self):
+        room = self.make_room(messages=3)
+        first = Message.objects.filter(room=room).order_by("id").first()
+        RoomMember.objects.filter(room=room, user=self.user).update(last_read_seq=first.seq)
+
+        _, response = self.count_queries()
+        row = response.data["unread_counts"][0]
+        self.assertEqual(row["head_seq"], 3)
+        self.assertEqual(row["unread_count"], 2)
+
+    def test_sending_marks_room_read_for_sender(self):
+        room = self.make_room(messages=3)
+        create_message(room, self.user, body="caught up")
+
+        _, response = self.count_queries()
+        self.assertEqual(response.data["unread_counts"][0]["unread_count"], 0)
+
+    def test_query_count_is_constant_in_number_of_rooms(self):
+        self.make_room()
+        self.client.get(self.url)  # warm the auth caches
+        baseline, _ = self.count_queries()
+
+        for _ in range(25):
+            self.make_room()
+        queries, response = self.count_queries()
+
+        self.assertEqual(len(response.data["unread_counts"]), 26)
+        self.assertEqual(queries, baseline)
+
+    def test_cap(self):
+        self.make_room(messages=5)
+        response = self.client.get(self.url, {"cap": 3})
+        self.assertEqual(response.data["unread_counts"][0]["unread_count"], "3+")
+
+        response = self.client.get(self.url, {"cap": 0})
+        self.assertEqual(response.data["unread_counts"][0]["unread_count"], 5)
+
+
+class CachedAuthenticationTestCase(APITestCase):
+    """Test that JWT auth is served from the user cache."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123", first_name="Old")
+        self.url = reverse("accounts_v1:auth-me")
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def test_steady_state_needs_no_queries(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["email"], "user@example.com")
+
+    def test_profile_change_invalidates(self):
+        self.client.get(self.url)
+        self.user.first_name = "New"
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).data["first_name"], "New")
+
+    def test_deactivation_rejects_token(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,625 @@
+import asyncio
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config import codec, metrics
+from config.asgi import websocket_urlpatterns
+from messages_app import pipeline, services
+from messages_app.models import Message
+from messages_app.services import create_message
+from messages_app.writer import MessageWriter
+from orgs.models import Organization
+from rooms import presence, pubsub, read_cursors
+from rooms.consumers import REMOVED_CLOSE_CODE
+from rooms.models import Room, RoomMember
+from rooms.outbound import OutboundQueue
+
+User = get_user_model()
+
+application = URLRouter(websocket_urlpatterns)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    PRESENCE_BACKEND="local",
+    ROOM_PUBSUB_THRESHOLD=0,
+)
+class SocketTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    def make_room(self, name, member=True):
+        room = Room.objects.create(name=name, org=self.org, created_by=self.user)
+        if member:
+            RoomMember.objects.create(room=room, user=self.user)
+        return room
+
+    def communicator(self, path="/ws/rooms/"):
+        return WebsocketCommunicator(application, f"{path}?token={self.token}")
+
+    async def receive_type(self, ws, frame_type, timeout=1):
+        """Next frame of ``frame_type``, skipping others (e.g. presence)."""
+        while True:
+            frame = await ws.receive_json_from(timeout=timeout)
+            if frame["type"] == frame_type:
+                return frame
+
+
+class MultiplexConsumerTestCase(SocketTestCase):
+    """Test one socket subscribed to many rooms."""
+
+    def test_subscribe_authorizes_in_batch_and_tags_events(self):
+        rooms = [self.make_room(f"Room {i}") for i in range(3)]
+        forbidden = self.make_room("Forbidden", member=False)
+
+        async def scenario():
+            ws = self.communicator()
+            connected, _ = await ws.connect()
+            self.assertTrue(connected)
+            self.assertEqual((await ws.receive_json_from())["type"], "connection")
+
+            await ws.send_json_to({"type": "subscribe", "rooms": [r.id for r in rooms] + [forbidden.id]})
+            reply = await self.receive_type(ws, "subscribed")
+            self.assertEqual(reply, {"type": "subscribed", "rooms": [r.id for r in rooms], "denied": [forbidden.id]})
+
+            layer = get_channel_layer()
+            await layer.group_send(f"room_{rooms[1].id}", {"type": "fanout", "room": rooms[1].id, "ids": [1], "frames": codec.encode_frames([{"type": "message", "room": rooms[1].id}])})
+            self.assertEqual((await self.receive_type(ws, "message"))["room"], rooms[1].id)
+
+            await ws.send_json_to({"type": "unsubscribe", "rooms": [rooms[1].id]})
+            self.assertEqual(await self.receive_type(ws, "unsubscribed"), {"type": "unsubscribed", "rooms": [rooms[1].id]})
+            await layer.group_send(f"room_{rooms[1].id}", {"type": "fanout", "room": rooms[1].id, "ids": [2], "frames": codec.encode_frames([{"type": "message"}])})
+            self.assertTrue(await ws.receive_nothing())
+            await ws.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_removal_unsubscribes_without_closing(self):
+        room = self.make_room("Room")
+
+        async def scenario():
+            ws = self.communicator()
+            await ws.connect()
+            await ws.receive_json_from()
+            await ws.send_json_to({"type": "subscribe", "rooms": [room.id]})
+            await self.receive_type(ws, "subscribed")
+
+            await get_channel_layer().group_send(
+                f"room_{room.id}", {"type": "membership_delta", "room": room.id, "added": [], "removed": [self.user.id]}
+            )
+            await self.receive_type(ws, "membership")
+            self.assertEqual(await self.receive_type(ws, "unsubscribed"), {"type": "unsubscribed", "rooms": [room.id]})
+            await ws.send_json_to({"type": "ping"})
+            self.assertEqual(await self.receive_type(ws, "pong"), {"type": "pong"})
+            await ws.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_removal_closes_a_single_room_socket(self):
+        room = self.make_room("Room")
+
+        async def scenario():
+            layer = get_channel_layer()
+            ws = self.communicator(f"/ws/rooms/{room.id}/")
+            await ws.connect()
+            await layer.group_send(
+                f"room_{room.id}", {"type": "membership_delta", "room": room.id, "added": [], "removed": [self.user.id]}
+            )
+            await self.receive_type(ws, "membership")
+            self.assertEqual(await ws.receive_output(), {"type": "websocket.close", "code": REMOVED_CLOSE_CODE})
+            return layer.groups.get(f"room_{room.id}", {})
+
+        self.assertEqual(async_to_sync(scenario)(), {})
+
+    def test_rejects_missing_token(self):
+        async def scenario():
+            ws = WebsocketCommunicator(application, "/ws/rooms/")
+            connected, code = await ws.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4001)
+
+        async_to_sync(scenario)()
+
+
+class MessageSendTestCase(SocketTestCase):
+    """Test message.send frames and the shared write buffer."""
+
+    def setUp(self):
+        super().setUp()
+        self.room = self.make_room("Room")
+        metrics.reset()
+        patcher = mock.patch.object(pipeline, "enqueue")
+        self.enqueue = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_sends_share_one_insert(self):
+        async def scenario():
+            sockets = [self.communicator(f"/ws/rooms/{self.room.id}/") for _ in range(2)]
+            for ws in sockets:
+                await ws.connect()
+                await ws.receive_json_from()
+            for i, ws in enumerate(sockets):
+                await ws.send_json_to({"type": "message.send", "body": f"Hello {i}", "client_id": f"c{i}"})
+            acks = [await self.receive_type(ws, "message.ack") for ws in sockets]
+            for ws in sockets:
+                await ws.disconnect()
+            return acks
+
+        with self.settings(MESSAGE_WS_WRITE_WINDOW_MS=50):
+            acks = async_to_sync(scenario)()
+
+        self.assertEqual([a["client_id"] for a in acks], ["c0", "c1"])
+        self.assertEqual(sorted(a["seq"] for a in acks), [1, 2])
+        self.assertEqual(metrics.get("messages.ws_writer.batches"), 1)
+        self.assertEqual(Message.objects.filter(room=self.room).count(), 2)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_seq, 2)
+        self.assertEqual(sorted(c.args[0] for c in self.enqueue.call_args_list), sorted(a["id"] for a in acks))
+
+    def test_invalid_frame_is_rejected(self):
+        async def scenario():
+            ws = self.communicator()
+            await ws.connect()
+            await ws.receive_json_from()
+            await ws.send_json_to({"type": "message.send", "room": self.room.id, "body": "hi", "client_id": "x"})
+            not_subscribed = await ws.receive_json_from()
+            await ws.send_json_to({"type": "subscribe", "rooms": [self.room.id]})
+            await self.receive_type(ws, "subscribed")
+            await ws.send_json_to({"type": "message.send", "room": self.room.id, "body": "  ", "client_id": "y"})
+            empty = await self.receive_type(ws, "message.error")
+            await ws.disconnect()
+            return not_subscribed, empty
+
+        not_subscribed, empty = async_to_sync(scenario)()
+        self.assertEqual((not_subscribed["type"], not_subscribed["client_id"]), ("message.error", "x"))
+        self.assertEqual((empty["type"], empty["client_id"]), ("message.error", "y"))
+        self.assertFalse(Message.objects.exists())
+
+    def test_bad_message_only_fails_its_own_sender(self):
+        outsider = User.objects.create_user(email="outsider@example.com", password="testpass123")
+        gone = self.make_room("Gone")
+        gone_id = gone.id
+        gone.delete()
+        messages_created = services.webhook_events.messages_created
+
+        def fail_on_poison(messages):
+            if any(msg.body == "poison" for msg in messages):
+                raise RuntimeError("insert failed")
+            messages_created(messages)
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            batch = [
+                (Message(room_id=room_id, sender_id=sender_id, body=body), loop.create_future())
+                for room_id, sender_id, body in [
+                    (self.room.id, self.user.id, "first"),
+                    (gone_id, self.user.id, "deleted room"),
+                    (self.room.id, outsider.id, "not a member"),
+                    (self.room.id, self.user.id, "poison"),
+                    (self.room.id, self.user.id, "last"),
+                ]
+            ]
+            await MessageWriter(window=1, max_size=10).flush(batch)
+            return [future.exception() or future.result() for _, future in batch]
+
+        with mock.patch.object(services.webhook_events, "messages_created", fail_on_poison):
+            first, deleted, outside, poison, last = async_to_sync(scenario)()
+
+        self.assertEqual(((first.body, first.seq), (last.body, last.seq)), (("first", 1), ("last", 2)))
+        self.assertIsInstance(deleted, Room.DoesNotExist)
+        self.assertIsInstance(outside, PermissionDenied)
+        self.assertIsInstance(poison, RuntimeError)
+        self.assertEqual(metrics.get("messages.ws_writer.fallbacks"), 1)
+        self.assertEqual(list(Message.objects.values_list("body", flat=True).order_by("seq")), ["first", "last"])
+
+
+class TypingCoalescingTestCase(SocketTestCase):
+    """Test that typing frames are aggregated into per-room snapshots."""
+
+    def setUp(self):
+        super().setUp()
+        self.room = self.make_room("Room")
+        metrics.reset()
+
+    def test_keystrokes_become_one_snapshot_then_expire(self):
+        async def scenario():
+            ws = self.communicator(f"/ws/rooms/{self.room.id}/")
+            await ws.connect()
+            await ws.receive_json_from()
+            for _ in range(10):
+                await ws.send_json_to({"type": "typing", "is_typing": True})
+            started = await self.receive_type(ws, "typing")
+            stopped = await self.receive_type(ws, "typing", timeout=2)
+            await ws.disconnect()
+            return started, stopped
+
+        with self.settings(TYPING_SNAPSHOT_INTERVAL_MS=50, TYPING_TTL_MS=300):
+            started, stopped = async_to_sync(scenario)()
+
+        self.assertEqual(
+            started,
+            {"type": "typing", "room": self.room.id, "users": [{"user_id": self.user.id, "user_email": self.user.email}]},
+        )
+        self.assertEqual(stopped, {"type": "typing", "room": self.room.id, "users": []})
+        self.assertEqual(metrics.get("typing.received"), 10)
+        self.assertEqual(metrics.get("typing.suppressed"), 9)
+        # Keepalive snapshots in between are not forwarded to the client unchanged
+        self.assertGreaterEqual(metrics.get("typing.emitted"), 2)
+
+
+class PresenceTestCase(SocketTestCase):
+    """Test presence deltas and heartbeat expiry."""
+
+    def setUp(self):
+        super().setUp()
+        self.room = self.make_room("Room")
+        self.other = User.objects.create_user(email="other@example.com", password="testpass123")
+        RoomMember.objects.create(room=self.room, user=self.other)
+        self.other_token = str(RefreshToken.for_user(self.other).access_token)
+        self.path = f"/ws/rooms/{self.room.id}/"
+
+    def connect_other(self):
+        return WebsocketCommunicator(application, f"{self.path}?token={self.other_token}")
+
+    def test_join_and_leave_deltas(self):
+        async def scenario():
+            ws = self.communicator(self.path)
+            await ws.connect()
+            own = await self.receive_type(ws, "presence")
+
+            other = self.connect_other()
+            await other.connect()
+            joined = await self.receive_type(ws, "presence")
+            online = presence.online(self.room.id)
+
+            # A heartbeat from someone already online publishes nothing
+            await other.send_json_to({"type": "ping"})
+            await self.receive_type(other, "pong")
+            self.assertTrue(await ws.receive_nothing())
+
+            await other.disconnect()
+            left = await self.receive_type(ws, "presence")
+            await ws.disconnect()
+            return own, joined, online, left
+
+        own, joined, online, left = async_to_sync(scenario)()
+        self.assertEqual(own, {"type": "presence", "room": self.room.id, "joined": [self.user.id], "left": []})
+        self.assertEqual((joined["joined"], joined["left"]), ([self.other.id], []))
+        self.assertEqual(online, sorted([self.user.id, self.other.id]))
+        self.assertEqual((left["joined"], left["left"]), ([], [self.other.id]))
+
+    def test_leave_waits_for_connections_on_other_nodes(self):
+        store = presence.LocalPresenceStore(ttl=60)
+        nodes = [presence.PresenceTracker(store, sweep_interval=60) for _ in range(2)]
+
+        async def scenario():
+            for node in nodes:
+                await node.join([self.room.id], self.user.id)
+            await nodes[0].leave([self.room.id], self.user.id)
+            still_online = store.online(self.room.id)
+            await nodes[1].leave([self.room.id], self.user.id)
+            return still_online, store.online(self.room.id)
+
+        with mock.patch.object(presence.PresenceTracker, "_publish", autospec=True) as publish:
+            still_online, online = async_to_sync(scenario)()
+        self.assertEqual((still_online, online), ([self.user.id], []))
+        # One join and one leave, however many nodes the user was connected to
+        deltas = [list(call.args[1]) for call in publish.call_args_list]
+        self.assertEqual(deltas, [[(self.room.id, [self.user.id], [])], [(self.room.id, [], [self.user.id])]])
+
+    def test_silent_connection_expires(self):
+        async def scenario():
+            ws = self.communicator(self.path)
+            await ws.connect()
+            other = self.connect_other()
+            await other.connect()
+            await self.receive_type(ws, "presence")
+            await self.receive_type(ws, "presence")
+
+            # Only the first socket keeps heartbeating
+            for _ in range(4):
+                await asyncio.sleep(0.1)
+                await ws.send_json_to({"type": "ping"})
+            expired = await self.receive_type(ws, "presence")
+            await other.disconnect()
+            await ws.disconnect()
+            return expired
+
+        with self.settings(PRESENCE_TTL=0.25, PRESENCE_SWEEP_INTERVAL=0.05):
+            presence._stores.clear()
+            expired = async_to_sync(scenario)()
+        presence._stores.clear()
+        self.assertEqual(expired["left"], [self.other.id])
+
+
+class FrameFormatTestCase(SocketTestCase):
+    """Test pre-encoded fan-out in both wire formats."""
+
+    def test_msgpack_subprotocol_gets_binary_frames(self):
+        room = self.make_room("Room")
+        payload = {"type": "message", "room": room.id, "body": "hi"}
+        frames = codec.encode_frames([payload])
+        self.assertEqual(list(frames), [codec.JSON])
+        metrics.reset()
+
+        async def scenario():
+            ws = WebsocketCommunicator(application, f"/ws/rooms/{room.id}/?token={self.token}", subprotocols=["msgpack"])
+            connected, subprotocol = await ws.connect()
+            self.assertEqual(subprotocol, "msgpack")
+            await ws.send_to(bytes_data=codec.packb({"type": "ping"}))
+            while True:
+                frame = codec.unpackb(await ws.receive_from())
+                if frame["type"] == "pong":
+                    break
+
+            await get_channel_layer().group_send(f"room_{room.id}", {"type": "fanout", "room": room.id, "ids": [1], "frames": frames})
+            while True:
+                raw = await ws.receive_output(timeout=1)
+                if raw.get("bytes") == codec.packb(payload):
+                    break
+            await ws.disconnect()
+
+        async_to_sync(scenario)()
+        # The event predates the socket's count, so its frames were transcoded
+        self.assertEqual(metrics.get("ws.frames.transcoded"), 1)
+
+    def test_sender_encodes_msgpack_only_for_rooms_with_msgpack_sockets(self):
+        room, quiet = self.make_room("Room"), self.make_room("Quiet")
+        with mock.patch.object(pipeline, "enqueue"):
+            msg = create_message(room, self.user, body="hi")
+        msg = Message.objects.select_related("room").get(pk=msg.pk)
+        metrics.reset()
+
+        async def scenario():
+            ws = WebsocketCommunicator(application, f"/ws/rooms/{room.id}/?token={self.token}", subprotocols=["msgpack"])
+            await ws.connect()
+            formats = await database_sync_to_async(codec.room_formats)([room.id, quiet.id])
+            await database_sync_to_async(pipeline.fanout_messages)([msg])
+            while True:
+                raw = await ws.receive_output(timeout=1)
+                if raw.get("bytes") == codec.packb(pipeline.message_payload(msg)):
+                    break
+            await ws.disconnect()
+            return formats
+
+        formats = async_to_sync(scenario)()
+        self.assertEqual(formats, {room.id: codec.FORMATS, quiet.id: (codec.JSON,)})
+        self.assertEqual(metrics.get("ws.frames.transcoded"), 0)
+        self.assertEqual(codec.room_formats([room.id]), {room.id: (codec.JSON,)})
+
+
+class OutboundQueueTestCase(SimpleTestCase):
+    """Test the slow-consumer policies of the per-socket outbound queue."""
+
+    def run_with_stalled_client(self, scenario):
+        async def run():
+            sent, gate = [], asyncio.Event()
+
+            async def send(**frame):
+                await gate.wait()
+                sent.append(frame["text_data"])
+
+            queue = OutboundQueue(send, maxsize=3, drop_kinds=["typing"], collapse_kinds=["typing"])
+            await asyncio.sleep(0)
+            result = scenario(queue)
+            gate.set()
+            for _ in range(10):
+                await asyncio.sleep(0)
+            queue.stop()
+            return result, sent
+
+        metrics.reset()
+        return async_to_sync(run)()
+
+    def test_typing_collapses_and_is_shed_first(self):
+        def scenario(queue):
+            queue.put({"text_data": "m1"}, kind="message")
+            queue.put({"text_data": "t1"}, kind="typing", key=1)
+            queue.put({"text_data": "t2"}, kind="typing", key=1)  # replaces t1
+            queue.put({"text_data": "p1"}, kind="presence")
+            return queue.put({"text_data": "m2"}, kind="message")  # evicts the typing frame
+
+        accepted, sent = self.run_with_stalled_client(scenario)
+        self.assertTrue(accepted)
+        self.assertEqual(sent, ["m1", "p1", "m2"])
+        self.assertEqual(metrics.get("ws.outbound.collapsed"), 1)
+        self.assertEqual(metrics.get("ws.outbound.dropped"), 1)
+        self.assertEqual(metrics.get("ws.outbound.depth"), 0)
+
+    def test_overflow_without_sheddable_frames_rejects(self):
+        def scenario(queue):
+            accepted = [queue.put({"text_data": f"m{i}"}, kind="message") for i in range(4)]
+            accepted.append(queue.put({"text_data": "t"}, kind="typing", key=1))
+            return accepted
+
+        accepted, sent = self.run_with_stalled_client(scenario)
+        self.assertEqual(accepted, [True, True, True, False, True])
+        self.assertEqual(metrics.get("ws.outbound.overflows"), 1)
+        self.assertEqual(metrics.get("ws.outbound.dropped"), 1)
+
+
+class ReplayTestCase(SocketTestCase):
+    """Test resuming a room socket from the last seen message."""
+
+    def setUp(self):
+        super().setUp()
+        self.room = self.make_room("Room")
+        with mock.patch.object(pipeline, "enqueue"):
+            self.messages = [create_message(self.room, self.user, body=f"m{i}") for i in range(5)]
+
+    def connect_and_receive(self, query, frame_type):
+        async def scenario():
+            ws = self.communicator(f"/ws/rooms/{self.room.id}/")
+            ws.scope["query_string"] += f"&{query}".encode()
+            await ws.connect()
+            frame = await self.receive_type(ws, frame_type)
+            await ws.disconnect()
+            return frame
+
+        return async_to_sync(scenario)()
+
+    def test_replays_missed_messages_from_cache(self):
+        frame = self.connect_and_receive(f"since={self.messages[2].id}", "replay")
+        self.assertEqual([m["body"] for m in frame["messages"]], ["m3", "m4"])
+        self.assertEqual(frame["messages"][0]["type"], "message")
+
+        frame = self.connect_and_receive(f"since_seq={self.messages[3].seq}", "replay")
+        self.assertEqual([m["body"] for m in frame["messages"]], ["m4"])
+
+    def test_gap_larger_than_buffer_requires_resync(self):
+        with self.settings(MESSAGE_CACHE_SIZE=2):
+            frame = self.connect_and_receive(f"since={self.messages[0].id}", "resync_required")
+        self.assertEqual(frame, {"type": "resync_required", "room": self.room.id})
+
+    def test_multiplex_subscribe_resumes(self):
+        async def scenario():
+            ws = self.communicator()
+            await ws.connect()
+            await ws.send_json_to({"type": "subscribe", "rooms": [self.room.id], "since": {str(self.room.id): self.messages[3].id}})
+            frame = await self.receive_type(ws, "replay")
+            await ws.disconnect()
+            return frame
+
+        frame = async_to_sync(scenario)()
+        self.assertEqual([m["id"] for m in frame["messages"]], [self.messages[4].id])
+
+
+class PubSubRelayTestCase(SimpleTestCase):
+    """Test the per-process relay behind pub/sub fan-out."""
+
+    def test_one_subscription_per_room_shared_by_sockets(self):
+        async def scenario():
+            redis_pubsub = mock.Mock()
+            redis_pubsub.subscribe = mock.AsyncMock()
+            redis_pubsub.unsubscribe = mock.AsyncMock()
+
+            async def get_message(**kwargs):
+                await asyncio.sleep(0.01)
+
+            redis_pubsub.get_message = get_message
+            sockets = [mock.Mock(channel_name=f"c{i}", fanout=mock.AsyncMock()) for i in range(3)]
+
+            with mock.patch("rooms.pubsub.aioredis.from_url") as from_url:
+                from_url.return_value.pubsub.return_value = redis_pubsub
+                relay = pubsub.PubSubRelay("redis://test")
+                for socket in sockets[:2]:
+                    await relay.add(7, socket)
+                await relay.add(8, sockets[2])
+                await relay.deliver(7, {"type": "fanout", "room": 7})
+                for socket in sockets[:2]:
+                    await relay.remove(7, socket)
+                relay._listener.cancel()
+            return redis_pubsub, sockets
+
+        metrics.reset()
+        redis_pubsub, sockets = async_to_sync(scenario)()
+        self.assertEqual(
+            [call.args for call in redis_pubsub.subscribe.await_args_list],
+            [(pubsub.topic(7),), (pubsub.topic(8),)],
+        )
+        redis_pubsub.unsubscribe.assert_awaited_once_with(pubsub.topic(7))
+        for socket in sockets[:2]:
+            socket.fanout.assert_awaited_once_with({"type": "fanout", "room": 7})
+        sockets[2].fanout.assert_not_awaited()
+        self.assertEqual(metrics.get("fanout.pubsub.delivered"), 2)
+
+
+@override_settings(ROOM_PUBSUB_THRESHOLD=3)
+class LargeRoomRelayTestCase(SocketTestCase):
+    """Test which sockets subscribe to pub/sub fan-out."""
+
+    def setUp(self):
+        super().setUp()
+        self.relay = mock.Mock(add=mock.AsyncMock(), remove=mock.AsyncMock())
+        patcher = mock.patch("rooms.consumers.get_relay", return_value=self.relay)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics.reset()
+
+    def test_only_large_rooms_are_relayed(self):
+        small, large = self.make_room("Small"), self.make_room("Large")
+        Room.objects.filter(pk=large.pk).update(member_count=3)
+
+        async def scenario():
+            ws = self.communicator()
+            await ws.connect()
+            await ws.send_json_to({"type": "subscribe", "rooms": [small.id, large.id]})
+            await self.receive_type(ws, "subscribed")
+            await ws.disconnect()
+
+        async_to_sync(scenario)()
+        self.assertEqual([call.args[0] for call in self.relay.add.await_args_list], [large.id])
+
+    def test_room_crossing_the_threshold_subscribes_its_sockets(self):
+        room = self.make_room("Room")
+        others = [User.objects.create_user(email=f"u{i}@example.com", password="testpass123") for i in range(2)]
+
+        async def scenario():
+            ws = self.communicator(f"/ws/rooms/{room.id}/")
+            await ws.connect()
+            await self.receive_type(ws, "connection")
+            self.relay.add.assert_not_awaited()
+            for user in others:
+                await database_sync_to_async(RoomMember.objects.create)(room=room, user=user)
+            await ws.send_json_to({"type": "ping"})
+            await self.receive_type(ws, "pong")
+            await ws.disconnect()
+
+        async_to_sync(scenario)()
+        self.relay.add.assert_awaited_once()
+        self.assertEqual(self.relay.add.await_args.args[0], room.id)
+
+    def test_relay_failure_does_not_fail_the_connect(self):
+        room = self.make_room("Room")
+        Room.objects.filter(pk=room.pk).update(member_count=5)
+        self.relay.add.side_effect = ConnectionError("redis down")
+
+        async def scenario():
+            ws = self.communicator(f"/ws/rooms/{room.id}/")
+            connected, _ = await ws.connect()
+            frame = await self.receive_type(ws, "connection")
+            await ws.disconnect()
+            return connected, frame
+
+        connected, frame = async_to_sync(scenario)()
+        self.assertTrue(connected)
+        self.assertEqual(frame["user_id"], self.user.id)
+        self.assertEqual(metrics.get("fanout.pubsub.relay_errors"), 1)
+
+
+class ReadReceiptTestCase(SocketTestCase):
+    """Test read frames over the socket and the receipts they produce."""
+
+    def test_read_frame_advances_cursor_and_broadcasts_receipt(self):
+        room = self.make_room("Room")
+        with mock.patch.object(pipeline, "enqueue"):
+            msg = create_message(room, self.user, body="hi")
+        RoomMember.objects.filter(room=room, user=self.user).update(last_read_msg_id=None, last_read_seq=None)
+
+        async def scenario():
+            ws = self.communicator()
+            await ws.connect()
+            await ws.send_json_to({"type": "subscribe", "rooms": [room.id]})
+            await self.receive_type(ws, "subscribed")
+            await ws.send_json_to({"type": "read", "room": room.id, "id": msg.id})
+            await ws.send_json_to({"type": "ping"})
+            await self.receive_type(ws, "pong")
+            await database_sync_to_async(read_cursors.flush)()
+            frame = await self.receive_type(ws, "read_receipts")
+            await ws.disconnect()
+            return frame
+
+        frame = async_to_sync(scenario)()
+        self.assertEqual(frame["cursors"], [{"user": self.user.id, "last_read_msg_id": msg.id, "last_read_seq": msg.seq}])
+        self.assertEqual(RoomMember.objects.get(room=room, user=self.user).last_read_msg_id, msg.id)
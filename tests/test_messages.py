@@ -0,0 +1,280 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config import codec, metrics
+from messages_app import cache as message_cache, pipeline
+from messages_app.models import Message
+from messages_app.services import create_message
+from notifications.models import Notification
+from orgs.models import Organization
+from rooms.models import Room, RoomMember
+
+User = get_user_model()
+
+
+class MessagePipelineTestCase(APITestCase):
+    """Test the post-commit message side-effect pipeline."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="sender@example.com", password="testpass123")
+        self.other = User.objects.create_user(email="reader@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.room = Room.objects.create(name="Room A", org=self.org, created_by=self.user)
+        self.room_b = Room.objects.create(name="Room B", org=self.org, created_by=self.user)
+        for room in (self.room, self.room_b):
+            RoomMember.objects.create(room=room, user=self.user)
+            RoomMember.objects.create(room=room, user=self.other)
+
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def test_create_defers_side_effects_until_commit(self):
+        url = reverse("messages_v1:room-messages", kwargs={"room_id": self.room.id})
+        with mock.patch.object(pipeline, "enqueue") as enqueue:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                response = self.client.post(url, {"body": "Hello"})
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            enqueue.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+        enqueue.assert_called_once_with(response.data["id"])
+        self.assertEqual(Notification.objects.count(), 0)
+
+    def test_process_batch_groups_fanout_and_notifications(self):
+        msgs = [
+            Message.objects.create(room=self.room, sender=self.user, body="one", org=self.org),
+            Message.objects.create(room=self.room, sender=self.user, body="two", org=self.org),
+            Message.objects.create(room=self.room_b, sender=self.user, body="three", org=self.org),
+        ]
+        layer = mock.Mock()
+        layer.group_send = mock.AsyncMock()
+
+        with mock.patch("config.realtime.get_channel_layer", return_value=layer):
+            pipeline.process_batch([m.id for m in msgs])
+
+        # One group event per room, carrying every payload of the batch pre-encoded
+        self.assertEqual(layer.group_send.await_count, 2)
+        sent = {
+            call.args[0]: [codec.loads(frame) for frame in call.args[1]["frames"][codec.JSON]]
+            for call in layer.group_send.await_args_list
+        }
+        self.assertEqual([p["body"] for p in sent[f"room_{self.room.id}"]], ["one", "two"])
+        self.assertEqual([p["body"] for p in sent[f"room_{self.room_b.id}"]], ["three"])
+
+        # Sender is never notified about their own messages
+        self.assertEqual(Notification.objects.filter(user=self.other).count(), 3)
+        self.assertFalse(Notification.objects.filter(user=self.user).exists())
+
+    def test_large_rooms_are_published_once_over_pubsub(self):
+        Room.objects.filter(pk=self.room.pk).update(member_count=5)
+        msgs = [
+            Message.objects.create(room=self.room, sender=self.user, body="big", org=self.org),
+            Message.objects.create(room=self.room_b, sender=self.user, body="small", org=self.org),
+        ]
+        layer = mock.Mock()
+        layer.group_send = mock.AsyncMock()
+
+        with self.settings(ROOM_PUBSUB_THRESHOLD=5), \
+                mock.patch("config.realtime.get_channel_layer", return_value=layer), \
+                mock.patch("rooms.pubsub.publish") as publish:
+            pipeline.process_batch([m.id for m in msgs])
+
+        (published,), _ = publish.call_args
+        self.assertEqual([room_id for room_id, _ in published], [self.room.id])
+        self.assertEqual(layer.group_send.await_count, 1)
+        self.assertEqual(layer.group_send.await_args.args[0], f"room_{self.room_b.id}")
+
+        # A Redis outage degrades to channel-layer groups rather than losing messages
+        layer.group_send.reset_mock()
+        with self.settings(ROOM_PUBSUB_THRESHOLD=5), \
+                mock.patch("config.realtime.get_channel_layer", return_value=layer), \
+                mock.patch("rooms.pubsub.publish", side_effect=ConnectionError):
+            pipeline.process_batch([msgs[0].id])
+        self.assertEqual(layer.group_send.await_args.args[0], f"room_{self.room.id}")
+
+
+class MessageHistoryPaginationTestCase(APITestCase):
+    """Test keyset cursor pagination of room history."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.room = Room.objects.create(name="Test Room", org=self.org, created_by=self.user)
+        RoomMember.objects.create(room=self.room, user=self.user)
+        self.ids = [
+            Message.objects.create(room=self.room, sender=self.user, body=f"Message {i}", org=self.org).id
+            for i in range(7)
+        ]
+        self.url = reverse("messages_v1:room-messages", kwargs={"room_id": self.room.id})
+
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def test_walks_history_with_opaque_cursors(self):
+        response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        self.assertIsNone(response.data["previous"])
+        self.assertEqual([m["id"] for m in response.data["results"]], self.ids[:-4:-1])
+
+        seen = [m["id"] for m in response.data["results"]]
+        next_url = response.data["next"]
+        while next_url:
+            response = self.client.get(next_url)
+            seen.extend(m["id"] for m in response.data["results"])
+            next_url = response.data["next"]
+        self.assertEqual(seen, self.ids[::-1])
+
+        # Walking back up from the oldest page returns the newer messages
+        response = self.client.get(response.data["previous"])
+        self.assertEqual([m["id"] for m in response.data["results"]], self.ids[3:0:-1])
+
+    def test_around_centres_on_message(self):
+        response = self.client.get(self.url, {"around": self.ids[3], "limit": 4})
+        self.assertEqual([m["id"] for m in response.data["results"]], self.ids[5:1:-1])
+        self.assertIsNotNone(response.data["next"])
+        self.assertIsNotNone(response.data["previous"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RoomMessageCacheTestCase(APITestCase):
+    """Test the per-room hot cache behind the newest history page."""
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.room = Room.objects.create(name="Test Room", org=self.org, created_by=self.user)
+        RoomMember.objects.create(room=self.room, user=self.user)
+        for i in range(3):
+            Message.objects.create(room=self.room, sender=self.user, body=f"Message {i}", org=self.org)
+        self.url = reverse("messages_v1:room-messages", kwargs={"room_id": self.room.id})
+
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def test_second_open_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(len(first.data["results"]), 3)
+        self.assertEqual(metrics.get("messages.cache.misses"), 1)
+
+        # Auth user and membership are both cached
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.data["results"], first.data["results"])
+        self.assertEqual(metrics.get("messages.cache.hits"), 1)
+
+    def test_new_message_is_written_through(self):
+        self.client.get(self.url)
+        with mock.patch.object(pipeline, "enqueue"):
+            with self.captureOnCommitCallbacks(execute=True):
+                created = self.client.post(self.url, {"body": "Fresh"})
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["results"][0]["id"], created.data["id"])
+        self.assertEqual(metrics.get("messages.cache.hits"), 1)
+
+    def test_delete_invalidates_room(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.filter(room=self.room).first().delete()
+
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertEqual(metrics.get("messages.cache.misses"), 2)
+
+    def test_push_during_fill_is_not_lost(self):
+        write = message_cache._write
+        fresh = []
+
+        def commit_then_write(room_id, update):
+            # A message commits after the fill's SELECT but before its cache write
+            if not fresh:
+                fresh.append(Message.objects.create(room=self.room, sender=self.user, body="Racing", org=self.org))
+                message_cache.push(self.room.id, fresh)
+            write(room_id, update)
+
+        with mock.patch.object(message_cache, "_write", commit_then_write):
+            message_cache.fill(self.room.id)
+        self.assertIsNone(message_cache.first_page(self.room.id, 2))
+        self.assertEqual(metrics.get("messages.cache.stale_fills"), 1)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["results"][0]["id"], fresh[0].id)
+
+    def test_ring_buffer_evicts_oldest(self):
+        with self.settings(MESSAGE_CACHE_SIZE=4):
+            self.client.get(self.url, {"limit": 2})
+            extra = [
+                Message.objects.create(room=self.room, sender=self.user, body=f"More {i}", org=self.org)
+                for i in range(3)
+            ]
+            message_cache.push(self.room.id, extra)
+            entries = message_cache.first_page(self.room.id, 2)
+        self.assertEqual([e["id"] for e in entries], [m.id for m in extra[::-1]])
+        self.assertEqual(metrics.get("messages.cache.evictions"), 2)
+
+
+class MessageSequenceTestCase(APITestCase):
+    """Test per-room message sequence numbers."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.room = Room.objects.create(name="Room A", org=self.org, created_by=self.user)
+        self.room_b = Room.objects.create(name="Room B", org=self.org, created_by=self.user)
+        RoomMember.objects.create(room=self.room, user=self.user)
+
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def test_seq_is_per_room_and_returned_by_api(self):
+        url = reverse("messages_v1:room-messages", kwargs={"room_id": self.room.id})
+        with mock.patch.object(pipeline, "enqueue"):
+            first = self.client.post(url, {"body": "one"})
+            second = self.client.post(url, {"body": "two"})
+        other = create_message(self.room_b, self.user, body="elsewhere")
+
+        self.assertEqual((first.data["seq"], second.data["seq"]), (1, 2))
+        self.assertEqual(other.seq, 1)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_seq, 2)
+        self.assertEqual(RoomMember.objects.get(room=self.room, user=self.user).last_read_seq, 2)
+        self.assertEqual(pipeline.message_payload(other)["seq"], 1)
+
+    def test_backfill_numbers_legacy_messages_below_live_ones(self):
+        reader = User.objects.create_user(email="reader@example.com", password="testpass123")
+        legacy = [Message.objects.create(room=self.room, sender=self.user, body=f"old {i}", org=self.org) for i in range(3)]
+        RoomMember.objects.create(room=self.room, user=reader, last_read_msg_id=legacy[1].id)
+        live = create_message(self.room, self.user, body="new")
+        self.assertEqual(live.seq, 1)
+        message_cache.fill(self.room.id)
+
+        call_command("backfill_message_seq", chunk_size=2, stdout=StringIO())
+
+        # Live seqs keep their values; legacy ones count down below them
+        seqs = list(Message.objects.filter(room=self.room).order_by("id").values_list("seq", flat=True))
+        self.assertEqual(seqs, [-2, -1, 0, 1])
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_seq, 1)
+        self.assertEqual(RoomMember.objects.get(room=self.room, user=reader).last_read_seq, -1)
+        self.assertEqual(RoomMember.objects.get(room=self.room, user=self.user).last_read_seq, 1)
+        self.assertIsNone(message_cache.first_page(self.room.id, 2))
+
+        # A second run is a no-op
+        call_command("backfill_message_seq", stdout=StringIO())
+        seqs = list(Message.objects.filter(room=self.room).order_by("id").values_list("seq", flat=True))
+        self.assertEqual(seqs, [-2, -1, 0, 1])
@@ -0,0 +1,437 @@
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts import authentication
+from config import authz, metrics
+from config.batching import BatchBuffer
+from messages_app import pipeline
+from messages_app.models import Message
+from messages_app.services import create_message
+from orgs.models import Organization, OrganizationMember
+from rooms import membership, presence, read_cursors, tasks
+from rooms.models import Room, RoomMember
+from webhooks import events as webhook_events
+
+User = get_user_model()
+
+
+class InboxTestCase(APITestCase):
+    """Test the inbox endpoint and the denormalized room columns behind it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123")
+        self.other = User.objects.create_user(email="other@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.url = reverse("rooms_v1:room-inbox")
+        patcher = mock.patch.object(pipeline, "enqueue")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def make_room(self, name):
+        room = Room.objects.create(name=name, org=self.org, created_by=self.user)
+        RoomMember.objects.create(room=room, user=self.user)
+        RoomMember.objects.create(room=room, user=self.other)
+        return room
+
+    def test_member_count_and_last_message_are_maintained(self):
+        room = self.make_room("General")
+        msg = create_message(room, self.other, body="hello")
+        room.refresh_from_db()
+        self.assertEqual(room.member_count, 2)
+        self.assertEqual(room.last_message_id, msg.id)
+        self.assertEqual(room.last_activity_at, msg.created_at)
+
+        RoomMember.objects.filter(room=room, user=self.other).delete()
+        room.refresh_from_db()
+        self.assertEqual(room.member_count, 1)
+
+    def test_inbox_orders_by_activity_with_preview_and_unread(self):
+        quiet = self.make_room("Quiet")
+        busy = self.make_room("Busy")
+        create_message(busy, self.other, body="first")
+        create_message(busy, self.other, body="second")
+        create_message(quiet, self.other, body="latest")
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = response.data["results"]
+        self.assertEqual([r["room_id"] for r in rows], [quiet.id, busy.id])
+        self.assertEqual(rows[0]["last_message"]["body"], "latest")
+        self.assertEqual(rows[1]["unread_count"], 2)
+        self.assertEqual(rows[1]["members_count"], 2)
+
+    def test_inbox_hides_a_deleted_last_message(self):
+        room = self.make_room("General")
+        create_message(room, self.other, body="hello")
+        msg = create_message(room, self.other, body="regret", file_url="https://example.com/f.png")
+        Message.objects.filter(pk=msg.pk).update(is_deleted=True)
+
+        (row,) = self.client.get(self.url).data["results"]
+        self.assertIsNone(row["last_message"])
+
+    def test_inbox_cursor_pagination_uses_constant_queries(self):
+        rooms = [self.make_room(f"Room {i}") for i in range(5)]
+        for room in rooms:
+            create_message(room, self.other, body="hi")
+
+        self.client.get(self.url)  # warm the auth caches
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url, {"limit": 1})
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url, {"limit": 3})
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+        seen = [r["room_id"] for r in response.data["results"]]
+        response = self.client.get(response.data["next"])
+        seen += [r["room_id"] for r in response.data["results"]]
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(seen, [room.id for room in reversed(rooms)])
+
+
+class MembershipEngineTestCase(APITestCase):
+    """Test bulk auto-join on room creation and org joins."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(email="admin@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        OrganizationMember.objects.create(org=self.org, user=self.admin, role=OrganizationMember.ADMIN)
+        self.url = reverse("rooms_v1:room-list")
+
+        token = RefreshToken.for_user(self.admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def add_org_members(self, count, role=OrganizationMember.MEMBER, start=0):
+        users = [
+            User.objects.create_user(email=f"{role.lower()}{start + i}@example.com", password="testpass123")
+            for i in range(count)
+        ]
+        for user in users:
+            OrganizationMember.objects.create(org=self.org, user=user, role=role)
+        return users
+
+    def create_room(self, access_level):
+        # Compare cold lookups
+        authz.invalidate_users([self.admin.id])
+        authentication.invalidate_user(self.admin.id)
+        webhook_events.invalidate([self.org.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, {"name": "Room", "org": self.org.id, "access_level": access_level})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Room.objects.get(pk=response.data["id"]), len(ctx.captured_queries), response
+
+    def test_public_room_joins_everyone_in_constant_queries(self):
+        self.add_org_members(2)
+        _, small, _ = self.create_room(Room.PUBLIC)
+
+        self.add_org_members(20, start=2)
+        room, large, response = self.create_room(Room.PUBLIC)
+
+        self.assertEqual(small, large)
+        self.assertEqual(RoomMember.objects.filter(room=room).count(), 23)
+        self.assertEqual(response.data["members_count"], 23)
+
+    def test_manager_only_room_skips_members(self):
+        self.add_org_members(3)
+        managers = self.add_org_members(2, role=OrganizationMember.MANAGER)
+        room, _, _ = self.create_room(Room.MANAGER_ONLY)
+
+        joined = set(RoomMember.objects.filter(room=room).values_list("user_id", flat=True))
+        self.assertEqual(joined, {self.admin.id, *(u.id for u in managers)})
+        room.refresh_from_db()
+        self.assertEqual(room.member_count, 3)
+
+    def test_large_org_is_populated_in_background(self):
+        self.add_org_members(3)
+        with self.settings(ROOM_MEMBERSHIP_ASYNC_THRESHOLD=2):
+            with mock.patch("rooms.tasks.populate_room_members.delay") as delay:
+                with self.captureOnCommitCallbacks(execute=True):
+                    room, _, _ = self.create_room(Room.PUBLIC)
+        delay.assert_called_once_with(room.id)
+
+    def test_new_org_member_joins_rooms_for_their_role(self):
+        public = Room.objects.create(name="Public", org=self.org, created_by=self.admin)
+        managers = Room.objects.create(name="Managers", org=self.org, created_by=self.admin, access_level=Room.MANAGER_ONLY)
+        private = Room.objects.create(name="Private", org=self.org, created_by=self.admin, access_level=Room.PRIVATE)
+
+        (member,) = self.add_org_members(1)
+        (manager,) = self.add_org_members(1, role=OrganizationMember.MANAGER)
+
+        self.assertEqual(set(RoomMember.objects.filter(user=member).values_list("room_id", flat=True)), {public.id})
+        self.assertEqual(
+            set(RoomMember.objects.filter(user=manager).values_list("room_id", flat=True)),
+            {public.id, managers.id},
+        )
+        self.assertFalse(RoomMember.objects.filter(room=private).exists())
+        public.refresh_from_db()
+        self.assertEqual(public.member_count, 2)
+
+
+class RoleReconciliationTestCase(APITestCase):
+    """Test reconciliation of MANAGER_ONLY rooms with org roles."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(email="admin@example.com", password="testpass123")
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        OrganizationMember.objects.create(org=self.org, user=self.admin, role=OrganizationMember.ADMIN)
+        self.public = Room.objects.create(name="Public", org=self.org, created_by=self.admin)
+        self.managers = Room.objects.create(
+            name="Managers", org=self.org, created_by=self.admin, access_level=Room.MANAGER_ONLY
+        )
+        self.membership = OrganizationMember.objects.create(org=self.org, user=self.user, role=OrganizationMember.MEMBER)
+
+        token = RefreshToken.for_user(self.admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def change_role(self, role):
+        url = reverse("orgs_v1:org-change-role", kwargs={"pk": self.org.id, "user_id": self.user.id})
+        with mock.patch("rooms.membership.broadcast") as broadcast:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, {"role": role})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return list(broadcast.call_args.args[0]) if broadcast.called else []
+
+    def in_managers_room(self):
+        return RoomMember.objects.filter(room=self.managers, user=self.user).exists()
+
+    def test_promotion_and_demotion_update_manager_rooms(self):
+        events = self.change_role(OrganizationMember.MANAGER)
+        self.assertTrue(self.in_managers_room())
+        self.assertEqual(
+            events,
+            [(f"room_{self.managers.id}", {"type": "membership_delta", "room": self.managers.id, "added": [self.user.id], "removed": []})],
+        )
+
+        events = self.change_role(OrganizationMember.MEMBER)
+        self.assertFalse(self.in_managers_room())
+        self.assertEqual(events[0][1]["removed"], [self.user.id])
+        # Role-independent rooms are left alone
+        self.assertTrue(RoomMember.objects.filter(room=self.public, user=self.user).exists())
+        self.managers.refresh_from_db()
+        self.assertEqual(self.managers.member_count, 0)
+
+    def test_org_wide_batch_fixes_drift(self):
+        # Drift: role changed behind the engine's back
+        OrganizationMember.objects.filter(pk=self.membership.pk).update(role=OrganizationMember.MANAGER)
+        RoomMember.objects.filter(room=self.managers, user=self.admin).delete()
+
+        with mock.patch("rooms.membership.broadcast"):
+            call_command("reconcile_room_memberships", org=[self.org.id], stdout=StringIO())
+
+        self.assertEqual(
+            set(RoomMember.objects.filter(room=self.managers).values_list("user_id", flat=True)),
+            {self.admin.id, self.user.id},
+        )
+
+    def test_beat_reconciles_every_org(self):
+        other_org = Organization.objects.create(name="Other Organization")
+        OrganizationMember.objects.filter(pk=self.membership.pk).update(role=OrganizationMember.MANAGER)
+        self.assertIn("reconcile-room-memberships", settings.CELERY_BEAT_SCHEDULE)
+
+        with mock.patch("rooms.tasks.reconcile_org_memberships.delay") as delay:
+            self.assertEqual(tasks.reconcile_room_memberships(), {"orgs": 2})
+        self.assertEqual([c.args[0] for c in delay.call_args_list], [self.org.id, other_org.id])
+
+        with mock.patch("rooms.membership.broadcast"):
+            with self.captureOnCommitCallbacks(execute=True):
+                tasks.reconcile_org_memberships(self.org.id)
+        self.assertTrue(self.in_managers_room())
+
+
+class AuthzCacheTestCase(APITestCase):
+    """Test the cached role/room lookups behind permissions and sockets."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.room = Room.objects.create(name="general", org=self.org, access_level=Room.PRIVATE, created_by=self.user)
+        OrganizationMember.objects.create(org=self.org, user=self.user, role=OrganizationMember.MEMBER)
+        metrics.reset()
+
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def test_repeat_lookups_hit_cache(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(authz.get_org_role(self.user.id, self.org.id), OrganizationMember.MEMBER)
+            self.assertEqual(authz.get_org_role(self.user.id, self.org.id), OrganizationMember.MEMBER)
+        self.assertEqual(metrics.get("authz.misses"), 1)
+        self.assertEqual(metrics.get("authz.local_hits"), 1)
+
+        authz.clear_local()
+        with self.assertNumQueries(0):
+            authz.get_org_role(self.user.id, self.org.id)
+        self.assertEqual(metrics.get("authz.redis_hits"), 1)
+
+    def test_join_and_leave_invalidate(self):
+        self.assertFalse(authz.is_room_member(self.user.id, self.room.id))
+        member = RoomMember.objects.create(room=self.room, user=self.user)
+        self.assertTrue(authz.is_room_member(self.user.id, self.room.id))
+        member.delete()
+        self.assertFalse(authz.is_room_member(self.user.id, self.room.id))
+
+        OrganizationMember.objects.filter(org=self.org, user=self.user).get().delete()
+        self.assertIsNone(authz.get_org_role(self.user.id, self.org.id))
+
+    def test_fill_racing_a_revoke_is_not_cached(self):
+        member = RoomMember.objects.create(room=self.room, user=self.user)
+        load = authz._load
+
+        def revoke_during_load(kind, user_id):
+            # The fill reads the old rows, then the revoke commits and invalidates
+            value = load(kind, user_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                member.delete()
+            return value
+
+        with mock.patch.object(authz, "_load", revoke_during_load):
+            self.assertTrue(authz.is_room_member(self.user.id, self.room.id))
+        self.assertEqual(metrics.get("authz.stale_fills"), 1)
+        self.assertFalse(authz.is_room_member(self.user.id, self.room.id))
+
+    def test_user_fill_racing_a_deactivation_is_not_cached(self):
+        authentication.invalidate_user(self.user.id)
+        set_if_current = authentication.generations.set_if_current
+
+        def deactivate_then_set(*args):
+            # The row was read while active; the deactivation commits before the write
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.is_active = False
+                self.user.save(update_fields=["is_active"])
+            return set_if_current(*args)
+
+        with mock.patch.object(authentication.generations, "set_if_current", deactivate_then_set):
+            self.assertTrue(authentication.get_user(self.user.id).is_active)
+        self.assertEqual(metrics.get("auth.user_cache.stale_fills"), 1)
+        self.assertIsNone(authentication.peek_user(self.user.id))
+        self.assertFalse(authentication.get_user(self.user.id).is_active)
+
+    def test_bulk_join_invalidates(self):
+        self.assertFalse(authz.is_room_member(self.user.id, self.room.id))
+        membership.add_members([(self.room.id, self.user.id)])
+        self.assertTrue(authz.is_room_member(self.user.id, self.room.id))
+
+    def test_members_endpoint_uses_cached_membership(self):
+        url = reverse("rooms_v1:room-members", kwargs={"pk": self.room.id})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        RoomMember.objects.create(room=self.room, user=self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+
+class RoomPresenceTestCase(APITestCase):
+    """Test the room presence snapshot endpoint."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="here@example.com", password="testpass123")
+        self.away = User.objects.create_user(email="away@example.com", password="testpass123")
+        self.outsider = User.objects.create_user(email="outsider@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.room = Room.objects.create(name="Room", org=self.org, created_by=self.user)
+        RoomMember.objects.create(room=self.room, user=self.user)
+        RoomMember.objects.create(room=self.room, user=self.away)
+        self.url = reverse("rooms_v1:room-presence", kwargs={"pk": self.room.id})
+
+        override = self.settings(PRESENCE_BACKEND="local")
+        override.enable()
+        self.addCleanup(override.disable)
+        presence._stores.clear()
+        self.addCleanup(presence._stores.clear)
+
+    def get_as(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        return self.client.get(self.url)
+
+    def test_lists_online_members(self):
+        async_to_sync(presence.get_store().touch)([self.room.id], self.user.id)
+        response = self.get_as(self.user)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"room": self.room.id, "online": [self.user.id]})
+
+        self.assertEqual(self.get_as(self.outsider).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ReadCursorTestCase(APITestCase):
+    """Test batched, forward-only read cursors."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="reader@example.com", password="testpass123")
+        self.other = User.objects.create_user(email="writer@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.room = Room.objects.create(name="Room A", org=self.org, created_by=self.other)
+        self.room_b = Room.objects.create(name="Room B", org=self.org, created_by=self.other)
+        for room in (self.room, self.room_b):
+            RoomMember.objects.create(room=room, user=self.user)
+            RoomMember.objects.create(room=room, user=self.other)
+        with mock.patch.object(pipeline, "enqueue"):
+            self.messages = [create_message(self.room, self.other, body=f"m{i}") for i in range(3)]
+            self.elsewhere = create_message(self.room_b, self.other, body="b")
+
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def mark_read(self, msg):
+        url = reverse("rooms_v1:room-mark-read", kwargs={"pk": self.room.id, "msg_id": msg.id})
+        return self.client.post(url)
+
+    def cursor(self):
+        return RoomMember.objects.values_list("last_read_msg_id", "last_read_seq").get(room=self.room, user=self.user)
+
+    def test_reads_are_coalesced_and_only_move_forward(self):
+        m0, m1, m2 = self.messages
+        for msg in (m1, m2, m0):
+            self.assertEqual(self.mark_read(msg).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.cursor(), (None, None))
+
+        with mock.patch("rooms.read_cursors.broadcast") as broadcast:
+            read_cursors.flush()
+        self.assertEqual(self.cursor(), (m2.id, m2.seq))
+        (events,), _ = broadcast.call_args
+        self.assertEqual(list(events), [(f"room_{self.room.id}", {
+            "type": "read_receipts",
+            "room": self.room.id,
+            "cursors": [{"user": self.user.id, "last_read_msg_id": m2.id, "last_read_seq": m2.seq}],
+        })])
+
+        response = self.mark_read(m1)
+        self.assertEqual((response.data["last_read_msg_id"], response.data["last_read_seq"]), (m2.id, m2.seq))
+        with mock.patch("rooms.read_cursors.broadcast") as broadcast:
+            read_cursors.flush()
+        self.assertEqual(self.cursor(), (m2.id, m2.seq))
+        self.assertEqual(list(broadcast.call_args.args[0]), [])
+
+    def test_window_flush_closes_the_timer_threads_connections(self):
+        flushed = []
+        buffer = BatchBuffer(flushed.extend, window=0.01)
+        with mock.patch("config.batching.connections") as connections:
+            buffer.add(1)
+            timer = buffer._timer
+            timer.join()
+            self.assertEqual(flushed, [1])
+            connections.close_all.assert_called_once_with()
+
+            # Flushes on the caller's thread leave its connection alone
+            buffer.add(2)
+            buffer.flush()
+            connections.close_all.assert_called_once_with()
+
+    def test_messages_from_other_rooms_are_ignored(self):
+        read_cursors.mark_read(self.room.id, self.user.id, self.elsewhere.id)
+        read_cursors.flush()
+        self.assertEqual(self.cursor(), (None, None))
+
+        url = reverse("rooms_v1:room-mark-read", kwargs={"pk": self.room.id, "msg_id": self.elsewhere.id})
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_404_NOT_FOUND)
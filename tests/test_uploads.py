@@ -0,0 +1,193 @@
+import hashlib
+import io
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from uploads import sessions
+from uploads.models import FileUpload, UploadSession
+
+User = get_user_model()
+
+
+class ChunkedUploadTestCase(APITestCase):
+    """Test the resumable init/append/complete upload protocol."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name, UPLOAD_STREAM_BLOCK_SIZE=1024)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123")
+        self.data = os.urandom(10_000)
+        token = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def start(self, **fields):
+        body = {"filename": "report.pdf", "content_type": "application/pdf", "file_size": len(self.data), **fields}
+        response = self.client.post(reverse("uploads_v1:upload-session-list"), body, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def append(self, session_id, offset, chunk):
+        return self.client.put(
+            reverse("uploads_v1:upload-session-append", kwargs={"pk": session_id}),
+            data=chunk,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def complete(self, session_id, **body):
+        return self.client.post(reverse("uploads_v1:upload-session-complete", kwargs={"pk": session_id}), body, format="json")
+
+    def test_chunks_are_assembled_and_hashed(self):
+        session_id = self.start()
+        for offset in range(0, len(self.data), 4000):
+            chunk = self.data[offset:offset + 4000]
+            response = self.append(session_id, offset, chunk)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response["Upload-Offset"], str(offset + len(chunk)))
+            self.assertEqual(response.data["chunk_sha256"], hashlib.sha256(chunk).hexdigest())
+        parts = UploadSession.objects.get(pk=session_id).parts
+        self.assertEqual(len(parts), 3)
+
+        digest = hashlib.sha256(self.data).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.complete(session_id, sha256=digest)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data["file_size"], response.data["sha256"]), (len(self.data), digest))
+
+        upload = FileUpload.objects.get(pk=response.data["id"])
+        with default_storage.open(os.path.join("uploads", upload.filename)) as stored:
+            self.assertEqual(stored.read(), self.data)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(any(default_storage.exists(name) for name in parts))
+
+    def test_wrong_offset_is_rejected_and_upload_resumes(self):
+        session_id = self.start()
+        self.assertEqual(self.append(session_id, 0, self.data[:6000]).status_code, status.HTTP_200_OK)
+
+        # A replayed chunk and a gap are both refused with the offset to resume from
+        for offset in (0, 8000):
+            response = self.append(session_id, offset, self.data[offset:offset + 1000])
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(response.data["offset"], 6000)
+
+        status_response = self.client.get(reverse("uploads_v1:upload-session-detail", kwargs={"pk": session_id}))
+        offset = status_response.data["offset"]
+        self.append(session_id, offset, self.data[offset:])
+        self.assertEqual(self.complete(session_id).status_code, status.HTTP_201_CREATED)
+
+    def test_chunk_that_lost_the_race_is_discarded(self):
+        session_id = self.start()
+        session = UploadSession.objects.get(pk=session_id)
+        # Another request advances the session while this chunk is streaming
+        UploadSession.objects.filter(pk=session_id).update(offset=500)
+        with self.assertRaises(sessions.OffsetMismatch):
+            sessions.append(session, 0, io.BytesIO(self.data[:500]), 500)
+        self.assertEqual(default_storage.listdir(sessions.prefix(session))[1], [])
+
+    def test_incomplete_upload_and_bad_checksum_keep_the_session(self):
+        session_id = self.start()
+        self.append(session_id, 0, self.data[:5000])
+        self.assertEqual(self.complete(session_id).status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.append(session_id, 5000, self.data[5000:])
+        response = self.complete(session_id, sha256="0" * 64)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(FileUpload.objects.exists())
+        self.assertEqual(self.complete(session_id).status_code, status.HTTP_201_CREATED)
+
+    def test_complete_claims_the_session_and_assembles_outside_the_lock(self):
+        session_id = self.start()
+        self.append(session_id, 0, self.data)
+
+        save = default_storage.save
+
+        def assemble(name, content, **kwargs):
+            # Assembly runs after the claim committed, outside any transaction
+            self.assertIsNotNone(UploadSession.objects.get(pk=session_id).completing_at)
+            self.assertEqual(self.complete(session_id).status_code, status.HTTP_409_CONFLICT)
+            return save(name, content, **kwargs)
+
+        with mock.patch.object(default_storage, "save", side_effect=assemble):
+            response = self.complete(session_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(FileUpload.objects.count(), 1)
+
+    def test_session_aborted_during_assembly_discards_the_file(self):
+        session_id = self.start()
+        self.append(session_id, 0, self.data)
+        session = UploadSession.objects.get(pk=session_id)
+        save = default_storage.save
+
+        def assemble(name, content, **kwargs):
+            path = save(name, content, **kwargs)
+            UploadSession.objects.filter(pk=session_id).delete()
+            return path
+
+        with mock.patch.object(default_storage, "save", side_effect=assemble):
+            with self.assertRaises(sessions.CompletionInProgress):
+                sessions.complete(session, file_url=str)
+        self.assertFalse(FileUpload.objects.exists())
+        self.assertEqual(default_storage.listdir("uploads")[1], [])
+
+    def test_abandoned_claim_can_be_retaken(self):
+        session_id = self.start()
+        self.append(session_id, 0, self.data)
+        UploadSession.objects.filter(pk=session_id).update(completing_at=timezone.now() - timedelta(hours=1))
+        with self.settings(UPLOAD_COMPLETE_LEASE=60):
+            self.assertEqual(self.complete(session_id).status_code, status.HTTP_201_CREATED)
+
+    def test_chunk_limits(self):
+        session_id = self.start()
+        with self.settings(UPLOAD_CHUNK_MAX_SIZE=2000):
+            self.assertEqual(self.append(session_id, 0, self.data[:3000]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.append(session_id, 0, self.data + b"x").status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(
+            reverse("uploads_v1:upload-session-append", kwargs={"pk": session_id}),
+            data=self.data[:10], content_type="application/octet-stream",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_body_is_read_in_blocks(self):
+        stream = io.BytesIO(self.data)
+        with mock.patch.object(stream, "read", wraps=stream.read) as read:
+            reader = sessions.HashingReader(stream, limit=len(self.data), block_size=1024)
+            default_storage.save("uploads/blocks", File(reader))
+        self.assertLessEqual(max(call.args[0] for call in read.call_args_list), 1024)
+        self.assertEqual(reader.sha256.hexdigest(), hashlib.sha256(self.data).hexdigest())
+
+    def test_sessions_are_private_and_expire(self):
+        session_id = self.start()
+        self.append(session_id, 0, self.data[:100])
+        other = User.objects.create_user(email="other@example.com", password="testpass123")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(other).access_token}")
+        self.assertEqual(self.append(session_id, 100, self.data[100:200]).status_code, status.HTTP_404_NOT_FOUND)
+
+        session = UploadSession.objects.get(pk=session_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sessions.purge_expired(now=timezone.now() + timedelta(days=2)), 1)
+        self.assertFalse(default_storage.exists(session.parts[0]))
+
+    def test_invalid_session_metadata(self):
+        response = self.client.post(
+            reverse("uploads_v1:upload-session-list"),
+            {"filename": "x.exe", "content_type": "application/x-msdownload", "file_size": 10},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        session_id = self.start(filename="../../etc/passwd.pdf")
+        self.assertEqual(UploadSession.objects.get(pk=session_id).filename, "passwd.pdf")
@@ -0,0 +1,468 @@
+import json
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config import metrics
+from messages_app import pipeline
+from messages_app.services import create_message
+from orgs.models import Organization, OrganizationMember
+from rooms import membership
+from rooms.models import Room, RoomMember
+from webhooks import dispatcher, events, retention, stats, tasks
+from webhooks.models import Webhook, WebhookDeliveryStats, WebhookHealth, WebhookOutbox
+
+User = get_user_model()
+
+
+class StubReceiver(BaseHTTPRequestHandler):
+    """Records every POST; answers 200 on /ok, 503 on /busy, hangs on /slow and 500 anywhere else."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.received.append((self.path, dict(self.headers), body))
+        if self.path == "/slow":
+            time.sleep(1)
+        self.send_response({"/ok": 200, "/busy": 503}.get(self.path, 500))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class WebhookDispatcherTestCase(TestCase):
+    """Test draining the outbox against a local stub HTTP server."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubReceiver)
+        self.server.received = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        base = f"http://127.0.0.1:{self.server.server_port}"
+
+        self.org = Organization.objects.create(name="Test Organization")
+        self.ok = Webhook.objects.create(org=self.org, url=f"{base}/ok", events=["message.created"])
+        self.broken = Webhook.objects.create(org=self.org, url=f"{base}/fail", events=["message.created"])
+
+    def enqueue(self, webhook, count, **fields):
+        return WebhookOutbox.objects.bulk_create(
+            WebhookOutbox(webhook=webhook, event_type="message.created", payload={"event": "message.created", "n": i}, **fields)
+            for i in range(count)
+        )
+
+    def test_delivers_signed_requests_and_records_outcomes(self):
+        self.enqueue(self.ok, 3)
+        self.enqueue(self.broken, 2)
+        later = self.enqueue(self.ok, 1, next_attempt_at=timezone.now() + timedelta(hours=1))
+        metrics.reset()
+
+        with CaptureQueriesContext(connection) as ctx:
+            stats = dispatcher.dispatch(batch_size=10)
+        writes = Counter(q["sql"].split()[0] for q in ctx.captured_queries if not q["sql"].startswith(("SELECT", "SAVEPOINT", "RELEASE")))
+        # One round per endpoint, written set-based whatever the row count:
+        # lease + sent + last_triggered / lease + failed, plus rollup update each;
+        # health upsert and rollup create each
+        self.assertEqual(writes, {"UPDATE": 7, "INSERT": 4})
+
+        self.assertEqual((stats.delivered, stats.failed), (3, 2))
+        self.assertGreater(stats.per_second, 0)
+        self.assertEqual(len(self.server.received), 5)
+        path, headers, body = next(r for r in self.server.received if r[0] == "/ok")
+        self.assertEqual(headers["X-ChatBoard-Event"], "message.created")
+        self.assertEqual(
+            headers["X-ChatBoard-Signature"],
+            dispatcher.sign(self.ok.secret, headers["X-ChatBoard-Timestamp"], body),
+        )
+        self.assertEqual(json.loads(body)["event"], "message.created")
+
+        self.assertEqual(WebhookOutbox.objects.filter(webhook=self.ok, status="sent").count(), 3)
+        for row in WebhookOutbox.objects.filter(webhook=self.broken):
+            self.assertEqual((row.status, row.retries), ("retrying", 1))
+            self.assertIn("HTTP 500", row.last_error)
+            self.assertGreater(row.next_attempt_at, timezone.now())
+        self.assertEqual(WebhookOutbox.objects.get(pk=later[0].pk).status, "pending")
+        self.ok.refresh_from_db()
+        self.broken.refresh_from_db()
+        self.assertIsNotNone(self.ok.last_triggered)
+        self.assertIsNone(self.broken.last_triggered)
+        self.assertEqual(metrics.get("webhooks.delivered"), 3)
+
+    def test_gives_up_after_max_retries(self):
+        (row,) = self.enqueue(self.broken, 1, retries=2, max_retries=3, status="retrying")
+        dispatcher.dispatch()
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.retries), ("failed", 3))
+
+    def test_batching_webhook_gets_arrays_once_a_batch_is_ready(self):
+        batched = Webhook.objects.create(
+            org=self.org, url=self.ok.url, events=["message.created"],
+            batch_enabled=True, batch_max_size=3, batch_max_delay=60,
+        )
+        self.enqueue(batched, 2)
+        self.assertEqual(dispatcher.dispatch().requests, 0)  # neither full nor old enough yet
+
+        rows = self.enqueue(batched, 5)
+        stats = dispatcher.dispatch()
+        self.assertEqual((stats.delivered, stats.requests), (7, 3))
+        bodies = [json.loads(body) for _, _, body in self.server.received]
+        self.assertEqual(sorted(len(body) for body in bodies), [1, 3, 3])
+        self.assertIn({"delivery": rows[0].id, "event": "message.created", "n": 0}, sum(bodies, []))
+        path, headers, body = self.server.received[0]
+        self.assertEqual(headers["X-ChatBoard-Event"], "batch")
+        self.assertEqual(headers["X-ChatBoard-Signature"], dispatcher.sign(batched.secret, headers["X-ChatBoard-Timestamp"], body))
+        self.assertFalse(WebhookOutbox.objects.exclude(status="sent").exists())
+
+    def test_batch_fails_and_retries_as_a_unit(self):
+        self.broken.batch_enabled, self.broken.batch_max_size = True, 2
+        self.broken.save()
+        (retried,) = self.enqueue(self.broken, 1, retries=1, status="retrying")
+        self.enqueue(self.broken, 1)
+        self.assertEqual(dispatcher.dispatch().requests, 1)
+
+        rows = list(WebhookOutbox.objects.filter(webhook=self.broken).values_list("status", "retries", "next_attempt_at"))
+        self.assertEqual(sorted(r[:2] for r in rows), [("retrying", 1), ("retrying", 2)])
+        self.assertEqual(rows[0][2], rows[1][2])  # retried together, on the older row's backoff
+
+    def test_batches_respect_max_bytes(self):
+        self.ok.batch_enabled, self.ok.batch_max_bytes = True, 1024
+        self.ok.save()
+        rows = self.enqueue(self.ok, 3)
+        for row in rows:
+            row.payload["blob"] = "x" * 400
+            row.webhook = self.ok
+        self.assertEqual([len(unit) for unit in dispatcher.group_deliveries(rows)], [2, 1])
+
+    def test_claim_leases_rows(self):
+        self.enqueue(self.ok, 3)
+        self.assertEqual(len(dispatcher.claim_due(10)), 3)
+        # Leased rows are not due again until the lease runs out
+        self.assertEqual(dispatcher.claim_due(10), [])
+
+    def test_breaker_opens_and_moves_the_backlog_without_starving_others(self):
+        self.enqueue(self.broken, 10)
+        self.enqueue(self.ok, 3)
+        with self.settings(WEBHOOK_BREAKER_THRESHOLD=3):
+            stats = dispatcher.dispatch()
+
+        # One round of concurrency_limit (4) attempts trips it; the rest of the backlog waits for the probe
+        self.assertEqual(len([r for r in self.server.received if r[0] == "/fail"]), 4)
+        self.assertEqual((stats.delivered, stats.failed), (3, 4))
+        health = WebhookHealth.objects.get(webhook=self.broken)
+        self.assertEqual((health.state, health.consecutive_failures), (WebhookHealth.OPEN, 4))
+        self.assertEqual(
+            WebhookOutbox.objects.filter(webhook=self.broken, status="pending", next_attempt_at=health.retry_at).count(), 6
+        )
+        self.assertEqual(dispatcher.dispatch().requests, 0)
+
+    def test_half_open_probe_closes_or_reopens_the_breaker(self):
+        past = timezone.now() - timedelta(seconds=1)
+        for webhook in (self.ok, self.broken):
+            WebhookHealth.objects.create(
+                webhook=webhook, state=WebhookHealth.OPEN, consecutive_failures=5,
+                retry_at=past, last_failure_at=past - timedelta(seconds=30),
+            )
+            self.enqueue(webhook, 3)
+
+        claimed = dispatcher.claim_due(10)
+        self.assertEqual(sorted(row.webhook_id for row in claimed), sorted([self.ok.id, self.broken.id]))
+        self.assertEqual(set(WebhookHealth.objects.values_list("state", flat=True)), {WebhookHealth.HALF_OPEN})
+        # No second probe while the first one may still be in flight
+        self.assertEqual(dispatcher.claim_due(10), [])
+        WebhookOutbox.objects.update(next_attempt_at=past)
+
+        # Its dispatcher died: once the lease has run out, probe again
+        with self.settings(WEBHOOK_LEASE_SECONDS=0):
+            stats = dispatcher.dispatch()
+        ok, broken = WebhookHealth.objects.get(webhook=self.ok), WebhookHealth.objects.get(webhook=self.broken)
+        self.assertEqual((ok.state, ok.consecutive_failures), (WebhookHealth.CLOSED, 0))
+        self.assertEqual(WebhookOutbox.objects.filter(webhook=self.ok, status="sent").count(), 3)
+        self.assertEqual(broken.state, WebhookHealth.OPEN)
+        self.assertEqual(stats.failed, 1)  # only the probe was attempted
+        self.assertEqual(broken.retry_at - broken.last_failure_at, timedelta(seconds=60))  # cooldown doubled
+
+    def test_congestion_halves_concurrency_and_success_grows_it(self):
+        busy = Webhook.objects.create(org=self.org, url=self.ok.url.replace("/ok", "/busy"), events=["message.created"])
+        self.enqueue(busy, 2)
+        self.enqueue(self.ok, 2)
+        dispatcher.dispatch()
+        limits = dict(WebhookHealth.objects.values_list("webhook_id", "concurrency_limit"))
+        self.assertEqual(limits, {busy.id: 2, self.ok.id: 5})
+        self.assertIn("HTTP 503", WebhookOutbox.objects.filter(webhook=busy).first().last_error)
+
+    def test_slow_endpoint_does_not_hold_up_others(self):
+        slow = Webhook.objects.create(org=self.org, url=self.ok.url.replace("/ok", "/slow"), events=["message.created"])
+        self.enqueue(slow, 1)
+        self.enqueue(self.ok, 12)  # three rounds at the default concurrency limit of 4
+        with self.settings(WEBHOOK_TIMEOUT=0.5):
+            stats = dispatcher.dispatch()
+
+        self.assertEqual((stats.delivered, stats.failed), (12, 1))
+        (timed_out,) = WebhookOutbox.objects.filter(webhook=slow)
+        self.assertIn("Timeout", timed_out.last_error)
+        # Every round for the fast endpoint finished while the slow request was still waiting
+        fast_done = max(WebhookOutbox.objects.filter(webhook=self.ok).values_list("last_attempt_at", flat=True))
+        self.assertLess(fast_done, timed_out.last_attempt_at)
+
+    def test_only_one_dispatcher_runs_at_a_time(self):
+        self.enqueue(self.ok, 2)
+        token = dispatcher.acquire_lock()
+        self.assertIsNotNone(token)
+        stats = dispatcher.dispatch()
+        self.assertTrue(stats.skipped)
+        self.assertEqual(self.server.received, [])
+        self.assertEqual(tasks.deliver_webhooks()["skipped"], True)
+
+        dispatcher.release_lock(token)
+        self.assertEqual(tasks.deliver_webhooks(), {"delivered": 2, "failed": 0, "skipped": False})
+        # Released once the run is over
+        token = dispatcher.acquire_lock()
+        self.assertIsNotNone(token)
+        dispatcher.release_lock(token)
+
+    def test_claim_follows_the_locked_health_row(self):
+        self.enqueue(self.ok, 6)
+        WebhookHealth.objects.create(webhook=self.ok, concurrency_limit=4)
+        plan_round = dispatcher.plan_round
+
+        def then_limit_drops(*args):
+            # Another round halves the limit after this one planned
+            planned = plan_round(*args)
+            WebhookHealth.objects.filter(webhook=self.ok).update(concurrency_limit=2)
+            return planned
+
+        with mock.patch.object(dispatcher, "plan_round", then_limit_drops):
+            self.assertEqual(len(dispatcher.claim_due(10)), 2)
+
+        # An open breaker allows a single probe, and only until it is half-open
+        WebhookOutbox.objects.update(next_attempt_at=timezone.now())
+        WebhookHealth.objects.filter(webhook=self.ok).update(state=WebhookHealth.OPEN, retry_at=timezone.now())
+        self.assertEqual(len(dispatcher.claim_due(10)), 1)
+        self.assertEqual(WebhookHealth.objects.get(webhook=self.ok).state, WebhookHealth.HALF_OPEN)
+        self.assertEqual(dispatcher.claim_due(10), [])
+
+    def test_lost_lock_stops_new_rounds(self):
+        self.enqueue(self.ok, 2)
+        stats = async_to_sync(dispatcher.dispatch_async)(None, None, "not-the-holder")
+        self.assertEqual(stats.requests, 0)
+        self.assertEqual(metrics.get("webhooks.dispatch.lock_lost"), 1)
+
+    def test_outcomes_are_rolled_up_per_hour(self):
+        self.enqueue(self.ok, 3)
+        self.enqueue(self.broken, 2, retries=2, max_retries=3, status="retrying")
+        with CaptureQueriesContext(connection) as ctx:
+            dispatcher.dispatch()
+        # Rollup rows are locked in a fixed order so dispatchers cannot deadlock
+        locking = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT") and "deliverystats" in q["sql"]]
+        self.assertTrue(locking)
+        for sql in locking:
+            self.assertIn('ORDER BY "webhooks_webhookdeliverystats"."webhook_id" ASC', sql)
+        self.enqueue(self.ok, 1)
+        dispatcher.dispatch()
+
+        ok = WebhookDeliveryStats.objects.get(webhook=self.ok)
+        self.assertEqual((ok.requests, ok.delivered, ok.failed), (4, 4, 0))
+        self.assertEqual(sum(ok.latency_histogram), 4)
+        broken = WebhookDeliveryStats.objects.get(webhook=self.broken)
+        self.assertEqual((broken.failed, broken.gave_up), (2, 2))
+
+        report = stats.report(self.ok, timezone.now())
+        self.assertEqual(len(report["hourly"]), 1)
+        self.assertEqual((report["totals"]["delivered"], report["totals"]["success_rate"]), (4, 1.0))
+        self.assertIsNotNone(report["totals"]["latency_p95_ms"])
+
+    def test_percentiles_come_from_the_histogram(self):
+        histogram = stats.empty_histogram()
+        for latency_ms in [5] * 90 + [300] * 9 + [60000]:
+            histogram[stats.bucket(latency_ms)] += 1
+        self.assertEqual([stats.percentile(histogram, q) for q in (50, 95, 99, 100)], [10, 500, 500, 10000])
+        self.assertIsNone(stats.percentile(stats.empty_histogram(), 50))
+
+    def test_purge_removes_expired_terminal_rows_in_batches(self):
+        old = timezone.now() - timedelta(days=60)
+        expired = self.enqueue(self.ok, 3, status="sent", last_attempt_at=old)
+        expired += self.enqueue(self.broken, 1, status="failed", last_attempt_at=old)
+        recent = self.enqueue(self.ok, 1, status="sent", last_attempt_at=timezone.now())
+        due = self.enqueue(self.broken, 1, status="retrying", last_attempt_at=old)
+        WebhookDeliveryStats.objects.create(webhook=self.ok, hour=old - timedelta(days=60))
+        archive = StringIO()
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(retention.purge(batch_size=2, archive=archive), (4, 1))
+        self.assertEqual(sum(q["sql"].startswith("DELETE") for q in ctx.captured_queries), 3)  # 2 batches + rollups
+        self.assertEqual(
+            sorted(WebhookOutbox.objects.values_list("id", flat=True)), sorted(row.id for row in recent + due)
+        )
+        archived = [json.loads(line) for line in archive.getvalue().splitlines()]
+        self.assertEqual([row["id"] for row in archived], sorted(row.id for row in expired))
+
+    def test_purge_keeps_rows_requeued_during_the_batch(self):
+        old = timezone.now() - timedelta(days=60)
+        expired = self.enqueue(self.ok, 2, status="failed", last_attempt_at=old)
+        archive = mock.Mock()
+        # An operator retries a row while the batch is being archived
+        archive.write.side_effect = lambda line: WebhookOutbox.objects.filter(pk=expired[0].pk).update(status="pending")
+
+        purged, _ = retention.purge(batch_size=10, archive=archive)
+        self.assertEqual(purged, 1)
+        self.assertEqual(list(WebhookOutbox.objects.values_list("id", flat=True)), [expired[0].id])
+
+
+class WebhookStatsApiTestCase(APITestCase):
+    """Test the stats, events and health endpoints."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        OrganizationMember.objects.create(org=self.org, user=self.admin, role=OrganizationMember.ADMIN)
+        self.webhook = Webhook.objects.create(org=self.org, url="https://example.com/hook", events=["message.created"])
+        hour = stats.hour_of(timezone.now())
+        histogram = stats.empty_histogram()
+        histogram[stats.bucket(40)] = 9
+        histogram[stats.bucket(900)] = 1
+        WebhookDeliveryStats.objects.create(
+            webhook=self.webhook, hour=hour, requests=10, delivered=9, failed=1, latency_histogram=histogram,
+        )
+        WebhookDeliveryStats.objects.create(webhook=self.webhook, hour=hour - timedelta(days=2), requests=5, delivered=5)
+
+        token = RefreshToken.for_user(self.admin)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+
+    def test_reports_totals_and_hourly_rollups(self):
+        url = reverse("webhooks_v1:webhook-stats", kwargs={"pk": self.webhook.pk})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any("webhooks_webhookoutbox" in q["sql"] for q in ctx.captured_queries))
+        self.assertEqual(response.data["hours"], 24)
+        self.assertEqual(len(response.data["hourly"]), 1)
+        totals = response.data["totals"]
+        self.assertEqual((totals["requests"], totals["success_rate"]), (10, 0.9))
+        self.assertEqual((totals["latency_p50_ms"], totals["latency_p99_ms"]), (50, 1000))
+
+        response = self.client.get(url, {"hours": 72})
+        self.assertEqual(response.data["totals"]["requests"], 15)
+        self.assertEqual(self.client.get(url, {"hours": "x"}).status_code, 400)
+
+    def test_events_list_and_health_are_separate(self):
+        WebhookOutbox.objects.create(webhook=self.webhook, event_type="message.created", payload={})
+        response = self.client.get(reverse("webhooks_v1:webhook-events", kwargs={"pk": self.webhook.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.data, list)  # unchanged v1 shape
+        self.assertEqual(response.data[0]["event_type"], "message.created")
+
+        url = reverse("webhooks_v1:webhook-health", kwargs={"pk": self.webhook.pk})
+        self.assertEqual(self.client.get(url).data["state"], WebhookHealth.CLOSED)  # no deliveries yet
+        WebhookHealth.objects.create(webhook=self.webhook, state=WebhookHealth.OPEN, consecutive_failures=5)
+        response = self.client.get(url)
+        self.assertEqual((response.data["state"], response.data["consecutive_failures"]), (WebhookHealth.OPEN, 5))
+
+
+class WebhookEventsTestCase(TestCase):
+    """Test routing domain events into the outbox through the subscription index."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="user@example.com", password="testpass123")
+        self.other = User.objects.create_user(email="other@example.com", password="testpass123")
+        self.org = Organization.objects.create(name="Test Organization")
+        self.room = Room.objects.create(name="Room", org=self.org, created_by=self.user)
+        RoomMember.objects.create(room=self.room, user=self.user)
+
+        self.messages_hook = Webhook.objects.create(org=self.org, url="https://example.com/m", events=["message.created", "member.joined"])
+        self.rooms_hook = Webhook.objects.create(org=self.org, url="https://example.com/r", events=["room.created"])
+        Webhook.objects.create(org=self.org, url="https://example.com/off", events=["message.created"], is_active=False)
+        other_org = Organization.objects.create(name="Other Organization")
+        Webhook.objects.create(org=other_org, url="https://example.com/x", events=["message.created"])
+
+        patcher = mock.patch.object(pipeline, "enqueue")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def outbox(self, event_type):
+        return list(WebhookOutbox.objects.filter(event_type=event_type).values_list("webhook_id", "payload"))
+
+    def test_message_created_is_written_with_the_message(self):
+        msg = create_message(self.room, self.user, body="hello")
+        ((webhook_id, payload),) = self.outbox("message.created")
+        self.assertEqual(webhook_id, self.messages_hook.id)
+        self.assertEqual(payload["event"], "message.created")
+        self.assertEqual(payload["data"]["id"], msg.id)
+        self.assertEqual(payload["data"]["body"], "hello")
+
+        # Rolled back together with the message
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            create_message(self.room, self.user, body="never")
+            raise RuntimeError
+        self.assertEqual(len(self.outbox("message.created")), 1)
+
+    def test_index_is_cached_and_invalidated_on_change(self):
+        events.subscribers(self.org.id, "message.created")
+        with self.assertNumQueries(0):
+            self.assertEqual(events.subscribers(self.org.id, "message.created"), (self.messages_hook.id,))
+            self.assertEqual(events.subscribers(self.org.id, "member.invited"), ())
+
+        self.rooms_hook.events = ["room.created", "message.created"]
+        self.rooms_hook.save()
+        self.assertEqual(
+            sorted(events.subscribers(self.org.id, "message.created")),
+            sorted([self.messages_hook.id, self.rooms_hook.id]),
+        )
+
+    def test_index_fill_racing_a_change_is_not_cached(self):
+        load = events._load
+
+        def disable_during_load(org_id):
+            # The fill reads the old webhooks, then the change commits and invalidates
+            index = load(org_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.messages_hook.is_active = False
+                self.messages_hook.save()
+            return index
+
+        metrics.reset()
+        with mock.patch.object(events, "_load", disable_during_load):
+            self.assertEqual(events.subscribers(self.org.id, "message.created"), (self.messages_hook.id,))
+        self.assertEqual(metrics.get("webhooks.index.stale_fills"), 1)
+        self.assertEqual(events.subscribers(self.org.id, "message.created"), ())
+
+    def test_single_join_does_not_load_the_room(self):
+        room = Room.objects.get(pk=self.room.pk)
+        with CaptureQueriesContext(connection) as queries:
+            RoomMember.objects.create(room_id=room.id, user=self.other)
+        self.assertFalse(any('FROM "rooms_room" WHERE "rooms_room"."id" = ' in q["sql"] and "LIMIT 21" in q["sql"] for q in queries))
+        self.assertEqual([p["data"]["user"] for _, p in self.outbox("member.joined")], [self.other.id])
+
+    def test_room_created_and_member_joined(self):
+        room = Room.objects.create(name="New", org=self.org, created_by=self.user)
+        ((webhook_id, payload),) = self.outbox("room.created")
+        self.assertEqual((webhook_id, payload["data"]["id"]), (self.rooms_hook.id, room.id))
+
+        RoomMember.objects.create(room=room, user=self.user)
+        # Bulk join of an existing and a new member only announces the new one
+        membership.add_members([(room.id, self.user.id), (room.id, self.other.id)])
+        joined = [payload["data"]["user"] for _, payload in self.outbox("member.joined")]
+        self.assertEqual(joined, [self.user.id, self.other.id])
+
+    def test_orgs_without_subscribers_cost_no_queries(self):
+        quiet = Organization.objects.create(name="Quiet")
+        room = Room.objects.create(name="Quiet room", org=quiet, created_by=self.user)
+        events.subscribers(quiet.id, "message.created")
+        msg = create_message(room, self.user, body="x")
+        with self.assertNumQueries(0):
+            self.assertEqual(events.messages_created([msg]), 0)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import FileUpload
+from .models import FileUpload, UploadSession
 
 @admin.register(FileUpload)
 class FileUploadAdmin(admin.ModelAdmin):
@@ -12,7 +12,7 @@ class FileUploadAdmin(admin.ModelAdmin):
     readonly_fields = ("id", "uploaded_at")
 
     fieldsets = (
-        (None, {"fields": ("user", "filename", "file_size", "content_type", "file_url")}),
+        (None, {"fields": ("user", "filename", "file_size", "content_type", "file_url", "sha256")}),
         ("Timestamps", {"fields": ("uploaded_at", "expires_at")}),
         ("IDs", {"fields": ("id",), "classes": ("collapse",)}),
     )
@@ -20,3 +20,17 @@ class FileUploadAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs.select_related("user")
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ("id", "filename", "user", "offset", "file_size", "content_type", "created_at", "expires_at")
+    list_filter = ("content_type", "created_at", "expires_at")
+    search_fields = ("filename", "user__email")
+    ordering = ("-created_at",)
+    autocomplete_fields = ("user",)
+    readonly_fields = ("id", "offset", "parts", "created_at")
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related("user")
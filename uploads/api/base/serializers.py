@@ -1,26 +1,52 @@
+import os
+
 from rest_framework import serializers
-from uploads.models import FileUpload
+from uploads.models import FileUpload, UploadSession
+
+ALLOWED_CONTENT_TYPES = [
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp',
+    'application/pdf', 'text/plain', 'application/zip',
+    'video/mp4', 'audio/mpeg', 'audio/wav'
+]
+MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB max
+
+
+def validate_content_type(value):
+    if value not in ALLOWED_CONTENT_TYPES:
+        raise serializers.ValidationError(f"File type {value} not allowed")
+    return value
 
 
 class FileUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = FileUpload
-        fields = ['id', 'filename', 'file_size', 'content_type', 'file_url', 'uploaded_at']
-        read_only_fields = ['id', 'uploaded_at']
+        fields = ['id', 'filename', 'file_size', 'content_type', 'file_url', 'sha256', 'uploaded_at']
+        read_only_fields = ['id', 'sha256', 'uploaded_at']
 
 
 class PresignedUploadSerializer(serializers.Serializer):
     filename = serializers.CharField(max_length=255)
     content_type = serializers.CharField(max_length=100)
-    file_size = serializers.IntegerField(min_value=1, max_value=100 * 1024 * 1024)  # 100MB max
+    file_size = serializers.IntegerField(min_value=1, max_value=MAX_FILE_SIZE)
     
     def validate_content_type(self, value):
-        allowed_types = [
-            'image/jpeg', 'image/png', 'image/gif', 'image/webp',
-            'application/pdf', 'text/plain', 'application/zip',
-            'video/mp4', 'audio/mpeg', 'audio/wav'
-        ]
-        if value not in allowed_types:
-            raise serializers.ValidationError(f"File type {value} not allowed")
+        return validate_content_type(value)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    file_size = serializers.IntegerField(min_value=1, max_value=MAX_FILE_SIZE)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'content_type', 'file_size', 'offset', 'created_at', 'expires_at']
+        read_only_fields = ['id', 'offset', 'created_at', 'expires_at']
+
+    def validate_filename(self, value):
+        value = os.path.basename(value.replace('\\', '/'))
+        if not value or value in ('.', '..'):
+            raise serializers.ValidationError("Invalid file name.")
         return value
 
+    def validate_content_type(self, value):
+        return validate_content_type(value)
+
@@ -1,12 +1,16 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.conf import settings
-from uploads.models import FileUpload
-from uploads.api.base.serializers import FileUploadSerializer
+from django.utils import timezone
+from uploads import sessions
+from uploads.models import FileUpload, UploadSession
+from uploads.api.base.serializers import FileUploadSerializer, UploadSessionSerializer
 import os
 
 class UploadView(APIView):
@@ -34,3 +38,79 @@ class UploadView(APIView):
 
         serializer = FileUploadSerializer(upload)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionViewSet(viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads (see ``uploads.sessions``).
+
+    ``POST sessions/`` starts a session. Each chunk is then ``PUT`` to
+    ``sessions/<id>/append/`` as the raw request body, with the
+    ``Upload-Offset`` header set to the bytes already sent. A wrong offset
+    gets 409 with the expected one. ``GET sessions/<id>/`` reports the offset
+    to resume from. ``POST sessions/<id>/complete/`` (optionally with the
+    file's ``sha256``) creates the ``FileUpload``.
+    """
+    serializer_class = UploadSessionSerializer
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user, expires_at__gt=timezone.now())
+
+    def session_response(self, session, status_code=status.HTTP_200_OK, **extra):
+        data = {**self.get_serializer(session).data, 'chunk_size': settings.UPLOAD_CHUNK_SIZE, **extra}
+        return Response(data, status=status_code, headers={'Upload-Offset': str(session.offset)})
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = sessions.start(request.user, **serializer.validated_data)
+        return self.session_response(session, status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return self.session_response(self.get_object())
+
+    def destroy(self, request, pk=None):
+        sessions.abort(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put'])
+    def append(self, request, pk=None):
+        """Stream one chunk (the raw body) into the session at ``Upload-Offset``."""
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            raise ValidationError({'Upload-Offset': 'An integer Upload-Offset header is required.'})
+        if not 0 < length <= settings.UPLOAD_CHUNK_MAX_SIZE:
+            raise ValidationError({'detail': f'Chunks must be 1 to {settings.UPLOAD_CHUNK_MAX_SIZE} bytes.'})
+        if offset + length > session.file_size:
+            raise ValidationError({'detail': 'Chunk extends past the declared file size.'})
+
+        try:
+            session, chunk_sha256 = sessions.append(session, offset, request.stream, length)
+        except sessions.OffsetMismatch as exc:
+            return Response(
+                {'error': 'Offset mismatch', 'offset': exc.offset},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Upload-Offset': str(exc.offset)},
+            )
+        except sessions.IncompleteUpload as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return self.session_response(session, chunk_sha256=chunk_sha256)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Assemble the received chunks into the final file."""
+        session = self.get_object()
+        try:
+            upload = sessions.complete(
+                session,
+                file_url=lambda path: request.build_absolute_uri(default_storage.url(path)),
+                sha256=request.data.get('sha256'),
+            )
+        except (sessions.IncompleteUpload, sessions.ChecksumMismatch) as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except sessions.CompletionInProgress as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(FileUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
@@ -1,7 +1,11 @@
 from django.urls import path
-from uploads.api.base.views import UploadView
+from uploads.api.base.views import UploadSessionViewSet, UploadView
 
 app_name = "uploads_v1"
 urlpatterns = [
     path("", UploadView.as_view(), name="uploads"),
+    path("sessions/", UploadSessionViewSet.as_view({"post": "create"}), name="upload-session-list"),
+    path("sessions/<uuid:pk>/", UploadSessionViewSet.as_view({"get": "retrieve", "delete": "destroy"}), name="upload-session-detail"),
+    path("sessions/<uuid:pk>/append/", UploadSessionViewSet.as_view({"put": "append"}), name="upload-session-append"),
+    path("sessions/<uuid:pk>/complete/", UploadSessionViewSet.as_view({"post": "complete"}), name="upload-session-complete"),
 ]
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from uploads import sessions
+
+
+class Command(BaseCommand):
+    help = "Delete expired resumable upload sessions and their stored chunks."
+
+    def handle(self, *args, **options):
+        purged = sessions.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired upload session(s)."))
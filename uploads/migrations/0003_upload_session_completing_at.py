@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0002_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='completing_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -11,6 +11,7 @@ class FileUpload(models.Model):
     file_size = models.BigIntegerField()
     content_type = models.CharField(max_length=100)
     file_url = models.URLField()
+    sha256 = models.CharField(max_length=64, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField(null=True, blank=True)
     
@@ -35,3 +36,27 @@ class FileUpload(models.Model):
 
         return f"{self.filename} ({user_identifier})"
 
+
+class UploadSession(models.Model):
+    """A resumable chunked upload in progress (see ``uploads.sessions``)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="upload_sessions")
+    filename = models.CharField(max_length=255)
+    file_size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100)
+    # Bytes received so far; the next chunk must start here
+    offset = models.BigIntegerField(default=0)
+    parts = models.JSONField(default=list)  # Storage names of the received chunks, in order
+    # Set while one request assembles the parts (see ``uploads.sessions.claim``)
+    completing_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.filename}: {self.offset}/{self.file_size}"
@@ -0,0 +1,239 @@
+"""
+Resumable chunked uploads.
+
+1. ``start``: a session records the file's name, type and size.
+2. ``append``: each chunk is the raw body of a request that names the offset
+   it starts at. The body is streamed to its own part file in
+   ``default_storage``, ``UPLOAD_STREAM_BLOCK_SIZE`` bytes at a time. The
+   offset is checked before streaming and again under ``select_for_update``
+   before the part is recorded. A duplicate, overlapping or out-of-order
+   chunk is therefore rejected with the current offset and cannot corrupt
+   the file. A client whose chunk failed halfway reads the offset and sends
+   it again.
+3. ``complete``: the session is claimed by setting ``completing_at`` under
+   a short row lock. The parts are then streamed in order into the final
+   file outside any transaction, and its SHA-256 is computed on the way.
+   A second short transaction creates the ``FileUpload`` row and deletes
+   the session, and the parts are deleted after commit.
+
+Memory use is one block per request, whatever the chunk or file size.
+Storage backends need no append support, so S3 works like the local disk.
+"""
+import hashlib
+import io
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from uploads.models import FileUpload, UploadSession
+
+logger = logging.getLogger(__name__)
+
+
+class OffsetMismatch(Exception):
+    """The chunk does not start where the session's received bytes end."""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+
+class IncompleteUpload(Exception):
+    """A chunk ended early, or ``complete`` was called before every byte arrived."""
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+class CompletionInProgress(Exception):
+    """Another request is assembling the session, or took it over mid-assembly."""
+
+
+class HashingReader(io.RawIOBase):
+    """Reads up to ``limit`` bytes from ``stream`` in ``block_size`` pieces, hashing as it goes."""
+
+    def __init__(self, stream, limit=None, block_size=None):
+        self.stream = stream
+        self.remaining = limit
+        self.block_size = block_size or settings.UPLOAD_STREAM_BLOCK_SIZE
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.block_size)
+        if self.remaining is not None:
+            size = min(size, self.remaining)
+        data = self.stream.read(size) if size > 0 else b""
+        buffer[:len(data)] = data
+        self.sha256.update(data)
+        self.received += len(data)
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        return len(data)
+
+
+class PartsReader(io.RawIOBase):
+    """One readable stream over stored parts, opened one at a time."""
+
+    def __init__(self, names):
+        self.names = iter(names)
+        self.current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self.current is None:
+                name = next(self.names, None)
+                if name is None:
+                    return 0
+                self.current = default_storage.open(name, "rb")
+            data = self.current.read(len(buffer))
+            if data:
+                buffer[:len(data)] = data
+                return len(data)
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+        super().close()
+
+
+def prefix(session):
+    return f"uploads/sessions/{session.id}/"
+
+
+def start(user, filename, content_type, file_size):
+    return UploadSession.objects.create(
+        user=user,
+        filename=filename,
+        content_type=content_type,
+        file_size=file_size,
+        expires_at=timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL),
+    )
+
+
+def append(session, offset, stream, length):
+    """
+    Stream ``length`` bytes from ``stream`` into a new part starting at
+    ``offset``. Returns the updated session and the chunk's SHA-256.
+    """
+    if offset != session.offset:
+        raise OffsetMismatch(session.offset)
+
+    reader = HashingReader(stream, limit=length)
+    name = default_storage.save(f"{prefix(session)}{offset:012d}", File(reader))
+    if reader.received != length:
+        default_storage.delete(name)
+        raise IncompleteUpload(f"Received {reader.received} of {length} bytes")
+
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.offset == offset:
+            session.offset += length
+            session.parts.append(name)
+            session.save(update_fields=["offset", "parts"])
+            return session, reader.sha256.hexdigest()
+    # Another request appended this range while we were streaming
+    default_storage.delete(name)
+    raise OffsetMismatch(session.offset)
+
+
+def complete(session, file_url, sha256=None):
+    """
+    Assemble the parts into ``uploads/<filename>`` and create the
+    ``FileUpload``. ``file_url`` maps the stored name to its public URL.
+    With ``sha256``, a mismatching file is discarded and the session kept.
+    """
+    session = claim(session)
+    try:
+        reader = HashingReader(PartsReader(session.parts))
+        path = default_storage.save(os.path.join("uploads", session.filename), File(reader, name=session.filename))
+    except BaseException:
+        release(session)
+        raise
+    digest = reader.sha256.hexdigest()
+    if sha256 and sha256.lower() != digest:
+        default_storage.delete(path)
+        release(session)
+        raise ChecksumMismatch(f"File SHA-256 is {digest}")
+
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().filter(
+            pk=session.pk, completing_at=session.completing_at
+        ).first()
+        if locked is not None:
+            upload = FileUpload.objects.create(
+                user_id=locked.user_id,
+                filename=locked.filename,
+                file_size=reader.received,
+                content_type=locked.content_type,
+                file_url=file_url(path),
+                sha256=digest,
+            )
+            parts = list(locked.parts)
+            locked.delete()
+            transaction.on_commit(lambda: delete_parts(parts))
+            return upload
+    # Aborted, expired or taken over while we were assembling
+    delete_parts([path])
+    raise CompletionInProgress("The upload session changed during assembly")
+
+
+def claim(session):
+    """
+    Mark a fully received session as completing so that one request
+    assembles it. The row lock is held only for this check; assembly runs
+    outside any transaction. A claim older than ``UPLOAD_COMPLETE_LEASE``
+    belongs to a worker that died and can be taken over.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.offset != session.file_size:
+            raise IncompleteUpload(f"Received {session.offset} of {session.file_size} bytes")
+        lease = timedelta(seconds=settings.UPLOAD_COMPLETE_LEASE)
+        if session.completing_at is not None and session.completing_at > now - lease:
+            raise CompletionInProgress("The upload is already being completed")
+        session.completing_at = now
+        session.save(update_fields=["completing_at"])
+    return session
+
+
+def release(session):
+    UploadSession.objects.filter(pk=session.pk, completing_at=session.completing_at).update(completing_at=None)
+
+
+def abort(session):
+    parts = list(session.parts)
+    session.delete()
+    transaction.on_commit(lambda: delete_parts(parts))
+
+
+def delete_parts(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning("Could not delete upload part %s", name, exc_info=True)
+
+
+def purge_expired(now=None):
+    """Delete expired sessions and their parts; returns how many sessions went."""
+    expired = list(UploadSession.objects.filter(expires_at__lte=now or timezone.now()))
+    for session in expired:
+        abort(session)
+    return len(expired)
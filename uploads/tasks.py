@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from uploads import sessions
+
+
+@shared_task
+def purge_upload_sessions():
+    """Delete expired resumable upload sessions and their chunks (scheduled by celery beat)."""
+    return {"purged": sessions.purge_expired()}
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Webhook, WebhookOutbox
+
+from . import health, stats
+from .models import Webhook, WebhookDeliveryStats, WebhookHealth, WebhookOutbox
 
 
 class WebhookOutboxInline(admin.TabularInline):
@@ -14,11 +16,11 @@ class WebhookOutboxInline(admin.TabularInline):
 class WebhookAdmin(admin.ModelAdmin):
     """Admin for Webhook model."""
     
-    list_display = ('id', 'org', 'url_display', 'is_active', 'event_count', 'last_triggered', 'created_at')
-    list_filter = ('is_active', 'created_at', 'last_triggered', 'org')
+    list_display = ('id', 'org', 'url_display', 'is_active', 'breaker_state', 'batch_enabled', 'event_count', 'last_triggered', 'created_at')
+    list_filter = ('is_active', 'health__state', 'batch_enabled', 'created_at', 'last_triggered', 'org')
     search_fields = ('url', 'org__name')
     ordering = ('-created_at',)
-    readonly_fields = ('secret', 'created_at', 'last_triggered')
+    readonly_fields = ('secret', 'created_at', 'last_triggered', 'breaker_state', 'concurrency_limit', 'retry_at')
     
     inlines = [WebhookOutboxInline]
     
@@ -26,6 +28,13 @@ class WebhookAdmin(admin.ModelAdmin):
         (None, {
             'fields': ('org', 'url', 'events', 'is_active')
         }),
+        ('Delivery health', {
+            'fields': ('breaker_state', 'concurrency_limit', 'retry_at'),
+        }),
+        ('Batching', {
+            'fields': ('batch_enabled', 'batch_max_size', 'batch_max_delay', 'batch_max_bytes'),
+            'classes': ('collapse',)
+        }),
         ('Security', {
             'fields': ('secret',),
             'classes': ('collapse',)
@@ -47,6 +56,25 @@ class WebhookAdmin(admin.ModelAdmin):
         """Display number of events."""
         return len(obj.events) if obj.events else 0
     event_count.short_description = 'Events'
+    
+    def breaker_state(self, obj):
+        """Display the circuit breaker state (closed until the first delivery)."""
+        return health.of(obj).get_state_display()
+    breaker_state.short_description = 'Breaker'
+    
+    def concurrency_limit(self, obj):
+        """Display the endpoint's current adaptive concurrency limit."""
+        return health.of(obj).concurrency_limit
+    concurrency_limit.short_description = 'Concurrency limit'
+    
+    def retry_at(self, obj):
+        """Display when an open breaker lets the next probe through."""
+        return health.of(obj).retry_at
+    retry_at.short_description = 'Next probe'
+    
+    def get_queryset(self, request):
+        """Optimize queryset with select_related."""
+        return super().get_queryset(request).select_related('org', 'health')
 
 
 @admin.register(WebhookOutbox)
@@ -75,3 +103,36 @@ class WebhookOutboxAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         """Optimize queryset with select_related."""
         return super().get_queryset(request).select_related('webhook', 'webhook__org')
+
+
+@admin.register(WebhookHealth)
+class WebhookHealthAdmin(admin.ModelAdmin):
+    """Admin for WebhookHealth model."""
+    
+    list_display = ('webhook', 'state', 'consecutive_failures', 'concurrency_limit', 'retry_at', 'last_success_at', 'last_failure_at')
+    list_filter = ('state', 'webhook__org')
+    search_fields = ('webhook__url', 'webhook__org__name')
+    ordering = ('-last_failure_at',)
+    
+    def get_queryset(self, request):
+        """Optimize queryset with select_related."""
+        return super().get_queryset(request).select_related('webhook')
+
+
+@admin.register(WebhookDeliveryStats)
+class WebhookDeliveryStatsAdmin(admin.ModelAdmin):
+    """Admin for WebhookDeliveryStats model."""
+    
+    list_display = ('webhook', 'hour', 'requests', 'delivered', 'failed', 'gave_up', 'congested', 'latency_p95')
+    list_filter = ('hour', 'webhook__org')
+    search_fields = ('webhook__url', 'webhook__org__name')
+    ordering = ('-hour',)
+    
+    def latency_p95(self, obj):
+        """Display the hour's 95th percentile latency (bucket upper bound, ms)."""
+        return stats.percentile(obj.latency_histogram, 95)
+    latency_p95.short_description = 'p95 (ms)'
+    
+    def get_queryset(self, request):
+        """Optimize queryset with select_related."""
+        return super().get_queryset(request).select_related('webhook')
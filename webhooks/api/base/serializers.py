@@ -5,7 +5,10 @@ from webhooks.models import Webhook
 class WebhookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Webhook
-        fields = ['id', 'url', 'events', 'is_active', 'created_at', 'last_triggered']
+        fields = [
+            'id', 'url', 'events', 'is_active', 'created_at', 'last_triggered',
+            'batch_enabled', 'batch_max_size', 'batch_max_delay', 'batch_max_bytes',
+        ]
         read_only_fields = ['id', 'created_at', 'last_triggered']
     
     def validate_events(self, value):
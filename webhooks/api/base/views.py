@@ -1,9 +1,14 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-from webhooks.models import Webhook, WebhookOutbox
+from django.utils import timezone
+from datetime import timedelta
+from webhooks import health, stats
+from webhooks.models import Webhook, WebhookHealth, WebhookOutbox
 from webhooks.api.base.serializers import WebhookSerializer, WebhookTestSerializer
 from orgs.models import OrganizationMember
 from config.permissions import IsOrgAdmin
@@ -79,4 +84,25 @@ class WebhookViewSet(viewsets.ModelViewSet):
             'created_at': event.created_at.isoformat(),
             'last_attempt_at': event.last_attempt_at.isoformat() if event.last_attempt_at else None,
             'last_error': event.last_error
-        } for event in events])
\ No newline at end of file
+        } for event in events])
+    
+    @action(detail=True, methods=['get'])
+    def webhook_health(self, request, pk=None):
+        """The endpoint's circuit breaker state and adaptive concurrency limit."""
+        webhook = self.get_object()
+        return Response(health.summary(WebhookHealth.objects.filter(webhook=webhook).first()))
+    
+    @action(detail=True, methods=['get'])
+    def webhook_stats(self, request, pk=None):
+        """Delivery statistics for the last ``?hours=`` (default 24), read from the hourly rollups."""
+        webhook = self.get_object()
+        try:
+            hours = int(request.query_params.get('hours', 24))
+        except ValueError:
+            raise ValidationError({'hours': 'Must be an integer.'})
+        hours = min(max(hours, 1), settings.WEBHOOK_STATS_RETENTION_DAYS * 24)
+        
+        return Response({
+            'hours': hours,
+            **stats.report(webhook, timezone.now() - timedelta(hours=hours - 1)),
+        })
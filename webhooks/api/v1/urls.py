@@ -7,5 +7,7 @@ urlpatterns = [
     path("<int:pk>/", WebhookViewSet.as_view({"get": "retrieve", "put": "update", "patch": "partial_update", "delete": "destroy"}), name="webhook-detail"),
     path("<int:pk>/test/", WebhookViewSet.as_view({"post": "test_webhook"}), name="webhook-test"),
     path("<int:pk>/events/", WebhookViewSet.as_view({"get": "webhook_events"}), name="webhook-events"),
+    path("<int:pk>/health/", WebhookViewSet.as_view({"get": "webhook_health"}), name="webhook-health"),
+    path("<int:pk>/stats/", WebhookViewSet.as_view({"get": "webhook_stats"}), name="webhook-stats"),
 ]
 
@@ -0,0 +1,404 @@
+"""
+Webhook delivery engine: drains ``WebhookOutbox``.
+
+Every endpoint with due rows gets its own worker. A worker runs rounds for
+its endpoint only: it claims up to ``WEBHOOK_DISPATCH_BATCH_SIZE`` due rows
+with ``SELECT ... FOR UPDATE SKIP LOCKED`` and leases them by pushing
+``next_attempt_at`` ``WEBHOOK_LEASE_SECONDS`` ahead, so concurrent
+dispatchers never pick the same row and a crashed one's rows come back on
+their own. The rows are POSTed concurrently through one shared, pooled
+``httpx.AsyncClient``, at most ``WEBHOOK_PER_HOST_CONCURRENCY`` requests per
+host at a time. The outcomes are written back with a few set-based UPDATEs,
+together with the endpoint's health and hourly statistics
+(``webhooks.stats``). The next round starts as soon as that is done.
+
+A round takes at most the endpoint's adaptive concurrency limit, or a
+single probe while its circuit breaker is open (see ``webhooks.health``).
+Endpoints never wait for each other: a slow or failing one holds up only
+its own worker. A dead one costs a probe per cooldown instead of a timeout
+per pending row.
+
+Only one dispatcher runs at a time. ``dispatch`` takes a lock in the shared
+cache (``WEBHOOK_DISPATCH_LOCK_TTL``) and returns at once, marked
+``skipped``, while another one holds it. Beat can fire more often than a run
+lasts, and the per-host concurrency would otherwise be enforced per
+dispatcher rather than per endpoint. The coordinator renews the lock while
+workers run. If the lock is lost, workers claim nothing more. Each endpoint
+has a single worker whose rounds run one after another. ``claim_due``
+re-reads the health rows under ``select_for_update`` before leasing. The
+single half-open probe and the concurrency limit therefore hold per
+endpoint, not per process.
+
+Webhooks with ``batch_enabled`` receive their events as one JSON array per
+request (``[{"delivery": id, "event": ..., "data": ...}, ...]``). Their rows
+are only claimed once ``batch_max_size`` are due, the oldest has waited
+``batch_max_delay`` seconds, or a batch is being retried. A batch is capped
+at ``batch_max_size`` events and ``batch_max_bytes``, and it succeeds or
+retries as a unit.
+
+Every request is signed with the webhook's secret::
+
+    X-ChatBoard-Signature: sha256=HMAC_SHA256(secret, f"{timestamp}.{body}")
+
+where ``timestamp`` is the ``X-ChatBoard-Timestamp`` header.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Min, Value, When, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from config import codec, metrics
+from webhooks import health, stats as delivery_stats
+from webhooks.models import Webhook, WebhookHealth, WebhookOutbox
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "webhooks:dispatch:lock"
+
+
+@dataclass
+class DispatchStats:
+    delivered: int = 0
+    failed: int = 0
+    requests: int = 0
+    elapsed: float = 0.0
+    # Another dispatcher held the lock, so nothing was attempted
+    skipped: bool = False
+
+    @property
+    def attempts(self):
+        return self.delivered + self.failed
+
+    @property
+    def per_second(self):
+        return self.attempts / self.elapsed if self.elapsed else 0.0
+
+
+def sign(secret, timestamp, body):
+    mac = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256)
+    return f"sha256={mac.hexdigest()}"
+
+
+def backoff(retries):
+    """Delay before the next attempt after ``retries`` failures (as ``WebhookOutbox.schedule_retry``)."""
+    return timedelta(minutes=2 ** min(retries, 6))
+
+
+def due(now, webhook_ids=None):
+    rows = WebhookOutbox.objects.filter(
+        status__in=WebhookOutbox.DUE_STATUSES, next_attempt_at__lte=now, webhook__is_active=True
+    )
+    if webhook_ids is not None:
+        rows = rows.filter(webhook_id__in=webhook_ids)
+    return rows
+
+
+def plan_round(now, webhook_ids=None):
+    """
+    ``{webhook_id: rows}`` each endpoint may take this round: its allowed
+    requests (breaker and AIMD limit) times the rows per request. Batching
+    endpoints only appear once their batch is ready. Also returns the
+    endpoints that get a half-open probe.
+    """
+    groups = due(now, webhook_ids).values(
+        "webhook_id", "webhook__batch_enabled", "webhook__batch_max_size", "webhook__batch_max_delay",
+        "webhook__health__state", "webhook__health__concurrency_limit", "webhook__health__retry_at",
+    ).annotate(pending=Count("id"), oldest=Min("created_at"), retried=Max("retries"))
+
+    plan, probes = {}, []
+    for group in groups:
+        batching = group["webhook__batch_enabled"]
+        if batching and not (
+            group["pending"] >= group["webhook__batch_max_size"]
+            or group["oldest"] <= now - timedelta(seconds=group["webhook__batch_max_delay"])
+            or group["retried"] > 0
+        ):
+            continue
+        state = group["webhook__health__state"]
+        units = health.allowed_units(
+            state, group["webhook__health__concurrency_limit"], group["webhook__health__retry_at"], now
+        )
+        if not units:
+            continue
+        plan[group["webhook_id"]] = units * (group["webhook__batch_max_size"] if batching else 1)
+        if state in (WebhookHealth.OPEN, WebhookHealth.HALF_OPEN):
+            probes.append(group["webhook_id"])
+    return plan, probes
+
+
+def ready_endpoints():
+    """Ids of the endpoints that may send something now."""
+    plan, _ = plan_round(timezone.now())
+    return set(plan)
+
+
+def claim_due(limit, webhook_ids=None):
+    """
+    Lock, lease and return up to ``limit`` due outbox rows (with their
+    webhook and health), optionally only ``webhook_ids``' rows. Each endpoint
+    contributes at most its planned share, oldest first.
+    """
+    now = timezone.now()
+    plan, _ = plan_round(now, webhook_ids)
+    if not plan:
+        return []
+    ranked = (
+        due(now).filter(webhook_id__in=plan)
+        .annotate(rank=Window(RowNumber(), partition_by=F("webhook_id"), order_by=[F("next_attempt_at").asc(), F("id").asc()]))
+        .filter(rank__lte=max(plan.values()))
+        .order_by("next_attempt_at", "id")
+        .values_list("id", "webhook_id", "rank")
+    )
+    chosen = [row_id for row_id, webhook_id, rank in ranked if rank <= plan[webhook_id]][:limit]
+
+    with transaction.atomic():
+        # Decide from the health rows as they are now, not as planned
+        locked = {
+            row.webhook_id: row
+            for row in WebhookHealth.objects.select_for_update().filter(webhook_id__in=plan).order_by("webhook_id")
+        }
+        rows = list(
+            due(now).filter(id__in=chosen)
+            .select_for_update(skip_locked=True, of=("self",))
+            .select_related("webhook", "webhook__health")
+            .order_by("next_attempt_at", "id")
+        )
+        rows = within_limits(rows, locked, now)
+        if rows:
+            WebhookOutbox.objects.filter(id__in=[row.id for row in rows]).update(
+                next_attempt_at=now + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS)
+            )
+            probing = {
+                row.webhook_id for row in rows
+                if row.webhook_id in locked and locked[row.webhook_id].state != WebhookHealth.CLOSED
+            }
+            if probing:
+                WebhookHealth.objects.filter(webhook_id__in=probing).update(state=WebhookHealth.HALF_OPEN)
+                for webhook_id in probing:
+                    locked[webhook_id].state = WebhookHealth.HALF_OPEN
+    return rows
+
+
+def within_limits(rows, locked, now):
+    """Drop claimed rows beyond what each endpoint's locked health row allows."""
+    taken, kept = defaultdict(int), []
+    for row in rows:
+        current = locked.get(row.webhook_id)
+        if current is None:
+            units = health.allowed_units(None, None, None, now)
+        else:
+            row.webhook.health = current
+            units = health.allowed_units(current.state, current.concurrency_limit, current.retry_at, now)
+        cap = units * (row.webhook.batch_max_size if row.webhook.batch_enabled else 1)
+        if taken[row.webhook_id] < cap:
+            taken[row.webhook_id] += 1
+            kept.append(row)
+    return kept
+
+
+def batch_item(row):
+    return {"delivery": row.id, **row.payload}
+
+
+def group_deliveries(rows):
+    """Split claimed rows into delivery units: one row, or one webhook's batch."""
+    units, batching = [], defaultdict(list)
+    for row in rows:
+        if row.webhook.batch_enabled:
+            batching[row.webhook_id].append(row)
+        else:
+            units.append([row])
+    for webhook_rows in batching.values():
+        webhook = webhook_rows[0].webhook
+        unit, size = [], 2  # the array's brackets
+        for row in webhook_rows:
+            row_size = len(codec.dumps(batch_item(row)).encode()) + 1
+            if unit and (len(unit) >= webhook.batch_max_size or size + row_size > webhook.batch_max_bytes):
+                units.append(unit)
+                unit, size = [], 2
+            unit.append(row)
+            size += row_size
+        units.append(unit)
+    return units
+
+
+async def send_unit(client, unit, host_limits):
+    """
+    POST one delivery unit. Returns ``(error, congested, latency_ms)``:
+    ``error`` is None on a 2xx, and ``congested`` flags timeouts/429/503 for
+    the AIMD limit.
+    """
+    webhook = unit[0].webhook
+    if webhook.batch_enabled:
+        body = codec.dumps([batch_item(row) for row in unit]).encode()
+        event_type = "batch"
+    else:
+        body = codec.dumps(unit[0].payload).encode()
+        event_type = unit[0].event_type
+    timestamp = str(int(time.time()))
+    headers = {
+        "Content-Type": "application/json",
+        "X-ChatBoard-Event": event_type,
+        "X-ChatBoard-Delivery": str(unit[0].id),
+        "X-ChatBoard-Timestamp": timestamp,
+        "X-ChatBoard-Signature": sign(webhook.secret, timestamp, body),
+    }
+    if webhook.batch_enabled:
+        headers["X-ChatBoard-Batch-Size"] = str(len(unit))
+    async with host_limits[urlsplit(webhook.url).netloc]:
+        started = time.perf_counter()
+        try:
+            response = await client.post(webhook.url, content=body, headers=headers)
+        except httpx.HTTPError as exc:
+            latency_ms = (time.perf_counter() - started) * 1000
+            return f"{type(exc).__name__}: {exc}"[:1000], isinstance(exc, httpx.TimeoutException), latency_ms
+        latency_ms = (time.perf_counter() - started) * 1000
+    if response.is_success:
+        return None, False, latency_ms
+    error = f"HTTP {response.status_code}: {response.text[:500]}"
+    return error, response.status_code in health.CONGESTION_STATUSES, latency_ms
+
+
+def record_outcomes(results):
+    """
+    Write back ``(unit, error, congested, latency_ms)`` results: one UPDATE
+    for everything sent, one per distinct (error, backoff) for the failures,
+    so a batch moves as a unit and nothing is saved row by row, then the
+    endpoints' health (``webhooks.health``) and hourly statistics.
+    """
+    now = timezone.now()
+    sent, failures = [], defaultdict(list)
+    for unit, error, *_ in results:
+        if error is None:
+            sent.extend(unit)
+        else:
+            # A batch retries together, on the schedule of its most-retried row
+            failures[(error, max(row.retries for row in unit) + 1)].extend(row.id for row in unit)
+
+    with transaction.atomic():
+        if sent:
+            WebhookOutbox.objects.filter(id__in=[row.id for row in sent]).update(
+                status="sent", last_attempt_at=now, last_error=""
+            )
+            Webhook.objects.filter(id__in={row.webhook_id for row in sent}).update(last_triggered=now)
+        for (error, attempt), ids in failures.items():
+            WebhookOutbox.objects.filter(id__in=ids).update(
+                retries=F("retries") + 1,
+                status=Case(When(retries__gte=F("max_retries") - 1, then=Value("failed")), default=Value("retrying")),
+                last_error=error,
+                last_attempt_at=now,
+                next_attempt_at=now + backoff(attempt),
+            )
+        tripped = health.record(results, now)
+        delivery_stats.record(results, now)
+    failed = sum(len(ids) for ids in failures.values())
+    metrics.incr("webhooks.delivered", len(sent))
+    metrics.incr("webhooks.failed", failed)
+    metrics.incr("webhooks.breaker.tripped", len(tripped))
+    return len(sent), failed
+
+
+async def deliver_endpoint(webhook_id, client, host_limits, stats, batch_size, deadline, stop):
+    """Run rounds for one endpoint until it has nothing it may send (or time is up, or ``stop`` is set)."""
+    while (deadline is None or time.perf_counter() < deadline) and not stop.is_set():
+        rows = await sync_to_async(claim_due)(batch_size, [webhook_id])
+        if not rows:
+            return
+        units = group_deliveries(rows)
+        outcomes = await asyncio.gather(*(send_unit(client, unit, host_limits) for unit in units))
+        results = [(unit, *outcome) for unit, outcome in zip(units, outcomes)]
+        delivered, failed = await sync_to_async(record_outcomes)(results)
+        stats.delivered += delivered
+        stats.failed += failed
+        stats.requests += len(units)
+
+
+async def dispatch_async(batch_size=None, max_seconds=None, lock_token=None):
+    batch_size = batch_size or settings.WEBHOOK_DISPATCH_BATCH_SIZE
+    stats = DispatchStats()
+    started = time.perf_counter()
+    deadline = None if max_seconds is None else started + max_seconds
+    host_limits = defaultdict(lambda: asyncio.Semaphore(settings.WEBHOOK_PER_HOST_CONCURRENCY))
+    limits = httpx.Limits(
+        max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+    )
+    workers, stop = {}, asyncio.Event()
+    async with httpx.AsyncClient(limits=limits, timeout=settings.WEBHOOK_TIMEOUT) as client:
+        try:
+            while deadline is None or time.perf_counter() < deadline:
+                if lock_token is not None and not await sync_to_async(renew_lock)(lock_token):
+                    logger.warning("Lost the webhook dispatch lock; finishing the rounds in flight")
+                    metrics.incr("webhooks.dispatch.lock_lost")
+                    stop.set()
+                    break
+                workers = {webhook_id: task for webhook_id, task in workers.items() if not task.done()}
+                for webhook_id in await sync_to_async(ready_endpoints)() - workers.keys():
+                    workers[webhook_id] = asyncio.create_task(
+                        deliver_endpoint(webhook_id, client, host_limits, stats, batch_size, deadline, stop)
+                    )
+                if not workers:
+                    break
+                # Wake up when an endpoint finishes or others may have become due
+                await asyncio.wait(
+                    workers.values(), timeout=settings.WEBHOOK_DISPATCH_POLL_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+        finally:
+            # Past the deadline, let the rounds in flight finish and record their outcomes
+            await asyncio.gather(*workers.values())
+    stats.elapsed = time.perf_counter() - started
+    if stats.attempts:
+        metrics.gauge("webhooks.deliveries_per_second", round(stats.per_second, 1))
+        logger.info(
+            "Webhook dispatch: %s delivered, %s failed in %s request(s), %.2fs (%.1f/s)",
+            stats.delivered, stats.failed, stats.requests, stats.elapsed, stats.per_second,
+        )
+    return stats
+
+
+def acquire_lock():
+    """A token if this process may dispatch now, else None."""
+    token = uuid.uuid4().hex
+    if cache.add(LOCK_KEY, token, timeout=settings.WEBHOOK_DISPATCH_LOCK_TTL):
+        return token
+    return None
+
+
+def renew_lock(token):
+    """Extend the lock if this dispatcher still holds it; False if it was lost."""
+    if cache.get(LOCK_KEY) != token:
+        return False
+    return cache.touch(LOCK_KEY, timeout=settings.WEBHOOK_DISPATCH_LOCK_TTL)
+
+
+def release_lock(token):
+    if cache.get(LOCK_KEY) == token:
+        cache.delete(LOCK_KEY)
+
+
+def dispatch(batch_size=None, max_seconds=None):
+    """Deliver due outbox rows until none are left (or ``max_seconds`` pass), unless another dispatcher is running."""
+    token = acquire_lock()
+    if token is None:
+        metrics.incr("webhooks.dispatch.skipped")
+        return DispatchStats(skipped=True)
+    try:
+        return async_to_sync(dispatch_async)(batch_size, max_seconds, token)
+    finally:
+        release_lock(token)
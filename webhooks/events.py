@@ -0,0 +1,176 @@
+"""
+Domain events → webhook outbox.
+
+``emit`` turns ``(org_id, event_type, data)`` triples into ``WebhookOutbox``
+rows, one per subscribed webhook, in a single ``bulk_create`` on the caller's
+connection. Call it inside the transaction of the triggering write, so the
+rows commit (or roll back) with it. The dispatcher picks them up from there.
+
+Subscribers are resolved through a per-org index ``{event_type: (webhook_id,
+...)}``. It is built from one query and cached in this process
+(``WEBHOOK_INDEX_LOCAL_TTL``) and in the shared cache
+(``WEBHOOK_INDEX_CACHE_TTL``). Webhook signals drop it immediately and again
+after commit. Orgs without subscribers therefore cost one cache lookup per
+event type, with no query. Invalidation also bumps a per-org generation key,
+so a fill that read the webhooks before a change committed cannot cache the
+old index (``config.generations``).
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from config import generations, metrics
+from config.lru import TTLCache
+
+MESSAGE_CREATED = "message.created"
+MEMBER_JOINED = "member.joined"
+ROOM_CREATED = "room.created"
+
+_local = TTLCache(maxsize=settings.WEBHOOK_INDEX_LOCAL_MAXSIZE, ttl=settings.WEBHOOK_INDEX_LOCAL_TTL)
+
+
+def _key(org_id):
+    return f"webhooks:index:{org_id}"
+
+
+def _generation_key(org_id):
+    return f"webhooks:index:gen:{org_id}"
+
+
+def _load(org_id):
+    from webhooks.models import Webhook
+
+    index = defaultdict(list)
+    for webhook_id, event_types in Webhook.objects.filter(org_id=org_id, is_active=True).values_list("id", "events"):
+        for event_type in event_types or ():
+            index[event_type].append(webhook_id)
+    return {event_type: tuple(ids) for event_type, ids in index.items()}
+
+
+def get_index(org_id):
+    key = _key(org_id)
+    index = _local.get(key)
+    if index is None:
+        index = cache.get(key)
+        if index is None:
+            metrics.incr("webhooks.index.misses")
+            generation_key = _generation_key(org_id)
+            generation = generations.current(generation_key)
+            index = _load(org_id)
+            timeout = settings.WEBHOOK_INDEX_CACHE_TTL
+            if not generations.set_if_current(key, index, timeout, generation_key, generation):
+                metrics.incr("webhooks.index.stale_fills")
+                return index
+        _local.set(key, index)
+    return index
+
+
+def subscribers(org_id, event_type):
+    """Ids of the org's active webhooks subscribed to ``event_type``."""
+    if org_id is None:
+        return ()
+    return get_index(org_id).get(event_type, ())
+
+
+def invalidate(org_ids):
+    org_ids = set(org_ids)
+    generations.bump([_generation_key(org_id) for org_id in org_ids], timeout=settings.WEBHOOK_INDEX_CACHE_TTL)
+    keys = [_key(org_id) for org_id in org_ids]
+    for key in keys:
+        _local.delete(key)
+    cache.delete_many(keys)
+
+
+def invalidate_on_commit(org_ids):
+    org_ids = list(org_ids)
+    invalidate(org_ids)
+    transaction.on_commit(lambda: invalidate(org_ids))
+
+
+def clear_local():
+    _local.clear()
+
+
+def emit(events):
+    """Queue ``(org_id, event_type, data)`` events for their subscribers; returns rows written."""
+    from webhooks.models import WebhookOutbox
+
+    rows = [
+        WebhookOutbox(webhook_id=webhook_id, event_type=event_type, payload={"event": event_type, "data": data})
+        for org_id, event_type, data in events
+        for webhook_id in subscribers(org_id, event_type)
+    ]
+    if rows:
+        WebhookOutbox.objects.bulk_create(rows, batch_size=settings.WEBHOOK_OUTBOX_CHUNK_SIZE)
+        metrics.incr("webhooks.emitted", len(rows))
+    return len(rows)
+
+
+def room_orgs(room_ids):
+    from rooms.models import Room
+
+    return dict(Room.objects.filter(pk__in=set(room_ids)).values_list("id", "org_id"))
+
+
+def wanted(org_ids, event_type):
+    return {org_id for org_id in set(org_ids) if subscribers(org_id, event_type)}
+
+
+def _message_data(msg):
+    from messages_app.pipeline import message_payload
+
+    data = message_payload(msg)
+    del data["type"]
+    data["org"] = msg.org_id
+    return data
+
+
+def messages_created(messages):
+    """``message.created`` for freshly inserted messages (``org_id`` set)."""
+    orgs = wanted((msg.org_id for msg in messages), MESSAGE_CREATED)
+    if not orgs:
+        return 0
+    return emit((msg.org_id, MESSAGE_CREATED, _message_data(msg)) for msg in messages if msg.org_id in orgs)
+
+
+def room_created(room):
+    if not subscribers(room.org_id, ROOM_CREATED):
+        return 0
+    return emit([(room.org_id, ROOM_CREATED, {
+        "id": room.id,
+        "org": room.org_id,
+        "name": room.name,
+        "access_level": room.access_level,
+        "created_by": room.created_by_id,
+        "created_at": room.created_at.isoformat(),
+    })])
+
+
+def members_joined(pairs, org_ids=None, skip_existing=False):
+    """
+    ``member.joined`` for ``(room_id, user_id)`` memberships. With
+    ``skip_existing``, pairs that are already members are left out (for
+    inserts that ignore conflicts); only checked when someone subscribes.
+    """
+    from rooms.models import RoomMember
+
+    pairs = list(pairs)
+    if not pairs:
+        return 0
+    org_ids = org_ids or room_orgs(room_id for room_id, _ in pairs)
+    orgs = wanted(org_ids.values(), MEMBER_JOINED)
+    pairs = [(room_id, user_id) for room_id, user_id in pairs if org_ids.get(room_id) in orgs]
+    if pairs and skip_existing:
+        existing = set(
+            RoomMember.objects.filter(
+                room_id__in={room_id for room_id, _ in pairs},
+                user_id__in={user_id for _, user_id in pairs},
+            ).values_list("room_id", "user_id")
+        )
+        pairs = [pair for pair in pairs if pair not in existing]
+    return emit(
+        (org_ids[room_id], MEMBER_JOINED, {"room": room_id, "user": user_id, "org": org_ids[room_id]})
+        for room_id, user_id in pairs
+    )
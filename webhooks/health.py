@@ -0,0 +1,136 @@
+"""
+Per-endpoint delivery health (``WebhookHealth``).
+
+Circuit breaker:
+
+- ``closed``: normal delivery.
+- ``open``: after ``WEBHOOK_BREAKER_THRESHOLD`` consecutive failures, nothing
+  is sent until ``retry_at``. The endpoint's whole due backlog is moved to
+  ``retry_at`` in one UPDATE, so it stops occupying dispatch rounds.
+  Cooldowns double on every failed probe, up to
+  ``WEBHOOK_BREAKER_MAX_COOLDOWN``.
+- ``half_open``: once ``retry_at`` passes, a single request (or batch) is
+  sent as a probe. Success closes the breaker; failure opens it again. The
+  dispatcher moves the row to ``half_open`` when it claims the probe, with
+  the row locked. No second probe goes out while the first one's lease
+  (``WEBHOOK_LEASE_SECONDS``) may still be running.
+
+Concurrency is AIMD: each round an endpoint may have ``concurrency_limit``
+requests in flight. The limit grows by one after a round with successes and
+no congestion, and is halved after a round with timeouts, 429s or 503s.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+
+from webhooks.models import WebhookHealth, WebhookOutbox
+
+CONGESTION_STATUSES = {429, 503}
+
+HEALTH_FIELDS = [
+    "state", "consecutive_failures", "concurrency_limit", "opened_at",
+    "retry_at", "last_success_at", "last_failure_at",
+]
+
+
+def allowed_units(state, concurrency_limit, retry_at, now):
+    """Requests an endpoint may have in flight this round (no health row = a fresh endpoint)."""
+    if state is None:
+        return WebhookHealth._meta.get_field("concurrency_limit").default
+    if state == WebhookHealth.CLOSED:
+        return concurrency_limit
+    if state == WebhookHealth.HALF_OPEN and retry_at is not None:
+        # A probe is out; send another only if its dispatcher must have died
+        retry_at += timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS)
+    # One probe once the cooldown has passed
+    return 1 if retry_at is None or retry_at <= now else 0
+
+
+def of(webhook):
+    try:
+        return webhook.health
+    except WebhookHealth.DoesNotExist:
+        return WebhookHealth(webhook=webhook)
+
+
+def cooldown(health):
+    """``WEBHOOK_BREAKER_COOLDOWN`` on the first trip, then double the previous one (call before ``apply`` touches ``health``)."""
+    seconds = settings.WEBHOOK_BREAKER_COOLDOWN
+    if health.state != WebhookHealth.CLOSED and health.retry_at and health.last_failure_at:
+        seconds = 2 * (health.retry_at - health.last_failure_at).total_seconds()
+    return timedelta(seconds=min(seconds, settings.WEBHOOK_BREAKER_MAX_COOLDOWN))
+
+
+def apply(health, successes, failures, congested, now):
+    """Fold one round's outcomes into ``health``; True if the breaker tripped."""
+    next_cooldown = cooldown(health)
+    if successes:
+        health.state = WebhookHealth.CLOSED
+        health.consecutive_failures = 0
+        health.opened_at = health.retry_at = None
+        health.last_success_at = now
+    elif failures:
+        health.consecutive_failures += failures
+    if failures:
+        health.last_failure_at = now
+
+    if congested:
+        health.concurrency_limit = max(1, health.concurrency_limit // 2)
+    elif successes:
+        health.concurrency_limit = min(health.concurrency_limit + 1, settings.WEBHOOK_AIMD_MAX_CONCURRENCY)
+
+    tripped = bool(failures) and not successes and (
+        health.state == WebhookHealth.HALF_OPEN
+        or health.consecutive_failures >= settings.WEBHOOK_BREAKER_THRESHOLD
+    )
+    if tripped:
+        health.state = WebhookHealth.OPEN
+        health.opened_at = health.opened_at or now
+        health.retry_at = now + next_cooldown
+    return tripped
+
+
+def record(results, now):
+    """
+    Update health for ``(unit, error, congested, latency_ms)`` results in
+    one upsert, and push the backlog of every endpoint whose breaker tripped
+    to its ``retry_at`` (one UPDATE per tripped endpoint).
+    """
+    tallies = defaultdict(lambda: [0, 0, False])
+    webhooks = {}
+    for unit, error, congested, _ in results:
+        webhook = unit[0].webhook
+        webhooks[webhook.id] = webhook
+        tally = tallies[webhook.id]
+        tally[0 if error is None else 1] += 1
+        tally[2] = tally[2] or congested
+
+    rows, tripped = [], []
+    # Upsert in webhook order so concurrent dispatchers lock rows alike
+    for webhook_id, (successes, failures, congested) in sorted(tallies.items()):
+        health = of(webhooks[webhook_id])
+        if apply(health, successes, failures, congested, now):
+            tripped.append(health)
+        rows.append(health)
+    WebhookHealth.objects.bulk_create(rows, update_conflicts=True, unique_fields=["webhook"], update_fields=HEALTH_FIELDS)
+
+    for health in tripped:
+        WebhookOutbox.objects.filter(
+            webhook_id=health.webhook_id, status__in=WebhookOutbox.DUE_STATUSES, next_attempt_at__lt=health.retry_at
+        ).update(next_attempt_at=health.retry_at)
+    return tripped
+
+
+def summary(health):
+    """JSON-friendly breaker state for the API (``None`` = never delivered)."""
+    if health is None:
+        health = WebhookHealth()
+    return {
+        "state": health.state,
+        "consecutive_failures": health.consecutive_failures,
+        "concurrency_limit": health.concurrency_limit,
+        "retry_at": health.retry_at.isoformat() if health.retry_at else None,
+        "last_success_at": health.last_success_at.isoformat() if health.last_success_at else None,
+        "last_failure_at": health.last_failure_at.isoformat() if health.last_failure_at else None,
+    }
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from webhooks import dispatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver due webhook outbox rows and report throughput. Safe to run next to "
+        "the celery beat task: only one dispatcher delivers at a time, the others skip."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Rows claimed per round.")
+        parser.add_argument("--forever", action="store_true", help="Keep polling instead of exiting when drained.")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls with --forever.")
+
+    def handle(self, *args, **options):
+        while True:
+            stats = dispatcher.dispatch(batch_size=options["batch_size"])
+            if stats.skipped:
+                self.stdout.write("Another dispatcher is running; skipped.")
+            elif stats.attempts:
+                self.stdout.write(
+                    f"{stats.delivered} delivered, {stats.failed} failed in {stats.requests} request(s), {stats.elapsed:.2f}s "
+                    f"({stats.per_second:.1f} deliveries/s)"
+                )
+            if not options["forever"]:
+                break
+            time.sleep(options["poll_interval"])
+        self.stdout.write(self.style.SUCCESS("Webhook outbox drained."))
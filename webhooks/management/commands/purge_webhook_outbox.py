@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from webhooks import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete sent and failed webhook outbox rows past their retention period, in small "
+        "batches. Safe to run next to live dispatchers and to interrupt and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Rows deleted per statement.")
+        parser.add_argument("--archive", help="Append purged rows to this file as JSON lines first.")
+        parser.add_argument("--sleep", type=float, default=0.0, help="Pause between batches, in seconds.")
+
+    def handle(self, *args, **options):
+        if options["archive"]:
+            with open(options["archive"], "a", encoding="utf-8") as archive:
+                purged, rollups = retention.purge(batch_size=options["batch_size"], archive=archive, pause=options["sleep"])
+        else:
+            purged, rollups = retention.purge(batch_size=options["batch_size"], pause=options["sleep"])
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} outbox row(s) and {rollups} hourly rollup(s)."))
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-17 18:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0002_alter_webhookoutbox_next_attempt_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='webhookoutbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
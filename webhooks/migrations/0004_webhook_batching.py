@@ -0,0 +1,34 @@
+# Generated by Django 5.0.7 on 2026-10-17 18:31
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0003_outbox_next_attempt_aware'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_enabled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_max_bytes',
+            field=models.PositiveIntegerField(default=262144, validators=[django.core.validators.MinValueValidator(1024)]),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_max_delay',
+            field=models.PositiveIntegerField(default=5),
+        ),
+        migrations.AddField(
+            model_name='webhook',
+            name='batch_max_size',
+            field=models.PositiveIntegerField(default=100, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
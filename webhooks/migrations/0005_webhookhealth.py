@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-17 18:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0004_webhook_batching'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookHealth',
+            fields=[
+                ('webhook', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='health', serialize=False, to='webhooks.webhook')),
+                ('state', models.CharField(choices=[('closed', 'Closed'), ('open', 'Open'), ('half_open', 'Half-open')], default='closed', max_length=10)),
+                ('consecutive_failures', models.IntegerField(default=0)),
+                ('concurrency_limit', models.PositiveIntegerField(default=4)),
+                ('opened_at', models.DateTimeField(blank=True, null=True)),
+                ('retry_at', models.DateTimeField(blank=True, null=True)),
+                ('last_success_at', models.DateTimeField(blank=True, null=True)),
+                ('last_failure_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'webhook health',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.7 on 2026-10-17 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0005_webhookhealth'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookDeliveryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('delivered', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('gave_up', models.PositiveIntegerField(default=0)),
+                ('congested', models.PositiveIntegerField(default=0)),
+                ('latency_total_ms', models.BigIntegerField(default=0)),
+                ('latency_histogram', models.JSONField(default=list)),
+            ],
+            options={
+                'verbose_name_plural': 'webhook delivery stats',
+                'ordering': ['-hour'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='webhookoutbox',
+            index=models.Index(fields=['webhook', '-created_at'], name='webhooks_we_webhook_6e9f2f_idx'),
+        ),
+        migrations.AddField(
+            model_name='webhookdeliverystats',
+            name='webhook',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_stats', to='webhooks.webhook'),
+        ),
+        migrations.AddConstraint(
+            model_name='webhookdeliverystats',
+            constraint=models.UniqueConstraint(fields=('webhook', 'hour'), name='unique_webhook_stats_hour'),
+        ),
+    ]
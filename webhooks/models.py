@@ -1,8 +1,10 @@
 from django.db import models
 from django.conf import settings
+from django.core.validators import MinValueValidator
+from django.utils import timezone
 import json
 import secrets
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 
 class Webhook(models.Model):
@@ -14,6 +16,13 @@ class Webhook(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     last_triggered = models.DateTimeField(null=True, blank=True)
+    # Opt-in batching: due events are POSTed together as one JSON array once
+    # batch_max_size are waiting or the oldest has waited batch_max_delay
+    # seconds; a request never exceeds batch_max_bytes (unless one event does)
+    batch_enabled = models.BooleanField(default=False)
+    batch_max_size = models.PositiveIntegerField(default=100, validators=[MinValueValidator(1)])
+    batch_max_delay = models.PositiveIntegerField(default=5)
+    batch_max_bytes = models.PositiveIntegerField(default=256 * 1024, validators=[MinValueValidator(1024)])
     
     class Meta:
         ordering = ['-created_at']
@@ -30,6 +39,34 @@ class Webhook(models.Model):
         super().save(*args, **kwargs)
 
 
+class WebhookHealth(models.Model):
+    """Delivery health of one endpoint: circuit breaker state and adaptive concurrency."""
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    STATE_CHOICES = [
+        (CLOSED, 'Closed'),
+        (OPEN, 'Open'),
+        (HALF_OPEN, 'Half-open'),
+    ]
+
+    webhook = models.OneToOneField(Webhook, on_delete=models.CASCADE, primary_key=True, related_name='health')
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=CLOSED)
+    consecutive_failures = models.IntegerField(default=0)
+    # Requests (or batches) in flight per dispatch round; AIMD-adjusted
+    concurrency_limit = models.PositiveIntegerField(default=4)
+    opened_at = models.DateTimeField(null=True, blank=True)
+    retry_at = models.DateTimeField(null=True, blank=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    last_failure_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'webhook health'
+
+    def __str__(self):
+        return f"Webhook {self.webhook_id}: {self.state}"
+
+
 class WebhookOutbox(models.Model):
     """Outbox pattern for reliable webhook delivery."""
     STATUS_CHOICES = [
@@ -38,6 +75,7 @@ class WebhookOutbox(models.Model):
         ('failed', 'Failed'),
         ('retrying', 'Retrying'),
     ]
+    DUE_STATUSES = ('pending', 'retrying')
     
     webhook = models.ForeignKey(Webhook, on_delete=models.CASCADE, related_name='outbox_events')
     event_type = models.CharField(max_length=50)
@@ -45,7 +83,7 @@ class WebhookOutbox(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     retries = models.IntegerField(default=0)
     max_retries = models.IntegerField(default=3)
-    next_attempt_at = models.DateTimeField(default=datetime.now)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
     last_attempt_at = models.DateTimeField(null=True, blank=True)
     last_error = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -55,6 +93,8 @@ class WebhookOutbox(models.Model):
         indexes = [
             models.Index(fields=['status', 'next_attempt_at']),
             models.Index(fields=['webhook', 'status']),
+            # webhook_events: one endpoint's newest rows
+            models.Index(fields=['webhook', '-created_at']),
         ]
     
     def __str__(self):
@@ -63,12 +103,46 @@ class WebhookOutbox(models.Model):
     def should_retry(self):
         return self.status in ['pending', 'retrying'] and self.retries < self.max_retries
     
-    def mark_for_retry(self, error_message=None):
-        self.status = 'retrying'
+    def schedule_retry(self, error_message=None, now=None):
+        """Record a failed attempt without saving: back off, or give up after ``max_retries``."""
+        now = now or timezone.now()
         self.retries += 1
         self.last_error = error_message or ''
+        self.last_attempt_at = now
+        if self.retries >= self.max_retries:
+            self.status = 'failed'
+            return
+        self.status = 'retrying'
         # Exponential backoff: 2^retries minutes
         delay_minutes = 2 ** min(self.retries, 6)  # Cap at 64 minutes
-        self.next_attempt_at = datetime.now() + timedelta(minutes=delay_minutes)
-        self.last_attempt_at = datetime.now()
+        self.next_attempt_at = now + timedelta(minutes=delay_minutes)
+
+    def mark_for_retry(self, error_message=None):
+        self.schedule_retry(error_message)
         self.save(update_fields=['status', 'retries', 'last_error', 'next_attempt_at', 'last_attempt_at'])
+
+
+class WebhookDeliveryStats(models.Model):
+    """Hourly delivery rollup for one endpoint, accumulated by the dispatcher."""
+    webhook = models.ForeignKey(Webhook, on_delete=models.CASCADE, related_name='delivery_stats')
+    hour = models.DateTimeField()
+    requests = models.PositiveIntegerField(default=0)
+    delivered = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # Failed attempts that exhausted max_retries
+    gave_up = models.PositiveIntegerField(default=0)
+    # Requests that timed out or were answered 429/503
+    congested = models.PositiveIntegerField(default=0)
+    latency_total_ms = models.BigIntegerField(default=0)
+    # Request counts per webhooks.stats.LATENCY_BUCKETS_MS bucket (plus overflow)
+    latency_histogram = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ['-hour']
+        verbose_name_plural = 'webhook delivery stats'
+        constraints = [
+            models.UniqueConstraint(fields=['webhook', 'hour'], name='unique_webhook_stats_hour'),
+        ]
+
+    def __str__(self):
+        return f"Webhook {self.webhook_id} @ {self.hour:%Y-%m-%d %H:00}"
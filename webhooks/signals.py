@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from webhooks import events
+from .models import Webhook
+
+
+@receiver(post_save, sender=Webhook)
+@receiver(post_delete, sender=Webhook)
+def invalidate_subscription_index(sender, instance, **kwargs):
+    events.invalidate_on_commit([instance.org_id])
@@ -0,0 +1,114 @@
+"""
+Hourly delivery rollups (``WebhookDeliveryStats``).
+
+The dispatcher adds each round's outcomes to the endpoint's row for the
+current hour: requests, delivered and failed events, events that gave up,
+congested requests (timeouts, 429s, 503s) and a latency histogram over
+``LATENCY_BUCKETS_MS``. Concurrent dispatchers lock the hour's rows before
+adding to them, so no counts are lost. Percentiles are read from the
+histogram and are accurate to a bucket. Statistics never scan the outbox,
+so old rows can be purged (``webhooks.retention``) without losing history.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+
+from webhooks.models import WebhookDeliveryStats
+
+# Upper bounds of the latency buckets; one more bucket counts anything slower
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+COUNTERS = ["requests", "delivered", "failed", "gave_up", "congested", "latency_total_ms"]
+
+PERCENTILES = (50, 95, 99)
+
+
+def empty_histogram():
+    return [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+def bucket(latency_ms):
+    return bisect_left(LATENCY_BUCKETS_MS, latency_ms)
+
+
+def percentile(histogram, q):
+    """
+    Upper bound (ms) of the bucket holding the ``q``th percentile; requests
+    slower than the last bound report that bound. None without requests.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    rank, seen = total * q / 100, 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return LATENCY_BUCKETS_MS[min(index, len(LATENCY_BUCKETS_MS) - 1)]
+    return LATENCY_BUCKETS_MS[-1]
+
+
+def hour_of(now):
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+def record(results, now):
+    """
+    Add ``(unit, error, congested, latency_ms)`` results to this hour's
+    rollups: create missing rows, lock and read them, write them back.
+    Rows are always taken in webhook order so concurrent dispatchers cannot
+    deadlock. Call inside the transaction that records the outcomes.
+    """
+    hour = hour_of(now)
+    tallies = defaultdict(lambda: dict.fromkeys(COUNTERS, 0) | {"latency_histogram": empty_histogram()})
+    for unit, error, congested, latency_ms in results:
+        tally = tallies[unit[0].webhook_id]
+        tally["requests"] += 1
+        tally["latency_total_ms"] += round(latency_ms)
+        tally["latency_histogram"][bucket(latency_ms)] += 1
+        tally["congested"] += congested
+        if error is None:
+            tally["delivered"] += len(unit)
+            continue
+        tally["failed"] += len(unit)
+        tally["gave_up"] += sum(1 for row in unit if row.retries + 1 >= row.max_retries)
+    if not tallies:
+        return
+
+    WebhookDeliveryStats.objects.bulk_create(
+        [WebhookDeliveryStats(webhook_id=webhook_id, hour=hour, latency_histogram=empty_histogram()) for webhook_id in sorted(tallies)],
+        ignore_conflicts=True,
+    )
+    rows = list(
+        WebhookDeliveryStats.objects.select_for_update()
+        .filter(webhook_id__in=tallies, hour=hour)
+        .order_by("webhook_id")
+    )
+    for row in rows:
+        tally = tallies[row.webhook_id]
+        for field in COUNTERS:
+            setattr(row, field, getattr(row, field) + tally[field])
+        histogram = row.latency_histogram or empty_histogram()
+        row.latency_histogram = [a + b for a, b in zip(histogram, tally["latency_histogram"])]
+    WebhookDeliveryStats.objects.bulk_update(rows, COUNTERS + ["latency_histogram"])
+
+
+def summarize(row):
+    """JSON-friendly counters, success rate and latency percentiles of one (or a merged) rollup."""
+    attempted = row.delivered + row.failed
+    data = {field: getattr(row, field) for field in COUNTERS if field != "latency_total_ms"}
+    data["success_rate"] = round(row.delivered / attempted, 4) if attempted else None
+    data["latency_avg_ms"] = round(row.latency_total_ms / row.requests) if row.requests else None
+    for q in PERCENTILES:
+        data[f"latency_p{q}_ms"] = percentile(row.latency_histogram, q)
+    return data
+
+
+def report(webhook, since):
+    """Totals and hourly breakdown of ``webhook``'s deliveries since ``since`` (read from the rollups only)."""
+    total = WebhookDeliveryStats(webhook=webhook, latency_histogram=empty_histogram())
+    hourly = []
+    for row in WebhookDeliveryStats.objects.filter(webhook=webhook, hour__gte=hour_of(since)).order_by("hour"):
+        for field in COUNTERS:
+            setattr(total, field, getattr(total, field) + getattr(row, field))
+        total.latency_histogram = [a + b for a, b in zip(total.latency_histogram, row.latency_histogram)]
+        hourly.append({"hour": row.hour.isoformat(), **summarize(row)})
+    return {"totals": summarize(total), "hourly": hourly}
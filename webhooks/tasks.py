@@ -0,0 +1,18 @@
+from celery import shared_task
+from django.conf import settings
+
+from webhooks import dispatcher, retention
+
+
+@shared_task
+def deliver_webhooks():
+    """Drain due webhook outbox rows (scheduled by celery beat)."""
+    stats = dispatcher.dispatch(max_seconds=settings.WEBHOOK_DISPATCH_MAX_SECONDS)
+    return {"delivered": stats.delivered, "failed": stats.failed, "skipped": stats.skipped}
+
+
+@shared_task
+def purge_webhook_outbox():
+    """Delete terminal outbox rows past retention (scheduled by celery beat)."""
+    purged, rollups = retention.purge()
+    return {"purged": purged, "rollups": rollups}